@@ -0,0 +1,78 @@
+SUB_BITS = 4                # 16 sub-buckets per power of two, ~6% resolution
+SUB_BUCKETS = 1 << SUB_BITS
+MAX_BITS = 48               # values up to 2^48 (~3 days in ns)
+N_BUCKETS = SUB_BUCKETS * (MAX_BITS - SUB_BITS + 1)
+
+class Histogram:
+    """
+    Fixed-size log-linear histogram of non-negative integers (usually ns).
+    Recording is O(1) and allocation free, so it can stay on in production.
+    """
+    def __init__(self):
+        self.counts = [0] * N_BUCKETS
+        self.count = 0
+        self.sum = 0
+        self.min = 0
+        self.max = 0
+
+    def record(self, value):
+        value = int(value)
+        if value < 0:
+            value = 0
+        if value < SUB_BUCKETS:
+            idx = value
+        else:
+            shift = value.bit_length() - 1 - SUB_BITS
+            idx = SUB_BUCKETS * (shift + 1) + ((value >> shift) & (SUB_BUCKETS - 1))
+            if idx >= N_BUCKETS:
+                idx = N_BUCKETS - 1
+        self.counts[idx] += 1
+
+        if self.count == 0 or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.count += 1
+        self.sum += value
+
+    def reset(self):
+        self.__init__()
+
+    def percentile(self, p):
+        """
+        Returns an upper bound for the p-th percentile (0-100) of the recorded values
+        """
+        if self.count == 0:
+            return 0
+        rank = max(1, int(self.count * p / 100.0 + 0.5))
+        seen = 0
+        for idx, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(max(bucket_upper(idx), self.min), self.max)
+        return self.max
+
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def summary(self, scale=1e3):
+        """
+        Returns count, min, p50, p99 and max, divided by scale (ns -> us by default)
+        """
+        return {
+            'count': self.count,
+            'min': self.min / scale,
+            'p50': self.percentile(50) / scale,
+            'p99': self.percentile(99) / scale,
+            'max': self.max / scale,
+        }
+
+def bucket_upper(idx):
+    """
+    Returns the largest value that falls into bucket idx
+    """
+    if idx < SUB_BUCKETS:
+        return idx
+    shift = idx // SUB_BUCKETS - 1
+    mantissa = SUB_BUCKETS + idx % SUB_BUCKETS
+    return ((mantissa + 1) << shift) - 1
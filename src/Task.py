@@ -1,6 +1,49 @@
+from enum import Enum
+from Histogram import Histogram
+
+class Overlap(Enum):
+    SKIP = 0        # drop the release if the previous run is still going
+    COALESCE = 1    # run once more when the previous run finishes
+
 class Task:
-    def __init__(self, func, delay, period):
+    def __init__(self, func, delay, period, blocking=False, overlap=Overlap.SKIP):
         self.func = func
         self.delay = delay
         self.period = period
         self.counter = 0
+
+        # Scheduler bookkeeping
+        self.priority = 0       # lower runs first, set when added
+        self.next_release = 0   # tick of the next release
+        self.ready = False      # waiting in the ready queue
+        self.cancelled = False
+
+        # Blocking tasks run on the worker pool instead of the tick thread
+        self.blocking = blocking
+        self.overlap = overlap
+        self.running = False    # a run is in progress on the worker pool
+        self.pending = False    # a coalesced release waits for the current run
+        self.skipped = 0        # releases dropped because of Overlap.SKIP
+        self.coalesced = 0      # releases merged into a pending run
+
+        # Timing instrumentation, times in ns
+        self.release_ns = 0     # time of the latest release
+        self.runs = 0
+        self.misses = 0         # runs that finished after the next release
+        self.dropped = 0        # activations dropped because the task didn't run in time
+        self.latency = Histogram()  # release -> start
+        self.exec = Histogram()     # start -> end
+
+    def name(self):
+        return self.func.__name__ if self.func is not None else None
+
+    def stats(self):
+        return {
+            'runs': self.runs,
+            'misses': self.misses,
+            'dropped': self.dropped,
+            'skipped': self.skipped,
+            'coalesced': self.coalesced,
+            'latency_us': self.latency.summary(),
+            'exec_us': self.exec.summary(),
+        }
@@ -1,40 +1,24 @@
-import RPi.GPIO as GPIO
-from enum import Enum
+from alphabot.Velocity import MovDirection, PowerCurve, powerMap, sides, weightThreshold
+from hardware import GPIO
+from Histogram import Histogram
 import logging
+import telemetry
+import tracing
+import threading
+import time
 
 # initialize the logger
 logger = logging.getLogger(__name__)
 handler = logging.StreamHandler() # or RotatingFileHandler
 handler.setFormatter(logging.Formatter('[%(asctime)s][%(name)s][%(levelname)s] %(message)s'))
 logger.addHandler(handler)
-logger.setLevel(logging.DEBUG) # or DEBUG
-
-
-class MovDirection(Enum):
-    POSITIVE = 0
-    NEGATIVE = 1
-    IDLE = 2
-
-# Weights that define the motor velocity
-weightThreshold = {
-    "NONE": 5,
-    "LOW": 10,
-    "MEDIUM": 15,
-    "HIGH": 20,
-    "VERY_HIGH": 30
-}
-# Power that defines the motor velocity
-powerMap = {
-    "NONE": 0,
-    "LOW": 10,
-    "MEDIUM": 20,
-    "HIGH": 30,
-    "VERY_HIGH": 40
-}
+logger.setLevel(logging.INFO) # or DEBUG
+
+
 powerIncrement = powerMap["MEDIUM"] - powerMap["LOW"]
 
 class Alphabot:
-    def __init__(self, ain1=12, ain2=13, bin1=20, bin2=21, ena=6, enb=26, vertPower=50, horizPower=30, irLeft = 16, irRight = 19):
+    def __init__(self, ain1=12, ain2=13, bin1=20, bin2=21, ena=6, enb=26, vertPower=50, horizPower=30, irLeft = 16, irRight = 19, smooth=False, cache=True, irInterrupts=True):
         self.ain1 = ain1 # motor A right forwards
         self.ain2 = ain2 # motor A backwards
         self.bin1 = bin1 # motor B forwards
@@ -46,12 +30,17 @@ class Alphabot:
         self.vertPower = vertPower # duty cycle of the PWM signal of the motors (0-100 percentage)
         self.horizPower = horizPower # duty cycle of the PWM signal of the motors  (0-100 percentage)
 
+        # Mass difference to power mapping, the threshold steps or a smooth curve
+        self.curve = PowerCurve(smooth=smooth)
+
         # Variables to control the direction of the motors
         self.vertDirection = MovDirection.IDLE # vertical velocity of the robot
         self.horizDirection = MovDirection.IDLE # horizontal velocity of the robot
 
-        # Variable to check if the alpha is close to colliding
+        # Variable to check if the alpha is close to colliding, from the IR sensors or the camera
         self.isColliding = False
+        self.irColliding = False
+        self.visionColliding = False
 
         # Variable to control if the buzzer should be on or off
         self.honk = False
@@ -62,6 +51,22 @@ class Alphabot:
         self.irLeft = irLeft
         self.irRight = irRight
 
+        # Last level written to each output pin and duty cycle to each enable pin,
+        # so only changes reach the hardware (cache=False writes everything, like before)
+        self.cache = cache
+        self.levels = {}
+        self.duties = {}
+        self.gpioCalls = 0  # GPIO.output and ChangeDutyCycle calls
+        # The IR callbacks run on the GPIO event thread, and write the motors too
+        self.lock = threading.RLock()
+
+        # Collision stops made by the IR callbacks, and their callback to stopped time (ns)
+        self.collisionStops = 0
+        self.stopLatency = Histogram()
+
+        # Trace of the sample mass_to_velocity took, until drive() acts on it (see tracing.py)
+        self.trace = None
+
         GPIO.setmode(GPIO.BCM)
         GPIO.setwarnings(False)
         GPIO.setup(self.buzzer, GPIO.OUT)
@@ -77,122 +82,132 @@ class Alphabot:
         self.pwmb = GPIO.PWM(self.enb, 500)
         self.pwma.start(self.vertPower)
         self.pwmb.start(self.vertPower)
+        self.duties = {self.ena: self.vertPower, self.enb: self.vertPower}
 
         self.stop()
+        if irInterrupts:
+            self.enableCollisionDetection()
+
+    """
+    Single write path to the hardware: sets the duty cycle of both motors and the
+    levels of the given {pin: level}, skipping what already has that value.
+    The changed pins are written with one GPIO.output call
+    """
+    def apply(self, levels, dutyA=None, dutyB=None):
+        with self.lock:
+            self._apply(levels, dutyA, dutyB)
+
+    def _apply(self, levels, dutyA, dutyB):
+        for pin, pwm, duty in ((self.ena, self.pwma, dutyA), (self.enb, self.pwmb, dutyB)):
+            if duty is not None and (not self.cache or self.duties.get(pin) != duty):
+                pwm.ChangeDutyCycle(duty)
+                self.duties[pin] = duty
+                self.gpioCalls += 1
+
+        if not self.cache:
+            for pin, level in levels.items():
+                GPIO.output(pin, level)
+                self.gpioCalls += 1
+            self.levels.update(levels)
+            return
+        changed = [pin for pin, level in levels.items() if self.levels.get(pin) != level]
+        if changed:
+            GPIO.output(changed, [levels[pin] for pin in changed])
+            self.gpioCalls += 1
+            for pin in changed:
+                self.levels[pin] = levels[pin]
+
+    """
+    Forget the cached pin states, so the next writes reach the hardware
+    """
+    def invalidate(self):
+        self.levels.clear()
+        self.duties.clear()
+
+    """
+    Sets the direction pins of both motors (A forwards, A backwards, B forwards, B backwards)
+    """
+    def set_motors(self, ain1, ain2, bin1, bin2, dutyA=None, dutyB=None):
+        self.apply({self.ain1: ain1, self.ain2: ain2, self.bin1: bin1, self.bin2: bin2}, dutyA, dutyB)
 
     """
     Drives forward, using both wheels
     """
     def drive_forward(self):
-        self.pwma.ChangeDutyCycle(self.vertPower)
-        self.pwmb.ChangeDutyCycle(self.vertPower)
-        GPIO.output(self.ain1, GPIO.LOW)
-        GPIO.output(self.ain2, GPIO.HIGH)
-        GPIO.output(self.bin1, GPIO.LOW)
-        GPIO.output(self.bin2, GPIO.HIGH)
+        self.set_motors(GPIO.LOW, GPIO.HIGH, GPIO.LOW, GPIO.HIGH, self.vertPower, self.vertPower)
 
     """
     Drives backwards, using both wheels
     """
     def drive_backwards(self):
-        self.pwma.ChangeDutyCycle(self.vertPower)
-        self.pwmb.ChangeDutyCycle(self.vertPower)
-        GPIO.output(self.ain1, GPIO.HIGH)
-        GPIO.output(self.ain2, GPIO.LOW)
-        GPIO.output(self.bin1, GPIO.HIGH)
-        GPIO.output(self.bin2, GPIO.LOW)
+        self.set_motors(GPIO.HIGH, GPIO.LOW, GPIO.HIGH, GPIO.LOW, self.vertPower, self.vertPower)
 
     """
     Drives while turning to the left
     """
     def drive_left(self):
-        self.pwma.ChangeDutyCycle(self.horizPower)
-        self.pwmb.ChangeDutyCycle(self.horizPower)
-        GPIO.output(self.ain1, GPIO.HIGH)
-        GPIO.output(self.ain2, GPIO.LOW)
-        GPIO.output(self.bin1, GPIO.LOW)
-        GPIO.output(self.bin2, GPIO.HIGH)
+        self.set_motors(GPIO.HIGH, GPIO.LOW, GPIO.LOW, GPIO.HIGH, self.horizPower, self.horizPower)
 
     """
     Drives while turning to the right
     """
     def drive_right(self):
-        self.pwma.ChangeDutyCycle(self.horizPower)
-        self.pwmb.ChangeDutyCycle(self.horizPower)
-        GPIO.output(self.ain1, GPIO.LOW)
-        GPIO.output(self.ain2, GPIO.HIGH)
-        GPIO.output(self.bin1, GPIO.HIGH)
-        GPIO.output(self.bin2, GPIO.LOW)
+        self.set_motors(GPIO.LOW, GPIO.HIGH, GPIO.HIGH, GPIO.LOW, self.horizPower, self.horizPower)
 
     """
     Stops both wheels and the pwm signal
     """
     def stop(self):
-        self.pwma.ChangeDutyCycle(0)
-        self.pwmb.ChangeDutyCycle(0)
-        GPIO.output(self.ain1, GPIO.LOW)
-        GPIO.output(self.ain2, GPIO.LOW)
-        GPIO.output(self.bin1, GPIO.LOW)
-        GPIO.output(self.bin2, GPIO.LOW)
+        self.set_motors(GPIO.LOW, GPIO.LOW, GPIO.LOW, GPIO.LOW, 0, 0)
 
     """
     Convert the mass data from the WiiBoard to a velocity
     Update the direction and power of the motors of the Alphabot accordingly
     Parameters
     ----------
-    mass: {'top_right': float, 'top_left': float, 'bottom_right': float, 'bottom_left': float}
+    mass: MassSample (top_right, top_left, bottom_right and bottom_left, in kg)
     """
     def mass_to_velocity(self, mass):
-        up = (mass["top_right"] + mass["top_left"]) / 2
-        down = (mass["bottom_right"] + mass["bottom_left"]) / 2
-        left = (mass["top_left"] + mass["bottom_left"]) / 2
-        right = (mass["top_right"] + mass["bottom_right"]) / 2
-
-        # Calculate the difference between the masses and directions
-        vertDiff = abs(up - down)
-        vertDirection = MovDirection.POSITIVE if up >= down else MovDirection.NEGATIVE if down > up else MovDirection.IDLE
-        horizDiff = abs(left - right)
-        horizDirection = MovDirection.POSITIVE if right >= left else MovDirection.NEGATIVE if left > right else MovDirection.IDLE
-
-        logger.debug(f"vertDiff {vertDiff} horizDiff {horizDiff}")
-        # Decide the vertical movement
-        if vertDiff <= weightThreshold["NONE"]: # No movement
-            self.vertDirection = MovDirection.IDLE
-            self.vertPower = 0
-        elif vertDiff <= weightThreshold["LOW"]: # Low movement
-            self.vertDirection = vertDirection
-            self.vertPower = powerMap["LOW"]
-        elif vertDiff <= weightThreshold["MEDIUM"]: # Medium movement
-            self.vertDirection = vertDirection
-            self.vertPower = powerMap["MEDIUM"]
-        elif vertDiff <= weightThreshold["HIGH"]: # High movement
-            self.vertDirection = vertDirection
-            self.vertPower = powerMap["HIGH"]
-        elif vertDiff <= weightThreshold["VERY_HIGH"]: # Very High movement
-            self.vertDirection = vertDirection
-            self.vertPower = powerMap["VERY_HIGH"]
-
-        # Decide the horizontal movement
-        if horizDiff <= weightThreshold["NONE"]: # No movement
-            self.horizDirection = MovDirection.IDLE
-            self.horizPower = 0
-        elif horizDiff <= weightThreshold["LOW"]: # Low movement
-            self.horizDirection = horizDirection
-            self.horizPower = powerMap["LOW"]
-        elif horizDiff <= weightThreshold["MEDIUM"]: # Medium movement
-            self.horizDirection = horizDirection
-            self.horizPower = powerMap["MEDIUM"]
-        elif horizDiff <= weightThreshold["HIGH"]: # High movement
-            self.horizDirection = horizDirection
-            self.horizPower = powerMap["HIGH"]
-        elif horizDiff <= weightThreshold["VERY_HIGH"]: # Very High movement
-            self.horizDirection = horizDirection
-            self.horizPower = powerMap["VERY_HIGH"]
+        up, down, left, right = sides(mass.top_right, mass.bottom_right, mass.top_left, mass.bottom_left)
+
+        # Differences above weightThreshold["VERY_HIGH"] keep the VERY_HIGH power
+        self.vertDirection, self.vertPower = self.curve.velocity(up, down)
+        self.horizDirection, self.horizPower = self.curve.velocity(right, left)
+
+        rec = telemetry.recorder
+        if rec is not None:
+            rec.emit('velocity', mass.seq, abs(up - down), abs(left - right), self.vertDirection,
+                     self.vertPower, self.horizDirection, self.horizPower)
+
+        tracer = tracing.tracer
+        if tracer is not None:
+            with self.lock:
+                if self.trace is not None:
+                    tracer.finish(self.trace)   # never driven
+                self.trace = tracer.begin(mass)
 
     """
     Decides the direction of the robot and drives accordingly
     """
     def drive(self):
+        # Holding the lock, an IR callback can't stop the motors between the
+        # collision check and the writes
+        with self.lock:
+            trace = self.trace
+            if trace is None:
+                self._drive()
+                return
+            self.trace = None
+            calls = self.gpioCalls
+            trace.drive = time.monotonic_ns()
+            self._drive()
+            if self.gpioCalls != calls:
+                trace.motor = time.monotonic_ns()
+        tracer = tracing.tracer
+        if tracer is not None:
+            tracer.finish(trace)
+
+    def _drive(self):
         # print("Entered drive...")
         rightMotorPower = 0
         leftMotorPower = 0            
@@ -234,34 +249,22 @@ class Alphabot:
         attenuator = 2 if isRotating else 1 # Attenuate the power of the motors if we are rotating
         
         # Set the power of the motors
-        self.pwma.ChangeDutyCycle(leftMotorPower / attenuator)
-        self.pwmb.ChangeDutyCycle(rightMotorPower / attenuator)
+        dutyA = leftMotorPower / attenuator
+        dutyB = rightMotorPower / attenuator
 
         # Set the direction of the motors
         # The vertical direction determines if we turn on the motor1 or motors2
         if self.vertDirection == MovDirection.POSITIVE:
-            GPIO.output(self.ain1, GPIO.LOW)
-            GPIO.output(self.ain2, GPIO.HIGH)
-            GPIO.output(self.bin1, GPIO.LOW)
-            GPIO.output(self.bin2, GPIO.HIGH)
+            self.set_motors(GPIO.LOW, GPIO.HIGH, GPIO.LOW, GPIO.HIGH, dutyA, dutyB)
         elif self.vertDirection == MovDirection.NEGATIVE:
-            GPIO.output(self.ain1, GPIO.HIGH)
-            GPIO.output(self.ain2, GPIO.LOW)
-            GPIO.output(self.bin1, GPIO.HIGH)
-            GPIO.output(self.bin2, GPIO.LOW)
+            self.set_motors(GPIO.HIGH, GPIO.LOW, GPIO.HIGH, GPIO.LOW, dutyA, dutyB)
         else: # Horizontal Movement (special case)
             if self.horizDirection == MovDirection.POSITIVE:
                 # Turn left
-                GPIO.output(self.ain1, GPIO.LOW)
-                GPIO.output(self.ain2, GPIO.HIGH)
-                GPIO.output(self.bin1, GPIO.HIGH)
-                GPIO.output(self.bin2, GPIO.LOW)
+                self.set_motors(GPIO.LOW, GPIO.HIGH, GPIO.HIGH, GPIO.LOW, dutyA, dutyB)
             elif self.horizDirection == MovDirection.NEGATIVE:
                 # Turn right
-                GPIO.output(self.ain1, GPIO.HIGH)
-                GPIO.output(self.ain2, GPIO.LOW)
-                GPIO.output(self.bin1, GPIO.LOW)
-                GPIO.output(self.bin2, GPIO.HIGH)
+                self.set_motors(GPIO.HIGH, GPIO.LOW, GPIO.LOW, GPIO.HIGH, dutyA, dutyB)
                 
     def setHonk(self, value):
         """
@@ -277,7 +280,7 @@ class Alphabot:
         if self.honk == True:
             val = GPIO.HIGH
         
-        GPIO.output(self.buzzer, val)
+        self.apply({self.buzzer: val})
 
 
     """
@@ -286,7 +289,55 @@ class Alphabot:
     def checkCollision(self):
         # print("left sensor", GPIO.input(self.irLeft))
         # print("right sensor", GPIO.input(self.irRight))
-        self.isColliding = not GPIO.input(self.irLeft) or not GPIO.input(self.irRight)
+        self.irColliding = not GPIO.input(self.irLeft) or not GPIO.input(self.irRight)
+        self.isColliding = self.irColliding or self.visionColliding
+
+    """
+    Watches both IR sensors with edge interrupts, so onIrEdge updates isColliding
+    (and stops the robot) as soon as a sensor changes
+    """
+    def enableCollisionDetection(self):
+        for pin in (self.irLeft, self.irRight):
+            GPIO.add_event_detect(pin, GPIO.BOTH, callback=self.onIrEdge)
+        self.checkCollision()
+
+    def disableCollisionDetection(self):
+        for pin in (self.irLeft, self.irRight):
+            GPIO.remove_event_detect(pin)
+
+    """
+    IR edge callback, runs on the GPIO event thread. Stops the motors right away
+    if the robot is driving forward into an obstacle
+    """
+    def onIrEdge(self, pin):
+        start = time.monotonic_ns()
+        with self.lock:
+            self.checkCollision()
+            stopped = self.isColliding and self.vertDirection == MovDirection.POSITIVE
+            if stopped:
+                self.stop()
+                self.collisionStops += 1
+                self.stopLatency.record(time.monotonic_ns() - start)
+        # Logged without the lock, drive() doesn't wait for the handler
+        if stopped:
+            logger.info("Obstacle, stopped (IR pin %d)", pin)
+
+    """
+    Camera obstacle detection result, called from the ObstacleDetector thread.
+    Stops the motors like onIrEdge when an obstacle shows up ahead
+    """
+    def setVisionObstacle(self, present):
+        start = time.monotonic_ns()
+        with self.lock:
+            self.visionColliding = present
+            self.isColliding = self.irColliding or present
+            stopped = present and self.vertDirection == MovDirection.POSITIVE
+            if stopped:
+                self.stop()
+                self.collisionStops += 1
+                self.stopLatency.record(time.monotonic_ns() - start)
+        if stopped:
+            logger.info("Obstacle, stopped (camera)")
 
         
 
@@ -1,40 +1,52 @@
-import RPi.GPIO as GPIO
-from adafruit_servokit import ServoKit
-from picamera import PiCamera
+from alphabot.Servos import ServoMotion
+from hardware import PiCamera, ServoKit
+
+# Capture size, picamera rounds rgb captures up to multiples of 32x16
+RESOLUTION = (320, 240)
+FRAMERATE = 30
 
 class Camera:
-    def __init__(self):
+    def __init__(self, resolution=RESOLUTION, framerate=FRAMERATE):
         self.cam = PiCamera()
+        self.cam.resolution = resolution
+        self.cam.framerate = framerate
         self.kit = ServoKit(channels=16) # number of channels (hardware)
+        # Rate-limited moves of the tilt (0) and pan (1) servos, started by the first aim
+        self.motion = ServoMotion(self.kit, channels=(0, 1), start=(0, 30))
     
     """
-    Changes the tilt angle (left to right), between 0 and 150
+    Changes the tilt angle (left to right), between 0 and 150. Moves like aim,
+    without waiting, and changes under the deadband are dropped
     """
     def tilt(self, angle):
-        if angle > 150:
-            self.kit.servo[0].angle = 150
-        elif angle < 0:
-            self.kit.servo[0].angle = 0
-        else:
-            self.kit.servo[0].angle = angle
+        self.aim(tilt=angle)
 
     """
-    Changes the pan angle (top to bottom), between 0 and 150
+    Changes the pan angle (top to bottom), between 0 and 150. Moves like aim,
+    without waiting, and changes under the deadband are dropped
     """
     def pan(self, angle):
-        if angle > 150:
-            self.kit.servo[1].angle = 150
-        elif angle < 0:
-            self.kit.servo[1].angle = 0
-        else:
-            self.kit.servo[1].angle = angle
+        self.aim(pan=angle)
 
     """
-    Resets the camera to the default position
+    Resets the camera to the default position, right away: where the servos are
+    is unknown, so there is nothing to move from
     """
     def reset(self):
-        self.tilt(0)
-        self.pan(30)
+        self.motion.jump(0, 0)
+        self.motion.jump(1, 30)
+
+    """
+    Moves the camera towards the tilt and pan angles (None keeps the current
+    target) within the servo speed and acceleration limits, without waiting.
+    Can be called at any rate, see ServoMotion
+    """
+    def aim(self, tilt=None, pan=None):
+        self.motion.start()
+        if tilt is not None:
+            self.motion.set_target(0, tilt)
+        if pan is not None:
+            self.motion.set_target(1, pan)
 
     """
     Starts the camera preview
@@ -42,10 +54,24 @@ class Camera:
     def preview(self):
         self.cam.start_preview()
     
+    """
+    Captures the next video frame into buffer, a (height, width, 3) uint8 array
+    """
+    def capture(self, buffer):
+        self.cam.capture(buffer, 'rgb', use_video_port=True)
+
+    """
+    Returns the (height, width, 3) shape of the frames
+    """
+    def frame_shape(self):
+        width, height = self.cam.resolution
+        return (height, width, 3)
+
     """
     Stops the camera preview and servo
     """
     def stop(self):
+        self.motion.stop()
         self.cam.stop_preview()
         self.kit.servo[0].angle = None
         self.kit.servo[1].angle = None
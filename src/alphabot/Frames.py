@@ -0,0 +1,176 @@
+""" Camera frame pipeline
+
+A capture thread fills a small pool of preallocated frame buffers, and consumers
+get read-only views of the latest complete frame. The newest frame always wins:
+a frame nobody took before the next one is complete is dropped, so a slow
+consumer never holds up the capture.
+"""
+import logging
+import threading
+import time
+
+from Histogram import Histogram
+try:
+    import numpy as np
+except ImportError:     # the pipeline needs it
+    np = None
+
+# initialize the logger
+logger = logging.getLogger(__name__)
+handler = logging.StreamHandler() # or RotatingFileHandler
+handler.setFormatter(logging.Formatter('[%(asctime)s][%(name)s][%(levelname)s] %(message)s'))
+logger.addHandler(handler)
+logger.setLevel(logging.INFO) # or DEBUG
+
+POOL_SIZE = 3   # the frame being captured, the latest one and one held by a consumer
+
+class Frame:
+    """
+    A captured frame: a read-only view of a pool buffer, valid until release()
+    (or the end of a with block)
+    """
+    __slots__ = ('array', 'seq', 'timestamp', 'slot', 'pipeline')
+
+    def __init__(self, array, seq, timestamp, slot, pipeline):
+        self.array = array
+        self.seq = seq              # number of the frame since the capture started
+        self.timestamp = timestamp  # monotonic ns the capture completed
+        self.slot = slot
+        self.pipeline = pipeline
+
+    def age_ms(self):
+        return (time.monotonic_ns() - self.timestamp) / 1e6
+
+    def release(self):
+        if self.pipeline is not None:
+            self.pipeline.release(self.slot)
+            self.pipeline = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+class FramePipeline:
+    """
+    Captures frames from a source (anything with capture(buffer) and frame_shape(),
+    like Camera) into a pool of buffers from a thread of its own
+    """
+    def __init__(self, source, pool_size=POOL_SIZE):
+        if np is None:
+            raise RuntimeError("The frame pipeline needs numpy")
+        self.source = source
+        shape = source.frame_shape()
+        self.buffers = [np.empty(shape, dtype=np.uint8) for _ in range(pool_size)]
+        self.views = []
+        for buffer in self.buffers:
+            view = buffer.view()
+            view.flags.writeable = False
+            self.views.append(view)
+        self.holds = [0] * pool_size    # consumers holding each buffer
+        self.latest = None              # slot of the latest complete frame
+        self.latest_seq = -1
+        self.latest_time = 0
+        self.taken = False              # the latest frame was given to a consumer
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+
+        self.start_ns = 0
+        self.captured = 0
+        self.dropped = 0        # frames replaced before any consumer took them
+        self.delivered = 0
+        self.errors = 0
+        self.age = Histogram()  # capture complete -> handed to a consumer, ns
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.start_ns = time.monotonic_ns()
+        self.thread = threading.Thread(target=self._capture_loop, name="camera", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        with self.condition:
+            self.condition.notify_all()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def _free_slot(self):
+        """
+        A buffer nobody reads: not the latest frame and not held. Falls back to the
+        latest one when consumers hold all the others
+        """
+        for slot, holds in enumerate(self.holds):
+            if holds == 0 and slot != self.latest:
+                return slot
+        if self.latest is not None and self.holds[self.latest] == 0:
+            return self.latest
+        return None
+
+    def _capture_loop(self):
+        while self.running:
+            with self.condition:
+                slot = self._free_slot()
+                if slot is None:
+                    # Every buffer is held, wait for a release
+                    self.condition.wait(0.1)
+                    continue
+                if slot == self.latest:
+                    self.latest = None
+                    if not self.taken:
+                        self.dropped += 1
+            try:
+                self.source.capture(self.buffers[slot])
+            except Exception as e:
+                self.errors += 1
+                logger.warning("Capture failed: %s", e)
+                time.sleep(0.1)
+                continue
+            now = time.monotonic_ns()
+            with self.condition:
+                if self.latest is not None and not self.taken:
+                    self.dropped += 1
+                self.latest = slot
+                self.latest_seq = self.captured
+                self.latest_time = now
+                self.taken = False
+                self.captured += 1
+                self.condition.notify_all()
+
+    def get(self, timeout=None, after=-1):
+        """
+        Returns the latest frame newer than seq after (any by default) without
+        copying it, waiting up to timeout for one. None if there is none.
+        The frame must be released
+        """
+        with self.condition:
+            ready = lambda: self.latest is not None and self.latest_seq > after
+            if not self.condition.wait_for(ready, timeout):
+                return None
+            slot = self.latest
+            self.holds[slot] += 1
+            self.taken = True
+            self.delivered += 1
+            self.age.record(time.monotonic_ns() - self.latest_time)
+            return Frame(self.views[slot], self.latest_seq, self.latest_time, slot, self)
+
+    def release(self, slot):
+        with self.condition:
+            self.holds[slot] -= 1
+            self.condition.notify_all()
+
+    def stats(self):
+        elapsed = (time.monotonic_ns() - self.start_ns) / 1e9 if self.start_ns else 0.0
+        return {
+            'captured': self.captured,
+            'fps': self.captured / elapsed if elapsed else 0.0,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'age_ms': self.age.summary(1e6),
+        }
@@ -0,0 +1,199 @@
+""" Camera obstacle detection
+
+Looks at the floor in front of the robot on downscaled grayscale frames: pixels
+that differ from the learned floor brightness are occupied, and an obstacle is
+reported when enough of the floor region is occupied for a few frames in a row.
+Everything is plain numpy on a small array, so a frame costs well under a
+millisecond. ObstacleDetector runs it on the frames of a FramePipeline from a
+thread of its own, and tells Alphabot through setVisionObstacle.
+
+usage: python -m alphabot.Obstacles <frames.npy>
+    frames.npy holds an (N, height, width, 3) uint8 array of recorded frames
+"""
+import logging
+import sys
+import threading
+import time
+
+from Histogram import Histogram
+try:
+    import numpy as np
+except ImportError:     # the detector needs it
+    np = None
+
+# initialize the logger
+logger = logging.getLogger(__name__)
+handler = logging.StreamHandler() # or RotatingFileHandler
+handler.setFormatter(logging.Formatter('[%(asctime)s][%(name)s][%(levelname)s] %(message)s'))
+logger.addHandler(handler)
+logger.setLevel(logging.INFO) # or DEBUG
+
+SCALE       = 4     # keep one pixel out of SCALE in each direction
+FLOOR_TOP   = 0.6   # the floor region starts at this fraction of the height
+FLOOR_WIDTH = 0.5   # and spans this fraction of the width, centered (the robot's path)
+THRESHOLD   = 30    # gray levels away from the floor that make a pixel occupied
+OCCUPANCY   = 0.25  # fraction of occupied floor pixels that is an obstacle
+CONFIRM     = 2     # frames in a row needed to report or clear an obstacle
+FLOOR_ALPHA = 0.1   # how fast the floor brightness follows a clear floor
+CPU_BUDGET  = 0.2   # fraction of a core the detector thread may use
+
+# Integer luma weights (ITU-R 601), they add up to 256
+LUMA = (77, 150, 29)
+
+class FloorDetector:
+    """
+    The detection itself, one frame at a time: detect(frame) returns whether
+    there is an obstacle, after the confirmation frames
+    """
+    def __init__(self, scale=SCALE, floor_top=FLOOR_TOP, floor_width=FLOOR_WIDTH, threshold=THRESHOLD,
+                 occupancy=OCCUPANCY, confirm=CONFIRM, alpha=FLOOR_ALPHA):
+        if np is None:
+            raise RuntimeError("The obstacle detector needs numpy")
+        self.scale = scale
+        self.floor_top = floor_top
+        self.floor_width = floor_width
+        self.threshold = threshold
+        self.occupancy = occupancy
+        self.confirm = confirm
+        self.alpha = alpha
+        self.weights = np.array(LUMA, dtype=np.uint16)
+        self.reset()
+
+    def reset(self):
+        self.floor = None       # learned floor brightness
+        self.detected = False
+        self.streak = 0         # frames in a row that disagree with detected
+        self.occupied = 0.0     # occupancy of the latest frame
+
+    def gray(self, frame):
+        """
+        Downscaled grayscale of an (height, width, 3) frame, as uint8
+        """
+        small = frame[::self.scale, ::self.scale]
+        return (small @ self.weights >> 8).astype(np.uint8)
+
+    def region(self, gray):
+        """
+        The floor region of a grayscale frame
+        """
+        height, width = gray.shape
+        margin = int(width * (1 - self.floor_width) / 2)
+        return gray[int(height * self.floor_top):, margin:width - margin]
+
+    def detect(self, frame):
+        floor = self.region(self.gray(frame))
+        if self.floor is None:
+            self.floor = float(np.median(floor))
+        occupied = np.abs(floor.astype(np.int16) - int(self.floor)) > self.threshold
+        self.occupied = np.count_nonzero(occupied) / occupied.size
+        obstacle = self.occupied >= self.occupancy
+        if obstacle != self.detected:
+            self.streak += 1
+            if self.streak >= self.confirm:
+                self.detected = obstacle
+                self.streak = 0
+        else:
+            self.streak = 0
+        if not obstacle:
+            # Follow the lighting and the floor as the robot moves
+            self.floor += self.alpha * (float(np.median(floor)) - self.floor)
+        return self.detected
+
+class ObstacleDetector:
+    """
+    Runs a FloorDetector on the latest frames of a FramePipeline, keeping its
+    thread under budget of a core, and calls alphabot.setVisionObstacle when
+    the detection changes
+    """
+    def __init__(self, frames, alphabot=None, budget=CPU_BUDGET, detector=None):
+        self.frames = frames
+        self.alphabot = alphabot
+        self.budget = budget
+        self.detector = detector or FloorDetector()
+        self.thread = None
+        self.running = False
+
+        self.processed = 0
+        self.changes = 0
+        self.busy_s = 0.0
+        self.start_s = 0.0
+        self.process = Histogram()  # ns per frame
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.start_s = time.perf_counter()
+        self.thread = threading.Thread(target=self._run, name="obstacles", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def _run(self):
+        seq = -1
+        while self.running:
+            frame = self.frames.get(timeout=0.5, after=seq)
+            if frame is None:
+                continue
+            with frame:
+                seq = frame.seq
+                start = time.perf_counter()
+                self.update(frame.array)
+                elapsed = time.perf_counter() - start
+            # Idle long enough that the processing stays within the budget
+            time.sleep(elapsed * (1 - self.budget) / self.budget)
+
+    def update(self, frame):
+        """
+        Processes one frame. Returns whether there is an obstacle
+        """
+        start = time.perf_counter_ns()
+        before = self.detector.detected
+        detected = self.detector.detect(frame)
+        elapsed = time.perf_counter_ns() - start
+        self.process.record(elapsed)
+        self.busy_s += elapsed / 1e9
+        self.processed += 1
+        if detected != before:
+            self.changes += 1
+            logger.info("Camera obstacle %s (%.0f%% of the floor)",
+                        "ahead" if detected else "cleared", self.detector.occupied * 100)
+            if self.alphabot is not None:
+                self.alphabot.setVisionObstacle(detected)
+        return detected
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.start_s if self.start_s else 0.0
+        return {
+            'processed': self.processed,
+            'changes': self.changes,
+            'detected': self.detector.detected,
+            'cpu': self.busy_s / elapsed if elapsed else 0.0,
+            'process_us': self.process.summary(),
+        }
+
+def load_frames(path):
+    """
+    Returns the (N, height, width, 3) uint8 frames saved in a .npy file, memory mapped
+    """
+    if np is None:
+        raise RuntimeError("Loading frames needs numpy")
+    frames = np.load(path, mmap_mode='r')
+    if frames.ndim != 4 or frames.shape[-1] != 3 or frames.dtype != np.uint8:
+        raise ValueError("Expected an (N, height, width, 3) uint8 array, got %s %s" % (frames.shape, frames.dtype))
+    return frames
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python -m alphabot.Obstacles <frames.npy>")
+        sys.exit(1)
+    frames = load_frames(sys.argv[1])
+    detector = ObstacleDetector(None)
+    for n, frame in enumerate(frames):
+        detected = detector.update(frame)
+        print("%5d %s %5.1f%%" % (n, "obstacle" if detected else "clear   ", detector.detector.occupied * 100))
+    print("Processed %d frames: %s" % (len(frames), detector.stats()))
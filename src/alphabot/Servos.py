@@ -0,0 +1,175 @@
+""" Pan/tilt servo motion
+
+ServoMotion takes target angles from any thread and moves the servos towards
+them from a thread of its own, at a fixed update rate and within speed and
+acceleration limits. New targets replace the old ones, targets within the
+deadband of the current one are dropped, and an angle is only written when it
+moves by a whole step, so a tracking loop can set targets every frame without
+an I2C write for each.
+"""
+import logging
+import math
+import threading
+import time
+
+# initialize the logger
+logger = logging.getLogger(__name__)
+handler = logging.StreamHandler() # or RotatingFileHandler
+handler.setFormatter(logging.Formatter('[%(asctime)s][%(name)s][%(levelname)s] %(message)s'))
+logger.addHandler(handler)
+logger.setLevel(logging.INFO) # or DEBUG
+
+UPDATE_HZ   = 25        # servo updates per second while moving
+MAX_SPEED   = 180.0     # degrees per second
+MAX_ACCEL   = 720.0     # degrees per second squared
+DEADBAND    = 2.0       # degrees, smaller target changes are dropped (tracking jitter)
+STEP        = 1         # degrees, smaller moves are not written
+MIN_ANGLE   = 0
+MAX_ANGLE   = 150
+
+class Axis:
+    """
+    One servo channel: where it is, how fast it moves and where it goes
+    """
+    __slots__ = ('channel', 'position', 'velocity', 'target', 'written')
+
+    def __init__(self, channel, position):
+        self.channel = channel
+        self.position = position
+        self.velocity = 0.0
+        self.target = position
+        self.written = None     # last angle sent to the servo
+
+    def step(self, dt, speed, accel):
+        """
+        Moves towards the target for dt seconds, braking in time to stop on it
+        """
+        error = self.target - self.position
+        # Fastest speed that can still stop at the target
+        wanted = math.copysign(min(speed, math.sqrt(2 * accel * abs(error))), error)
+        change = accel * dt
+        self.velocity += max(-change, min(change, wanted - self.velocity))
+        move = self.velocity * dt
+        if abs(move) >= abs(error) or (abs(error) < 0.1 and abs(self.velocity) < change):
+            self.position = self.target
+            self.velocity = 0.0
+        else:
+            self.position += move
+
+    def moving(self):
+        return self.position != self.target or self.velocity != 0.0
+
+class ServoMotion:
+    """
+    Moves the servos of a ServoKit towards their targets
+    """
+    def __init__(self, kit, channels=(0, 1), start=None, rate=UPDATE_HZ, speed=MAX_SPEED,
+                 accel=MAX_ACCEL, deadband=DEADBAND, step=STEP):
+        self.kit = kit
+        start = start or [MIN_ANGLE] * len(channels)
+        self.axes = {channel: Axis(channel, float(angle)) for channel, angle in zip(channels, start)}
+        self.period = 1.0 / rate
+        self.speed = speed
+        self.accel = accel
+        self.deadband = deadband
+        self.step = step
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+
+        self.commands = 0   # set_target calls
+        self.merged = 0     # targets dropped in the deadband or replaced before they were reached
+        self.writes = 0     # angles sent to the servos
+        self.start_s = 0.0
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.start_s = time.perf_counter()
+        self.thread = threading.Thread(target=self._run, name="servos", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def set_target(self, channel, angle):
+        """
+        Sets the angle a channel moves to, clamped to MIN_ANGLE..MAX_ANGLE
+        """
+        angle = float(max(MIN_ANGLE, min(MAX_ANGLE, angle)))
+        with self.condition:
+            self.commands += 1
+            axis = self.axes[channel]
+            if abs(angle - axis.target) < self.deadband:
+                self.merged += 1
+                return
+            if axis.moving():
+                self.merged += 1
+            axis.target = angle
+            self.condition.notify_all()
+
+    def jump(self, channel, angle):
+        """
+        Writes an angle to a channel right away, without the speed limits, and it
+        stays there. For when the position of the servo is unknown, like at start
+        """
+        angle = max(MIN_ANGLE, min(MAX_ANGLE, angle))
+        with self.condition:
+            axis = self.axes[channel]
+            axis.position = axis.target = float(angle)
+            axis.velocity = 0.0
+            axis.written = angle
+        self.kit.servo[channel].angle = angle
+        self.writes += 1
+
+    def moving(self):
+        with self.condition:
+            return any(axis.moving() for axis in self.axes.values())
+
+    def _run(self):
+        next_update = time.monotonic()
+        while True:
+            with self.condition:
+                # Sleep until there is somewhere to go
+                while self.running and not any(axis.moving() for axis in self.axes.values()):
+                    self.condition.wait()
+                    next_update = time.monotonic()
+                if not self.running:
+                    return
+                writes = []
+                for axis in self.axes.values():
+                    if not axis.moving():
+                        continue
+                    axis.step(self.period, self.speed, self.accel)
+                    angle = round(axis.position)
+                    # Whole steps while moving, and the final angle
+                    if axis.written is None or abs(angle - axis.written) >= self.step or \
+                            (not axis.moving() and angle != axis.written):
+                        axis.written = angle
+                        writes.append((axis.channel, angle))
+            # The I2C writes happen outside the lock, set_target never waits for them
+            for channel, angle in writes:
+                self.kit.servo[channel].angle = angle
+            self.writes += len(writes)
+            next_update += self.period
+            delay = next_update - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_update = time.monotonic()
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.start_s if self.start_s else 0.0
+        return {
+            'commands': self.commands,
+            'merged': self.merged,
+            'writes': self.writes,
+            'writes_per_s': self.writes / elapsed if elapsed else 0.0,
+            'angles': {axis.channel: axis.position for axis in self.axes.values()},
+        }
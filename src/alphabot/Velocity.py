@@ -0,0 +1,116 @@
+""" Mapping of the board mass differences to motor direction and power
+
+The thresholds are compiled once into a bisect index (step mode, the original
+five steps) or a piecewise-linear curve through the same points (smooth mode).
+map_masses does the same for a whole array of samples with numpy, for replays
+and simulations.
+"""
+from bisect import bisect_left
+from enum import Enum
+try:
+    import numpy as np
+except ImportError:     # only needed by map_masses
+    np = None
+
+class MovDirection(Enum):
+    POSITIVE = 0
+    NEGATIVE = 1
+    IDLE = 2
+
+# Weights that define the motor velocity
+weightThreshold = {
+    "NONE": 5,
+    "LOW": 10,
+    "MEDIUM": 15,
+    "HIGH": 20,
+    "VERY_HIGH": 30
+}
+# Power that defines the motor velocity
+powerMap = {
+    "NONE": 0,
+    "LOW": 10,
+    "MEDIUM": 20,
+    "HIGH": 30,
+    "VERY_HIGH": 40
+}
+LEVELS = ("NONE", "LOW", "MEDIUM", "HIGH", "VERY_HIGH")
+
+class PowerCurve:
+    """
+    Converts the difference (kg) between two sides of the board to a power.
+    Up to weightThreshold["NONE"] the axis is idle. Step mode: each following
+    threshold is the top of its power step, and differences above the last one
+    keep the highest power. Smooth mode: the power goes linearly through the
+    (threshold, power) points, from 0 at the end of the idle zone
+    """
+    def __init__(self, thresholds=weightThreshold, powers=powerMap, smooth=False):
+        self.bounds = [thresholds[level] for level in LEVELS]
+        self.powers = [powers[level] for level in LEVELS]
+        self.smooth = smooth
+        # Power of each bisect_left index, the last one is past the highest threshold
+        self.steps = self.powers + self.powers[-1:]
+        self.slopes = [(self.powers[i + 1] - self.powers[i]) / float(self.bounds[i + 1] - self.bounds[i])
+                       for i in range(len(self.bounds) - 1)]
+
+    def power(self, diff):
+        """
+        Returns the power of a difference, None if the axis is idle
+        """
+        idx = bisect_left(self.bounds, diff)
+        if idx == 0:
+            return None
+        if not self.smooth or idx == len(self.bounds):
+            return self.steps[idx]
+        i = idx - 1
+        return self.powers[i] + self.slopes[i] * (diff - self.bounds[i])
+
+    def velocity(self, positive, negative):
+        """
+        Returns the direction and power of one axis, from the mass on each side
+        """
+        power = self.power(abs(positive - negative))
+        if power is None:
+            return MovDirection.IDLE, 0
+        return (MovDirection.POSITIVE if positive >= negative else MovDirection.NEGATIVE), power
+
+def sides(top_right, bottom_right, top_left, bottom_left):
+    """
+    Returns the mean mass of the up, down, left and right sides of the board
+    """
+    up = (top_right + top_left) / 2
+    down = (bottom_right + bottom_left) / 2
+    left = (top_left + bottom_left) / 2
+    right = (top_right + bottom_right) / 2
+    return up, down, left, right
+
+def map_masses(masses, curve=None):
+    """
+    Maps an (N, 4) array of masses (TOP_RIGHT, BOTTOM_RIGHT, TOP_LEFT, BOTTOM_LEFT)
+    at once, like Alphabot.mass_to_velocity does one sample
+
+    Returns:
+        vertDirection, vertPower, horizDirection, horizPower: arrays of N, the
+        directions as MovDirection values
+    """
+    if np is None:
+        raise RuntimeError("map_masses needs numpy")
+    curve = curve or PowerCurve()
+    masses = np.asarray(masses, dtype=np.float64)
+    up, down, left, right = sides(*masses.T)
+
+    def axis(positive, negative):
+        diff = np.abs(positive - negative)
+        idx = np.searchsorted(curve.bounds, diff, side='left')
+        if curve.smooth:
+            power = np.interp(diff, curve.bounds, curve.powers)
+        else:
+            power = np.asarray(curve.steps, dtype=np.float64)[idx]
+        direction = np.where(positive >= negative, MovDirection.POSITIVE.value, MovDirection.NEGATIVE.value)
+        idle = idx == 0
+        direction[idle] = MovDirection.IDLE.value
+        power[idle] = 0
+        return direction, power
+
+    vertDirection, vertPower = axis(up, down)
+    horizDirection, horizPower = axis(right, left)
+    return vertDirection, vertPower, horizDirection, horizPower
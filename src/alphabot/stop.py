@@ -1,6 +1,7 @@
-from Alphabot import Alphabot
-from Camera import Camera
-import RPi.GPIO as GPIO
+# Stops the robot: python -m alphabot.stop (from src)
+from alphabot.Alphabot import Alphabot
+from alphabot.Camera import Camera
+from hardware import GPIO
 
 alphabot = Alphabot()
 alphabot.stop()
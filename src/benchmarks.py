@@ -0,0 +1,885 @@
+"""
+Benchmarks and measurements that can run on a dev machine
+
+usage: python benchmarks.py <benchmark> [args...]
+"""
+import math
+import random
+import sys
+import time
+
+from tests.fixtures import board_session, fake_calibration, fake_log, fake_mass_packets, measure_allocs
+
+def tick_jitter(duration=600, tick_ms=1):
+    """
+    Runs the tick source with an empty handler and reports drift and jitter
+    """
+    from ticker import Ticker
+
+    ticker = Ticker(float(tick_ms), lambda ticks: 1)
+    ticker.start()
+    end = time.monotonic() + float(duration)
+    while time.monotonic() < end:
+        time.sleep(min(10, max(end - time.monotonic(), 0)))
+        print(ticker.stats())
+    ticker.stop()
+
+def _linear_tick(kernel, table):
+    """
+    Reference for kernel_tick: the per tick counter scan the kernel used before it
+    slept to the next release
+    """
+    for task in table:
+        if task.delay > 0:
+            task.delay -= 1
+        else:
+            task.counter += 1
+            task.delay = task.period - 1
+    for task in table:
+        if task.counter == 0:
+            continue
+        task.counter = 0
+        kernel.Sched_Run(task)
+
+def kernel_tick(ticks=20000):
+    """
+    Measures the scheduler overhead per tick with 10, 100 and 1000 registered tasks,
+    against the per tick counter scan
+    """
+    import kernel
+    from Task import Task
+
+    ticks = int(ticks)
+    mixes = {
+        'dense': [1, 10, 100, 1000, 10000],     # a fifth of the tasks run every tick
+        'sparse': [10, 100, 1000, 10000],
+    }
+    noop = lambda: None
+    for mix, periods in mixes.items():
+        for n in (10, 100, 1000):
+            rng = random.Random(n)
+            specs = [(rng.randrange(100), rng.choice(periods)) for _ in range(n)]
+
+            kernel.Sched_Reset()
+            for delay, period in specs:
+                kernel.Sched_AddTask(noop, delay, period)
+            wakeups = 0
+            tick = 0
+            start = time.perf_counter()
+            while tick < ticks:
+                # Sleep straight to the next release like the ticker does
+                sleep = kernel.Sched_NextRelease() or 1
+                kernel.Sched_Schedule(sleep)
+                kernel.Sched_Dispatch()
+                tick += sleep
+                wakeups += 1
+            kernel_us = (time.perf_counter() - start) / ticks * 1e6
+
+            table = [Task(noop, delay, period) for delay, period in specs]
+            start = time.perf_counter()
+            for _ in range(ticks):
+                _linear_tick(kernel, table)
+            linear_us = (time.perf_counter() - start) / ticks * 1e6
+
+            print("%6s %5d tasks: kernel %8.2f us/tick (%d wake-ups)  counter scan %8.2f us/tick"
+                  % (mix, n, kernel_us, wakeups, linear_us))
+        kernel.Sched_Reset()
+
+def _legacy_calc_mass(calibration, raw, pos):
+    """
+    Reference for wii_mass_decode: calc_mass as it was before the calibration table
+    """
+    parsed_mass = int.from_bytes(raw[0:2], byteorder='big')
+    calibration = [int.from_bytes([calibration[i][pos][j] for j in range(len(calibration[i][pos]))], byteorder="big")
+                   for i in range(len(calibration))]
+    if parsed_mass < calibration[0]:
+        return 0.0
+    elif parsed_mass < calibration[1]:
+        return 17 * ((parsed_mass - calibration[0]) / float((calibration[1] - calibration[0])))
+    else:
+        return 17 + 17 * ((parsed_mass - calibration[1]) / float((calibration[2] - calibration[1])))
+
+def wii_mass_decode(samples=100000):
+    """
+    Measures WiiBoard mass decoding in samples per second, before and after the
+    calibration table, and with the numpy batch decoder when numpy is available
+    """
+    from wii_balance.WiiBoard import WiiBoard, TOP_RIGHT, BOTTOM_RIGHT, TOP_LEFT, BOTTOM_LEFT
+
+    samples = int(samples)
+    rng = random.Random(0)
+    board = WiiBoard(cache=None)
+    board.calibration = fake_calibration(rng)
+    board.calibration_table = board.build_calibration_table()
+    packets = fake_mass_packets(rng, samples)
+
+    start = time.perf_counter()
+    legacy = []
+    for packet in packets:
+        data = packet[4:12]
+        legacy.append([_legacy_calc_mass(board.calibration, data[i * 2:i * 2 + 2], pos)
+                       for i, pos in enumerate((TOP_RIGHT, BOTTOM_RIGHT, TOP_LEFT, BOTTOM_LEFT))])
+    legacy_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decoded = [board.get_mass(packet[4:12]) for packet in packets]
+    table_s = time.perf_counter() - start
+    assert all([m.top_right, m.bottom_right, m.top_left, m.bottom_left] == l for m, l in zip(decoded, legacy))
+
+    print("legacy calc_mass  %10.0f samples/s" % (samples / legacy_s))
+    print("calibration table %10.0f samples/s" % (samples / table_s))
+    try:
+        import numpy as np
+    except ImportError:
+        print("numpy not installed, skipping the batch decoder")
+        return
+    raw = np.frombuffer(b''.join(packets), dtype=np.uint8).reshape(samples, -1)
+    start = time.perf_counter()
+    batch = board.decode_masses(raw)
+    batch_s = time.perf_counter() - start
+    assert (batch == np.array(legacy)).all()
+    print("numpy batch       %10.0f samples/s" % (samples / batch_s))
+
+def _legacy_parse(board, data):
+    """
+    Reference for wii_packet_allocs: the slices and dicts the parser used to build
+    """
+    state = data[2:4]
+    btn_state = [state[i] for i in range(len(state))][1]
+    raw = data[4:12]
+    table = board.calibration_table
+    from wii_balance.WiiBoard import decode_mass
+    mass = {
+        'top_right':    decode_mass(int.from_bytes(raw[0:2][0:2], 'big'), table[0]),
+        'bottom_right': decode_mass(int.from_bytes(raw[2:4][0:2], 'big'), table[1]),
+        'top_left':     decode_mass(int.from_bytes(raw[4:6][0:2], 'big'), table[2]),
+        'bottom_left':  decode_mass(int.from_bytes(raw[6:8][0:2], 'big'), table[3]),
+    }
+    return {'type': btn_state, 'data': mass}
+
+# Bounds of the recv_into path per mass packet: the MassSample and its 4 floats,
+# and the transient peak (the old slices and dicts path needed ~620 bytes).
+# The regression test, tests/test_wiiboard_allocs.py, keeps its own bounds
+PACKET_KEPT_BLOCKS = 7
+PACKET_PEAK_BYTES = 400
+LEAK_BYTES = 4096   # left allocated after a whole run with the samples dropped (tracemalloc's own)
+
+def wii_packet_allocs(packets=2000):
+    """
+    Measures the memory allocated per mass packet with tracemalloc, through a
+    socketpair standing in for the L2CAP socket (the send is counted in both)
+    """
+    import socket
+    from wii_balance.WiiBoard import WiiBoard
+
+    packets = int(packets)
+    rng = random.Random(0)
+    board = WiiBoard(cache=None)
+    control, controlPeer = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    receive, receivePeer = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    board.attach(control, receive)
+    board.calibration = fake_calibration(rng)
+    board.calibration_table = board.build_calibration_table()
+    board.calibrated = True
+    raw = fake_mass_packets(rng, packets)
+
+    def parse(packet):
+        receivePeer.send(packet)
+        length = board.receive()
+        return board.handle_packet(board.packet, length)
+    parse(raw[0])   # warm up the lazily created state
+    size, blocks, peak = measure_allocs(raw, parse)
+    print("recv_into + MassSample: kept %6.1f bytes %4.1f blocks, transient peak %6.1f bytes per packet" % (size, blocks, peak))
+    assert blocks <= PACKET_KEPT_BLOCKS and peak <= PACKET_PEAK_BYTES, "allocations per packet regressed"
+    leak, _, _ = measure_allocs(raw, parse, keep=False)
+    print("recv_into, samples dropped: %5.1f bytes per packet left allocated" % leak)
+    assert leak * packets < LEAK_BYTES, "packets leak memory"
+
+    def legacy(packet):
+        receivePeer.send(packet)
+        return _legacy_parse(board, receive.recv(25))
+    size, blocks, peak = measure_allocs(raw, legacy)
+    print("recv + slices + dicts:  kept %6.1f bytes %4.1f blocks, transient peak %6.1f bytes per packet" % (size, blocks, peak))
+    board.close()
+
+def wii_replay(samples=100000, path=None):
+    """
+    Replays a packet log (a synthetic one by default) through WiiBoard.read_data
+    as fast as possible, and reports how much faster than real time it runs
+    """
+    import os
+    import tempfile
+    from wii_balance.Replay import replay_board
+    from wii_balance.WiiBoard import ResponseType
+
+    samples = int(samples)
+    duration = None
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), "board.log")
+        duration = fake_log(path, random.Random(0), samples)
+    board = replay_board(path)
+    replay = board.receiveSocket
+    start = time.perf_counter()
+    board.readCalibrationData()
+    masses = 0
+    while board.connected:
+        response = board.read_data()
+        if response is not None and response.type == ResponseType.MASS:
+            masses += 1
+    elapsed = time.perf_counter() - start
+    if duration is None:
+        stamps = [timestamp for timestamp, _ in replay.log]
+        duration = (stamps[-1] - stamps[0]) / 1e9 if stamps else 0.0
+    print("%d packets, %d mass samples in %.3f s: %.0f packets/s, %.0fx real time" %
+          (replay.packets, masses, elapsed, replay.packets / elapsed, duration / elapsed))
+
+def wii_first_sample(calibration_ms=200, runs=5, path=None):
+    """
+    Measures the time from connecting to the first usable mass sample, with and
+    without the cached calibration, replaying a log in real time. The synthetic log
+    has the calibration replies arrive calibration_ms after the first mass report
+    """
+    import os
+    import tempfile
+    from wii_balance.Replay import replay_board
+    from wii_balance.WiiBoard import ResponseType
+
+    runs = int(runs)
+    folder = tempfile.mkdtemp()
+    calibration = fake_calibration(random.Random(0))
+    if path is None:
+        path = os.path.join(folder, "board.log")
+        fake_log(path, random.Random(0), 100, calibration_at=int(calibration_ms) // 10, calibration=calibration)
+    cache = os.path.join(folder, "cache.json")
+    for cached in (False, True):
+        times = []
+        for _ in range(runs):
+            board = replay_board(path, realtime=True, cache=cache)
+            board.board_address = "00:00:00:00:00:00"
+            if cached:
+                board.load_calibration()
+            while board.connected and not board.first_sample:
+                response = board.read_data()
+                if response is not None and response.type == ResponseType.CALIBRATION:
+                    board.save_calibration()
+            times.append(board.first_sample_ms[-1])
+        print("%-18s first usable sample after %6.1f ms (min %6.1f, max %6.1f)" %
+              ("cached calibration" if cached else "board calibration",
+               sum(times) / len(times), min(times), max(times)))
+
+def wii_filters(samples=100000):
+    """
+    Measures the per-sample cost of each mass filter and of the filter stage
+    tasks.py uses, and the throughput of the numpy batch filters
+    """
+    from wii_balance import Filters
+    from wii_balance.WiiBoard import MassSample
+
+    samples = int(samples)
+    rng = random.Random(0)
+    masses = [[rng.uniform(0, 20) for _ in range(4)] for _ in range(samples)]
+    filters = {
+        'moving average': Filters.MovingAverage(5),
+        'exponential': Filters.ExponentialFilter(0.2),
+        'median': Filters.MedianFilter(5),
+        'auto tare': Filters.AutoTare(),
+    }
+    for name, f in filters.items():
+        start = time.perf_counter()
+        for values in masses:
+            f.update(values)
+        print("%-16s %8.0f ns/sample" % (name, (time.perf_counter() - start) / samples * 1e9))
+
+    stage = Filters.MassFilter([Filters.MedianFilter(5), Filters.ExponentialFilter(0.2)], tare=Filters.AutoTare())
+    sampled = [MassSample(*values) for values in masses]
+    start = time.perf_counter()
+    for sample in sampled:
+        stage.update(sample)
+    print("%-16s %8.0f ns/sample (median 5, EMA, tare, center of pressure)" %
+          ("filter stage", (time.perf_counter() - start) / samples * 1e9))
+
+    if Filters.np is None:
+        print("numpy not installed, skipping the batch filters")
+        return
+    array = Filters.np.array(masses)
+    for name, batch in (('moving average', Filters.moving_average), ('exponential', Filters.exponential),
+                        ('median', Filters.median), ('center of pressure', Filters.centers_of_pressure)):
+        start = time.perf_counter()
+        batch(array)
+        print("batch %-18s %10.0f samples/s" % (name, samples / (time.perf_counter() - start)))
+
+def multi_board(boards=8, rate=100, seconds=5):
+    """
+    Feeds N simulated boards over socketpairs at rate Hz each (0 for as fast as
+    possible) and reads them all with one BoardManager thread. Reports the packets
+    it handled, the CPU time of its thread, and checks the merged samples are in order
+    """
+    import threading
+    from wii_balance.BoardManager import BoardManager
+    from wii_balance.WiiBoard import ResponseType, WiiBoard
+
+    boards, rate, seconds = int(boards), float(rate), float(seconds)
+    rng = random.Random(0)
+    manager = BoardManager(cache=None)
+    peers = []
+    for i in range(boards):
+        sockets, peer, calibration = board_session(rng)
+        board = WiiBoard(cache=None)
+        board.attach(*sockets)
+        board.calibrate()
+        manager.add(board, "board%d" % i)
+        for packet in calibration:
+            peer[1].send(packet)
+        peers.append(peer)
+    packets = fake_mass_packets(rng, 100)
+
+    sent = [0]
+    def feed():
+        end = time.monotonic() + seconds
+        period = 1 / rate if rate else 0
+        deadline = time.monotonic()
+        while time.monotonic() < end:
+            for _, receivePeer in peers:
+                try:
+                    receivePeer.send(packets[sent[0] % len(packets)])
+                    sent[0] += 1
+                except BlockingIOError:
+                    pass
+            if period:
+                deadline += period
+                time.sleep(max(deadline - time.monotonic(), 0))
+    for _, receivePeer in peers:
+        receivePeer.setblocking(rate > 0)
+    feeder = threading.Thread(target=feed)
+    manager.start()
+    start = time.perf_counter()
+    feeder.start()
+    merged = 0
+    last = 0
+    ordered = True
+    while feeder.is_alive():
+        time.sleep(0.1)
+        for name, response in manager.read_merged():
+            if response.type == ResponseType.MASS:
+                merged += 1
+                ordered = ordered and response.timestamp >= last
+                last = response.timestamp
+    feeder.join()
+    time.sleep(0.2)
+    elapsed = time.perf_counter() - start
+    stats = manager.stats()
+    manager.close()
+    overwritten = sum(s['overwritten'] for s in stats['readers'].values())
+    print("%d boards at %s: sent %d, read %d packets (%.0f/s), merged %d samples %s, overwritten %d" % (
+        boards, "%.0f Hz" % rate if rate else "full speed", sent[0], stats['packets'],
+        stats['packets'] / elapsed, merged, "in order" if ordered else "OUT OF ORDER", overwritten))
+    print("event loop: %d wake-ups, %.2f s CPU in %.2f s (%.1f%% of a core), %.1f us per packet" % (
+        stats['loops'], stats['cpu_s'], elapsed, stats['cpu_s'] / elapsed * 100,
+        stats['cpu_s'] / max(stats['packets'], 1) * 1e6))
+
+def _legacy_axis(diff, direction, weightThreshold, powerMap, previous):
+    """
+    Reference for velocity_map: one if/elif ladder of mass_to_velocity before the
+    lookup table, previous is what the robot kept above VERY_HIGH
+    """
+    from alphabot.Velocity import MovDirection
+
+    if diff <= weightThreshold["NONE"]: # No movement
+        return MovDirection.IDLE, 0
+    elif diff <= weightThreshold["LOW"]: # Low movement
+        return direction, powerMap["LOW"]
+    elif diff <= weightThreshold["MEDIUM"]: # Medium movement
+        return direction, powerMap["MEDIUM"]
+    elif diff <= weightThreshold["HIGH"]: # High movement
+        return direction, powerMap["HIGH"]
+    elif diff <= weightThreshold["VERY_HIGH"]: # Very High movement
+        return direction, powerMap["VERY_HIGH"]
+    return previous
+
+def velocity_map(samples=100000):
+    """
+    Checks the mass to velocity lookup table against the if/elif ladders it
+    replaced, and measures it, the smooth curve and the numpy batch mapping
+    """
+    from alphabot.Velocity import MovDirection, PowerCurve, map_masses, powerMap, sides, weightThreshold
+
+    samples = int(samples)
+    rng = random.Random(0)
+    masses = [[rng.uniform(0, 40) for _ in range(4)] for _ in range(samples)]
+    # Include the threshold values themselves
+    masses[:len(weightThreshold)] = [[2 * t, 0, 0, 0] for t in weightThreshold.values()]
+
+    def legacy(m, previous):
+        up, down, left, right = sides(*m)
+        vert = MovDirection.POSITIVE if up >= down else MovDirection.NEGATIVE
+        horiz = MovDirection.POSITIVE if right >= left else MovDirection.NEGATIVE
+        return (_legacy_axis(abs(up - down), vert, weightThreshold, powerMap, previous[0]),
+                _legacy_axis(abs(left - right), horiz, weightThreshold, powerMap, previous[1]))
+
+    unchanged = object()
+    start = time.perf_counter()
+    expected = [legacy(m, (unchanged, unchanged)) for m in masses]
+    legacy_s = time.perf_counter() - start
+
+    curve = PowerCurve()
+    def lookup(m):
+        up, down, left, right = sides(*m)
+        return curve.velocity(up, down), curve.velocity(right, left)
+    start = time.perf_counter()
+    mapped = [lookup(m) for m in masses]
+    table_s = time.perf_counter() - start
+
+    clamped = 0
+    for old, new in zip(expected, mapped):
+        for o, n in zip(old, new):
+            if o is unchanged:
+                assert n[1] == powerMap["VERY_HIGH"]    # used to keep the previous velocity
+                clamped += 1
+            else:
+                assert o == n, (o, n)
+    print("if/elif ladders %10.0f samples/s" % (samples / legacy_s))
+    print("bisect table    %10.0f samples/s (same results, %d axes above VERY_HIGH now clamped)" % (samples / table_s, clamped))
+
+    smooth = PowerCurve(smooth=True)
+    start = time.perf_counter()
+    for m in masses:
+        up, down, left, right = sides(*m)
+        smooth.velocity(up, down), smooth.velocity(right, left)
+    print("smooth curve    %10.0f samples/s" % (samples / (time.perf_counter() - start)))
+
+    try:
+        import numpy as np
+    except ImportError:
+        print("numpy not installed, skipping the batch mapping")
+        return
+    array = np.array(masses)
+    start = time.perf_counter()
+    vertDirection, vertPower, horizDirection, horizPower = map_masses(array)
+    batch_s = time.perf_counter() - start
+    assert list(vertPower) == [v[1] for v, h in mapped] and list(horizPower) == [h[1] for v, h in mapped]
+    assert list(vertDirection) == [v[0].value for v, h in mapped]
+    assert list(horizDirection) == [h[0].value for v, h in mapped]
+    smooth_power = map_masses(array, smooth)[1]
+    assert np.allclose(smooth_power, [smooth.velocity(*sides(*m)[:2])[1] for m in masses])
+    print("numpy batch     %10.0f samples/s" % (samples / batch_s))
+
+def gpio_calls(ticks=6000, seed=0):
+    """
+    Counts the GPIO calls per drive_alphabot + honk tick with the fake hardware,
+    with the pin-state cache and without it (every pin written every tick, like
+    before). The rider leans in a new direction every few seconds, at 10 ticks/s
+    """
+    import hardware
+    hardware.select("fake")
+    gpio = hardware.GPIO
+    from alphabot.Alphabot import Alphabot
+    from wii_balance.WiiBoard import MassSample
+
+    ticks = int(ticks)
+    rng = random.Random(int(seed))
+    samples = []
+    pose = [15.0] * 4
+    for tick in range(ticks):
+        if tick % 50 == 0:
+            pose = [rng.uniform(5, 30) for _ in range(4)]
+        samples.append(MassSample(*[m + rng.gauss(0, 0.3) for m in pose]))
+    honks = [rng.random() < 0.02 for _ in range(ticks)]
+
+    for cache in (False, True):
+        bot = Alphabot(cache=cache)
+        gpio.reset()
+        start = time.perf_counter()
+        for sample, honk in zip(samples, honks):
+            bot.mass_to_velocity(sample)
+            bot.drive()
+            bot.setHonk(honk)
+            bot.updateBuzzer()
+        elapsed = time.perf_counter() - start
+        print("%-13s %5.2f GPIO calls/tick, %5.1f us/tick" % (
+            "pin cache" if cache else "write-through", gpio.calls / ticks, elapsed / ticks * 1e6))
+
+def collision_stop(edges=1000):
+    """
+    Measures the time from a simulated IR edge to the motors stopped, through the
+    fake GPIO. The callback runs on the thread that makes the edge here; on the Pi
+    RPi.GPIO's event thread adds its wake-up latency on top
+    """
+    import hardware
+    hardware.select("fake")
+    gpio = hardware.GPIO
+    from alphabot.Alphabot import Alphabot
+    from alphabot.Velocity import MovDirection
+    from Histogram import Histogram
+
+    edges = int(edges)
+    bot = Alphabot()
+    latency = Histogram()
+    for i in range(edges):
+        bot.vertDirection, bot.vertPower = MovDirection.POSITIVE, 20
+        bot.horizDirection = MovDirection.IDLE
+        bot.drive()
+        pin = bot.irLeft if i % 2 else bot.irRight
+        gpio.reset()
+        edge = time.monotonic_ns()
+        gpio.set_input(pin, gpio.LOW)
+        stopped = [t for t, kind, p, value in gpio.records if kind == 'duty' and value == 0]
+        assert bot.isColliding and len(stopped) == 2
+        latency.record(max(stopped) - edge)
+        gpio.set_input(pin, gpio.HIGH)
+        assert not bot.isColliding
+    s = latency.summary()
+    print("edge to motors stopped: p50 %.1f us, p99 %.1f us, max %.1f us over %d edges (%d stops)" %
+          (s['p50'], s['p99'], s['max'], edges, bot.collisionStops))
+    print("polling check_collision every 100 ms tick would take up to 100000 us")
+
+def kernel_loop(seconds=30, path=None):
+    """
+    Runs kernel.py with the fake hardware and a packet log (a synthetic one by
+    default) replayed in real time as the board, and reports the tick, task and
+    GPIO statistics and the CPU time it used
+    """
+    import contextlib
+    import io
+    import logging
+    import os
+    import tempfile
+    import hardware
+    hardware.select("fake")
+    from wii_balance.Replay import NullSocket, PacketLog, ReplaySocket
+
+    seconds = float(seconds)
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), "board.log")
+        fake_log(path, random.Random(0), int(seconds * 100) + 100)
+    import kernel
+    import tasks
+    logging.getLogger("alphabot.Alphabot").setLevel(logging.INFO)
+    board = tasks.wiiBoard
+    board.cache_path = None
+    board.attach(NullSocket(), ReplaySocket(PacketLog(path), realtime=True))
+    board.calibrate()
+    board.start_reader()
+
+    output = io.StringIO()
+    cpu = time.process_time()
+    with contextlib.redirect_stdout(output):
+        kernel.setup()
+        time.sleep(seconds)
+        kernel.Sched_Stop()
+    cpu = time.process_time() - cpu
+    board.close()
+
+    tick = kernel.ticker.stats() if kernel.ticker else {}
+    print("%.0f s: %.2f s CPU (%.1f%%), %d lines printed" % (seconds, cpu, cpu / seconds * 100, output.getvalue().count("\n")))
+    print("ticker: %s" % {k: round(v, 1) if isinstance(v, float) else v for k, v in tick.items()})
+    for name, stats in kernel.Sched_TaskStats().items():
+        e = stats['exec_us']
+        print("%-18s runs %5d misses %d exec us p50 %7.0f p99 %7.0f max %7.0f" %
+              (name, stats['runs'], stats['misses'], e['p50'], e['p99'], e['max']))
+    print("board: %s" % board.report_stats())
+    print("GPIO: %s" % hardware.GPIO.counts)
+
+def camera_frames(seconds=5, work_ms=50):
+    """
+    Captures frames from the fake camera at its framerate while a consumer spends
+    work_ms per round, with the consumer capturing into a new array itself (how a
+    task would do it without the pipeline) and taking the latest frame of the
+    pipeline without waiting. Blocked is the time the consumer waits for a frame,
+    time a tick task can't use
+    """
+    import hardware
+    hardware.select("fake")
+    import numpy as np
+    from alphabot.Camera import Camera
+    from alphabot.Frames import FramePipeline
+    from Histogram import Histogram
+
+    seconds = float(seconds)
+    work = float(work_ms) / 1000
+    cam = Camera()
+
+    def report(name, rounds, frames, blocked, age):
+        s = age.summary(1e6)
+        print("%-9s %5.1f rounds/s, %5.1f new frames/s, blocked %5.1f ms/round, frame age after the work p50 %.1f ms p99 %.1f ms" %
+              (name, rounds / seconds, frames / seconds, blocked / max(rounds, 1) * 1e3, s['p50'], s['p99']))
+
+    # Without the pipeline: capture, then work, one after the other
+    age = Histogram()
+    frames = 0
+    blocked = 0.0
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        start = time.perf_counter()
+        buffer = np.empty(cam.frame_shape(), dtype=np.uint8)
+        cam.capture(buffer)
+        captured = time.monotonic_ns()
+        blocked += time.perf_counter() - start
+        frames += 1
+        time.sleep(work)
+        age.record(time.monotonic_ns() - captured)
+    report("inline", frames, frames, blocked, age)
+
+    pipeline = FramePipeline(cam)
+    pipeline.start()
+    pipeline.get(timeout=1.0).release()
+    age = Histogram()
+    rounds = frames = 0
+    blocked = 0.0
+    seq = -1
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        start = time.perf_counter()
+        frame = pipeline.get(timeout=0)
+        blocked += time.perf_counter() - start
+        rounds += 1
+        with frame:
+            assert not frame.array.flags.writeable
+            value = frame.array[0, 0, 0]
+            frames += frame.seq != seq
+            seq = frame.seq
+            time.sleep(work)
+            assert (frame.array == value).all()     # not overwritten while held
+            age.record(time.monotonic_ns() - frame.timestamp)
+    pipeline.stop()
+    report("pipeline", rounds, frames, blocked, age)
+    stats = pipeline.stats()
+    s = stats['age_ms']
+    print("capture   %5.1f fps, %d delivered, %d dropped, age when taken p50 %.1f ms p99 %.1f ms" %
+          (stats['fps'], stats['delivered'], stats['dropped'], s['p50'], s['p99']))
+
+def _obstacle_scene(seed=0, cycle=60):
+    """
+    Fake camera scene: a noisy floor whose brightness drifts, and a dark box in
+    the robot's path for the second half of every cycle frames
+    """
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    noise = [rng.integers(-12, 13, size=(240, 320, 1), dtype=np.int16) for _ in range(8)]
+
+    def scene(output, n):
+        level = 120 + 20 * np.sin(n / 100.0)
+        np.clip(level + noise[n % len(noise)], 0, 255, out=output, casting='unsafe')
+        if n % cycle >= cycle // 2:
+            output[150:, 110:210] = 40
+    return scene
+
+def camera_obstacles(frames=600, seconds=5, seed=0):
+    """
+    Runs the obstacle detector on recorded frames (a synthetic .npy recording of
+    the fake camera scene) and reports the time per frame and the detection delay,
+    then runs it live on the frame pipeline with Alphabot driving forward and
+    reports the CPU it used and the stops it made
+    """
+    import os
+    import tempfile
+    import hardware
+    hardware.select("fake")
+    import numpy as np
+    from alphabot.Alphabot import Alphabot
+    from alphabot.Camera import Camera
+    from alphabot.Frames import FramePipeline
+    from alphabot.Obstacles import ObstacleDetector, load_frames
+    from alphabot.Velocity import MovDirection
+
+    frames = int(frames)
+    cycle = 60
+    scene = _obstacle_scene(int(seed), cycle)
+    recording = np.empty((frames, 240, 320, 3), dtype=np.uint8)
+    for n in range(frames):
+        scene(recording[n], n)
+    path = os.path.join(tempfile.mkdtemp(), "frames.npy")
+    np.save(path, recording)
+
+    detector = ObstacleDetector(None)
+    truth = [n % cycle >= cycle // 2 for n in range(frames)]
+    results = [detector.update(frame) for frame in load_frames(path)]
+    wrong = sum(r != t for r, t in zip(results, truth))
+    s = detector.stats()['process_us']
+    print("recorded %d frames: p50 %.0f us p99 %.0f us per frame, %d detections, %d frames late (confirmation), %d changes" %
+          (frames, s['p50'], s['p99'], sum(results), wrong, detector.changes))
+
+    cam = Camera()
+    cam.cam.scene = scene
+    bot = Alphabot()
+    bot.vertDirection, bot.vertPower = MovDirection.POSITIVE, 20
+    bot.horizDirection = MovDirection.IDLE
+    pipeline = FramePipeline(cam)
+    detector = ObstacleDetector(pipeline, bot)
+    pipeline.start()
+    detector.start()
+    seconds = float(seconds)
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        # The drive task at 10 ticks/s, it keeps trying to go forward
+        bot.drive()
+        time.sleep(0.1)
+    detector.stop()
+    pipeline.stop()
+    stats = detector.stats()
+    s = stats['process_us']
+    print("live %.0f s: %d frames processed of %d captured, %.1f%% CPU, p50 %.0f us p99 %.0f us, %d changes, %d stops" %
+          (seconds, stats['processed'], pipeline.captured, stats['cpu'] * 100, s['p50'], s['p99'],
+           stats['changes'], bot.collisionStops))
+
+def servo_writes(seconds=10, fps=30, seed=0):
+    """
+    Counts the servo writes (I2C transactions on the Pi) of a tracking loop that
+    aims the camera at a jittery target every frame, writing the angles directly
+    to the servos and through the ServoMotion controller, on the fake ServoKit
+    with 0.5 ms per write (a PCA9685 register write at 100 kHz). The target moves
+    smoothly, or holds still. The error is how far the camera is from the target
+    without the jitter
+    """
+    import hardware
+    hardware.select("fake")
+    gpio = hardware.GPIO
+    from alphabot.Camera import Camera
+
+    seconds = float(seconds)
+    fps = float(fps)
+    rng = random.Random(int(seed))
+    frames = int(seconds * fps)
+    hardware.FakeServoKit.write_s = 0.0005
+    paths = {
+        'moving': [(60 + 40 * math.sin(2 * math.pi * n / fps / 4), 30 + 20 * math.sin(2 * math.pi * n / fps / 6))
+                   for n in range(frames)],
+        'holding': [(60, 30)] * frames,
+    }
+    for target, path in paths.items():
+        seen = [(t + rng.gauss(0, 1.5), p + rng.gauss(0, 1.5)) for t, p in path]
+        for name in ("direct", "ServoMotion"):
+            cam = Camera()
+            cam.motion.jump(0, path[0][0])
+            cam.motion.jump(1, path[0][1])
+            gpio.reset()
+            calls = 0.0
+            error = 0.0
+            start = time.monotonic()
+            for n, (tilt, pan) in enumerate(seen):
+                call = time.perf_counter()
+                if name == "direct":
+                    cam.kit.servo[0].angle = tilt
+                    cam.kit.servo[1].angle = pan
+                else:
+                    cam.aim(tilt, pan)
+                calls += time.perf_counter() - call
+                error += abs(cam.kit.servo[0].angle - path[n][0]) + abs(cam.kit.servo[1].angle - path[n][1])
+                delay = start + (n + 1) / fps - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            elapsed = time.monotonic() - start
+            cam.stop()
+            print("%-8s %-12s %5.1f servo writes/s, %6.1f us per call, mean error %.1f deg" %
+                  (target, name, gpio.counts['servo'] / elapsed, calls / frames * 1e6, error / frames / 2))
+
+def sensor_latency(seconds=20, calls=100000):
+    """
+    Runs kernel_loop with tracing on and reports the sensor to motor latency of
+    its stages, then the cost of tracing in mass_to_velocity + drive, off and on
+    """
+    import tracing
+    tracing.enable()
+    kernel_loop(seconds)
+    stats = tracing.tracer.stats()
+    print("traces %d: %d reached the motors, %d unchanged, %d superseded" %
+          (stats['traces'], stats['motor'], stats['unchanged'], stats['superseded']))
+    for name, _, _ in tracing.STAGES:
+        s = stats[name + '_ms']
+        print("%-20s p50 %6.1f ms p99 %6.1f ms max %6.1f ms" % (name, s['p50'], s['p99'], s['max']))
+
+    from alphabot.Alphabot import Alphabot
+    from wii_balance.WiiBoard import MassSample
+    calls = int(calls)
+    bot = Alphabot()
+    samples = [MassSample(20 + (n % 7), 10, 20, 10, timestamp=time.monotonic_ns(), seq=n) for n in range(calls)]
+    for name in ("off", "on"):
+        if name == "off":
+            tracing.disable()
+        else:
+            tracing.enable()
+        start = time.perf_counter()
+        for sample in samples:
+            bot.mass_to_velocity(sample)
+            bot.drive()
+        elapsed = time.perf_counter() - start
+        print("tracing %-3s %5.2f us per mass_to_velocity + drive" % (name, elapsed / calls * 1e6))
+    tracing.disable()
+
+def telemetry_tick(seconds=5, tick_ms=20, path=None):
+    """
+    Measures the read_wii_data + drive_alphabot + honk tick with telemetry off,
+    with the flight recorder alone and with the files written, on the fake
+    hardware and a packet log (a synthetic one by default) replayed in real time
+    """
+    import os
+    import tempfile
+    import hardware
+    hardware.select("fake")
+    import telemetry
+    from Histogram import Histogram
+    from wii_balance.Replay import NullSocket, PacketLog, ReplaySocket
+
+    seconds = float(seconds)
+    tick = float(tick_ms) / 1000
+    directory = tempfile.mkdtemp()
+    if path is None:
+        path = os.path.join(directory, "board.log")
+        fake_log(path, random.Random(0), int(seconds * 3 * 100) + 300)
+    import tasks
+    board = tasks.wiiBoard
+    board.cache_path = None
+    board.attach(NullSocket(), ReplaySocket(PacketLog(path), realtime=True))
+    board.calibrate()
+    board.start_reader()
+
+    for mode in ("off", "flight", "files"):
+        if mode == "off":
+            telemetry.disable()
+        else:
+            telemetry.enable(os.path.join(directory, "telemetry") if mode == "files" else None)
+        duration = Histogram()
+        end = time.monotonic() + seconds
+        next_tick = time.monotonic()
+        while time.monotonic() < end:
+            start = time.perf_counter_ns()
+            tasks.read_wii_data()
+            tasks.drive_alphabot()
+            tasks.honk()
+            duration.record(time.perf_counter_ns() - start)
+            next_tick += tick
+            time.sleep(max(next_tick - time.monotonic(), 0))
+        rec = telemetry.recorder
+        if rec is not None:
+            rec.stop()  # the last batch
+        s = duration.summary()
+        print("%-6s tick p50 %5.0f us p99 %5.0f us max %6.0f us over %d ticks%s" %
+              (mode, s['p50'], s['p99'], s['max'], s['count'],
+               "" if rec is None else ", %d records, %d written, %d dropped" % (rec.emitted, rec.written, rec.dropped)))
+    board.close()
+    telemetry.disable()
+
+BENCHMARKS = {
+    'tick_jitter': tick_jitter,
+    'kernel_tick': kernel_tick,
+    'wii_mass_decode': wii_mass_decode,
+    'wii_packet_allocs': wii_packet_allocs,
+    'wii_replay': wii_replay,
+    'wii_first_sample': wii_first_sample,
+    'wii_filters': wii_filters,
+    'multi_board': multi_board,
+    'velocity_map': velocity_map,
+    'gpio_calls': gpio_calls,
+    'kernel_loop': kernel_loop,
+    'collision_stop': collision_stop,
+    'camera_frames': camera_frames,
+    'camera_obstacles': camera_obstacles,
+    'servo_writes': servo_writes,
+    'sensor_latency': sensor_latency,
+    'telemetry_tick': telemetry_tick,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print("usage: python benchmarks.py <%s> [args...]" % "|".join(BENCHMARKS))
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](*sys.argv[2:])
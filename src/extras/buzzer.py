@@ -1,4 +1,5 @@
-import RPi.GPIO as GPIO
+# Turns the buzzer off: python -m extras.buzzer (from src)
+from hardware import GPIO
 GPIO.setwarnings(False)
 GPIO.setmode(GPIO.BCM)
 buzzer = 4
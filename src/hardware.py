@@ -0,0 +1,259 @@
+"""
+Hardware backend of the robot: the Raspberry Pi drivers or an in-process fake
+
+Pick it with the ALPHABOT_HARDWARE environment variable (pi or fake) before the
+first import, or call select() before importing Alphabot and Camera. By default
+(auto) it uses the Pi drivers, or the fake when RPi.GPIO isn't installed. The modules
+use hardware.GPIO, hardware.ServoKit and hardware.PiCamera in place of
+RPi.GPIO, adafruit_servokit and picamera.
+
+The fake records every pin write, PWM change and servo command with its
+monotonic time, and its inputs are set with GPIO.set_input, so the whole kernel
+loop runs on any machine.
+"""
+from collections import deque
+import logging
+import os
+import threading
+import time
+
+# initialize the logger
+logger = logging.getLogger(__name__)
+handler = logging.StreamHandler() # or RotatingFileHandler
+handler.setFormatter(logging.Formatter('[%(asctime)s][%(name)s][%(levelname)s] %(message)s'))
+logger.addHandler(handler)
+logger.setLevel(logging.INFO) # or DEBUG
+
+BACKENDS = ("auto", "pi", "fake")
+RECORD_CAPACITY = 100000    # writes the fake keeps, the oldest are dropped
+
+class FakeGPIO:
+    """
+    Same calls and constants as RPi.GPIO. Every write is appended to records as
+    (monotonic ns, kind, pin, value), kind being setup, output, duty or servo
+    """
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self, capacity=RECORD_CAPACITY):
+        self.records = deque(maxlen=capacity)
+        self.lock = threading.Lock()
+        self.mode = None
+        self.modes = {}     # pin -> OUT or IN
+        self.levels = {}    # pin -> level of the outputs and of the simulated inputs
+        self.events = {}    # pin -> (edge, callbacks)
+        self.counts = {'setup': 0, 'output': 0, 'duty': 0, 'servo': 0}
+        self.calls = 0      # output and duty calls, what reaches the pins
+
+    def record(self, kind, pin, value):
+        with self.lock:
+            self.records.append((time.monotonic_ns(), kind, pin, value))
+            self.counts[kind] += 1
+            if kind in ('output', 'duty'):
+                self.calls += 1
+
+    def reset(self):
+        with self.lock:
+            self.records.clear()
+            for kind in self.counts:
+                self.counts[kind] = 0
+            self.calls = 0
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, mode, pull_up_down=None, initial=None):
+        for p in pin if isinstance(pin, (list, tuple)) else (pin,):
+            self.modes[p] = mode
+            if mode == self.IN:
+                # Pulled up unless told otherwise, like the IR sensors (low = obstacle)
+                self.levels.setdefault(p, self.LOW if pull_up_down == self.PUD_DOWN else self.HIGH)
+            elif initial is not None:
+                self.levels[p] = initial
+            self.record('setup', p, mode)
+
+    def output(self, pin, level):
+        if isinstance(pin, (list, tuple)):
+            levels = level if isinstance(level, (list, tuple)) else [level] * len(pin)
+            for p, l in zip(pin, levels):
+                self.levels[p] = l
+            self.record('output', tuple(pin), tuple(levels))
+        else:
+            self.levels[pin] = level
+            self.record('output', pin, level)
+
+    def input(self, pin):
+        return self.levels.get(pin, self.HIGH)
+
+    def set_input(self, pin, level):
+        """
+        Simulate an input pin changing, calling its event callbacks on an edge
+        """
+        previous = self.levels.get(pin, self.HIGH)
+        self.levels[pin] = level
+        if pin not in self.events or previous == level:
+            return
+        edge, callbacks = self.events[pin]
+        if edge == self.BOTH or edge == (self.RISING if level else self.FALLING):
+            for callback in list(callbacks):
+                callback(pin)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.events[pin] = (edge, [callback] if callback else [])
+
+    def add_event_callback(self, pin, callback):
+        self.events[pin][1].append(callback)
+
+    def remove_event_detect(self, pin):
+        self.events.pop(pin, None)
+
+    def cleanup(self, pin=None):
+        self.events.clear()
+        self.modes.clear()
+
+    def PWM(self, pin, frequency):
+        return FakePWM(self, pin, frequency)
+
+class FakePWM:
+    def __init__(self, gpio, pin, frequency):
+        self.gpio = gpio
+        self.pin = pin
+        self.frequency = frequency
+        self.duty = 0
+
+    def start(self, duty):
+        self.duty = duty
+        self.gpio.record('duty', self.pin, duty)
+
+    def ChangeDutyCycle(self, duty):
+        self.duty = duty
+        self.gpio.record('duty', self.pin, duty)
+
+    def ChangeFrequency(self, frequency):
+        self.frequency = frequency
+
+    def stop(self):
+        self.ChangeDutyCycle(0)
+
+class FakeServo:
+    def __init__(self, gpio, channel, write_s=0.0):
+        self.gpio = gpio
+        self.channel = channel
+        self.write_s = write_s
+        self._angle = None
+
+    @property
+    def angle(self):
+        return self._angle
+
+    @angle.setter
+    def angle(self, value):
+        if self.write_s:
+            time.sleep(self.write_s)
+        self._angle = value
+        self.gpio.record('servo', self.channel, value)
+
+class FakeServoKit:
+    """
+    Same interface as adafruit_servokit.ServoKit, the servo commands go to the fake GPIO records.
+    Each angle write takes write_s, like the I2C transaction would
+    """
+    write_s = 0.0
+
+    def __init__(self, channels=16, **kwargs):
+        self.servo = [FakeServo(GPIO, channel, self.write_s) for channel in range(channels)]
+
+class FakePiCamera:
+    """
+    Same interface as picamera.PiCamera for what the robot uses. capture waits for
+    the next frame at the framerate and writes a uniform frame with the frame number as
+    value, or whatever scene draws
+    """
+    def __init__(self, resolution=(640, 480), framerate=30, **kwargs):
+        self.resolution = resolution
+        self.framerate = framerate
+        self.previewing = False
+        self.closed = False
+        self.frames = 0
+        self.next_frame = 0     # monotonic ns the next frame is ready
+        self.scene = None       # called as scene(frame_array, n) to draw the frames, if set
+
+    def capture(self, output, format='rgb', use_video_port=False, **kwargs):
+        # The sensor runs free at the framerate, a capture waits for its next frame
+        period = int(1e9 / self.framerate)
+        now = time.monotonic_ns()
+        if not self.next_frame:
+            self.next_frame = now
+        elif now > self.next_frame:
+            self.next_frame += ((now - self.next_frame) // period + 1) * period
+        if now < self.next_frame:
+            time.sleep((self.next_frame - now) / 1e9)
+        self.next_frame += period
+        if self.scene is not None:
+            self.scene(output, self.frames)
+        else:
+            output[...] = self.frames % 256
+        self.frames += 1
+
+    def start_preview(self, **kwargs):
+        self.previewing = True
+
+    def stop_preview(self):
+        self.previewing = False
+
+    def close(self):
+        self.closed = True
+
+def select(name):
+    """
+    Loads a backend (auto, pi or fake) into GPIO, ServoKit and PiCamera.
+    Modules that already imported them keep the previous one
+    """
+    global BACKEND, GPIO, ServoKit, PiCamera
+    if name not in BACKENDS:
+        raise ValueError("Unknown hardware backend %r, expected one of %s" % (name, ", ".join(BACKENDS)))
+    if name == "auto":
+        try:
+            import RPi.GPIO
+        except ImportError as e:
+            logger.warning("Pi drivers not available (%s)", e)
+            select("fake")
+            return
+        # On a Pi, a missing camera or servo driver is an error, not a reason to fake
+        try:
+            select("pi")
+        except ImportError as e:
+            raise ImportError("RPi.GPIO is installed but %s is missing, install it or set "
+                              "ALPHABOT_HARDWARE=fake" % e.name) from e
+        return
+    if name == "pi":
+        # All three or none, a failed import leaves the current backend
+        import RPi.GPIO as gpio
+        from adafruit_servokit import ServoKit as kit
+        from picamera import PiCamera as camera
+        GPIO, ServoKit, PiCamera = gpio, kit, camera
+    else:
+        GPIO = FakeGPIO()
+        ServoKit = FakeServoKit
+        PiCamera = FakePiCamera
+        logger.info("Using the fake hardware backend")
+    BACKEND = name
+
+BACKEND = None
+GPIO = None
+ServoKit = None
+PiCamera = None
+select(os.environ.get("ALPHABOT_HARDWARE", "auto"))
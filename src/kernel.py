@@ -1,83 +1,335 @@
-from Task import Task
+"""
+Fixed-priority tick scheduler of the robot
+
+A Ticker thread calls Sched_Interrupt on the ticks that have releases. The released
+tasks are dispatched in priority order (the order they were added): blocking ones
+go to the worker pool, the others run to completion on the tick thread, one after
+the other. There is no preemption, so a long non-blocking task delays every task
+released behind it, the higher priority ones of the next ticks included. Anything
+that can take more than a fraction of a tick belongs on the pool (blocking=True).
+"""
+from Task import Overlap, Task
+from ticker import NS_PER_MS, Ticker
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import signal
+import sys
 import threading
-from tasks import all_actions, init_camera, read_wii_data, drive_alphabot, connect_to_board, honk
+import telemetry
 import time
+import tracing
+
+# initialize the logger
+logger = logging.getLogger(__name__)
+handler = logging.StreamHandler() # or RotatingFileHandler
+handler.setFormatter(logging.Formatter('[%(asctime)s][%(name)s][%(levelname)s] %(message)s'))
+logger.addHandler(handler)
+logger.setLevel(logging.INFO) # or DEBUG
 
-timer = None
-tasks = []
-current_task = 0
+TICK_MS = 100       # tick period in milliseconds
+POOL_WORKERS = 2    # threads available to blocking tasks
+STATS_INTERVAL = 60 # seconds between timing summary dumps
 
-def set_interrupts():
-    global timer
-    timer = threading.Timer(0.1, Sched_Interrupt)
-    timer.start()
+ticker = None
+tick_ns = TICK_MS * NS_PER_MS
+pool = None
+poolLock = threading.Lock()
+schedLock = threading.Lock()    # protects the task table and the ready queue
+NEVER = sys.maxsize # next_release of a one shot task that was released
 
-def stop_interrupts():
-    global timer
-    timer.cancel()
+# Registered tasks by priority, in the order they were added. Sched_Schedule scans
+# it on the ticks that have releases: the robot has a handful of tasks, most of
+# them due every tick, where a scan costs less than keeping a release heap
+tasks = {}
+readyQueue = []     # (priority, task) of the released tasks, sorted on dispatch
+next_priority = 0
+now_tick = 0
+stopping = False    # set by Sched_Stop
+now_tick_ns = 0     # time of now_tick, the latest tick the ticker delivered
 
-def Sched_Init():
+def Sched_Init(tick_ms=TICK_MS, workers=POOL_WORKERS):
+    global ticker, pool, tick_ns, stopping
+    stopping = False
     # TODO configure interrupts and stuff on PI
-    set_interrupts()
-    return
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sched-worker")
+    ticker = Ticker(tick_ms, Sched_Interrupt)
+    tick_ns = ticker.period_ns
+    ticker.start()
+    global now_tick_ns
+    with schedLock:
+        # now_tick is the tick the new ticker started on, unless it already delivered one
+        if now_tick_ns < ticker.start_ns:
+            now_tick_ns = ticker.start_ns
 
-def Sched_AddTask(func, delay, period):
-    global current_task
-    tasks.append(Task(func, delay, period))
-    current_task = len(tasks)
+def Sched_Reset():
+    """
+    Removes every task and rewinds the tick count
+    """
+    global next_priority, now_tick
+    with schedLock:
+        tasks.clear()
+        readyQueue.clear()
+        next_priority = 0
+        now_tick = 0
 
-def Sched_Schedule():
-    for task in tasks:
-        if task.func == None:
-            continue
-        if task.delay > 0:
-            task.delay -= 1
-        else:
-            task.counter += 1
-            task.delay = task.period - 1
+def Sched_Stop():
+    global stopping
+    # Coalesced reruns stop here, so the pool threads can finish
+    stopping = True
+    if ticker is not None:
+        ticker.stop()
+    if pool is not None:
+        pool.shutdown(wait=False)
 
-def Sched_Dispatch():
-    global current_task
-    prev_task = current_task
-    for i in range(current_task):
-        task = tasks[i]
-        if task.func == None or task.counter == 0:
-            continue
-        task.counter = 0
-        current_task = i
+def ms_to_ticks(ms):
+    """
+    Converts a duration in milliseconds to a number of ticks. A positive
+    duration is at least one tick, 0 ticks means a one shot task
+    """
+    ticks = int(round(ms * NS_PER_MS / tick_ns))
+    return max(ticks, 1) if ms > 0 else ticks
+
+def Sched_AddTask(func, delay, period, blocking=False, overlap=Overlap.SKIP):
+    """
+    Adds a task to the scheduler. Blocking tasks run on the worker pool so they
+    don't hold the tick thread, overlap decides what happens when such a task is
+    released while its previous run is still going.
+    Returns the task, which can be passed to Sched_CancelTask
+    """
+    global next_priority
+    task = Task(func, delay, period, blocking, overlap)
+    with schedLock:
+        task.priority = next_priority
+        next_priority += 1
+        # The first release happens delay ticks after the next one
+        task.next_release = Sched_CurrentTick() + delay + 1
+        tasks[task.priority] = task
+    if ticker is not None:
+        ticker.wake()   # the ticker may be sleeping past the new release
+    return task
 
-        # enable interrupts
-        set_interrupts()
+def Sched_CurrentTick():
+    """
+    Returns the current tick by the clock. The ticker sleeps until the next
+    release, so now_tick can be many ticks behind. Must be called with schedLock held
+    """
+    if ticker is None or not ticker.running or not now_tick_ns:
+        return now_tick
+    return now_tick + max(time.monotonic_ns() - now_tick_ns, 0) // tick_ns
+
+def Sched_CancelTask(task):
+    """
+    Removes a task from the scheduler. A release it already had is dropped on dispatch
+    """
+    with schedLock:
+        task.cancelled = True
+        tasks.pop(task.priority, None)
+
+def Sched_Submit(task):
+    """
+    Runs a blocking task on the worker pool, applying its overlap policy
+    """
+    with poolLock:
+        if stopping:
+            return
+        if task.running:
+            if task.overlap == Overlap.COALESCE:
+                task.pending = True
+                task.coalesced += 1
+            else:
+                task.skipped += 1
+            return
+        task.running = True
+    pool.submit(Sched_RunBackground, task)
+
+def Sched_RunBackground(task):
+    while True:
+        try:
+            Sched_Run(task)
+        except Exception:
+            logger.exception("Background task %s failed", task.name())
+        with poolLock:
+            if not task.pending or task.cancelled or stopping:
+                task.running = False
+                return
+            task.pending = False
+
+def Sched_Run(task):
+    """
+    Runs a task and records its start latency, execution time and deadline miss
+    """
+    release = task.release_ns   # later releases may overwrite it while running
+    start = time.monotonic_ns()
+    try:
         task.func()
-        # disable interrupts
-        stop_interrupts()
+    finally:
+        end = time.monotonic_ns()
+        task.runs += 1
+        task.latency.record(start - release)
+        task.exec.record(end - start)
+        # The deadline is the next release (one tick for one shot tasks)
+        if end > release + max(task.period, 1) * tick_ns:
+            task.misses += 1
+
+def Sched_Report():
+    """
+    Returns the releases of blocking tasks that were skipped or coalesced
+    """
+    return {
+        task.name(): {'skipped': task.skipped, 'coalesced': task.coalesced}
+        for task in list(tasks.values()) if task.blocking
+    }
+
+def Sched_TaskStats():
+    """
+    Returns the timing statistics of every task, times in microseconds
+    """
+    return {task.name(): task.stats() for task in list(tasks.values())}
 
-        current_task = prev_task
+def Sched_DumpStats():
+    """
+    Logs a summary of the tick source and task timings
+    """
+    logger.info("Tick: %s", ticker.stats())
+    for name, stats in Sched_TaskStats().items():
+        logger.info("%s: runs %d misses %d dropped %d skipped %d coalesced %d", name,
+                    stats['runs'], stats['misses'], stats['dropped'], stats['skipped'], stats['coalesced'])
+        for key in ('latency_us', 'exec_us'):
+            s = stats[key]
+            logger.info("    %s min %.0f p50 %.0f p99 %.0f max %.0f", key, s['min'], s['p50'], s['p99'], s['max'])
+
+def Sched_Schedule(ticks=1, now_ns=None):
+    """
+    Advances the scheduler by ticks and releases every task that became due.
+    now_ns is the nominal time of the current tick
+    """
+    global now_tick, now_tick_ns
+    if now_ns is None:
+        now_ns = time.monotonic_ns()
+    with schedLock:
+        now_tick += ticks
+        now_tick_ns = now_ns
+        for task in tasks.values():
+            release = task.next_release
+            if release > now_tick:
+                continue
+
+            if task.period > 0:
+                # Every release up to now, in a single step if ticks were missed
+                count = (now_tick - release) // task.period + 1
+                latest = release + (count - 1) * task.period
+                task.next_release = latest + task.period
+            else:
+                count = 1
+                latest = release
+                task.next_release = NEVER   # removed once dispatched
+            task.counter += count
+            task.release_ns = now_ns - (now_tick - latest) * tick_ns
+
+            if not task.ready:
+                task.ready = True
+                readyQueue.append((task.priority, task))
+
+def Sched_NextRelease():
+    """
+    Returns the number of ticks until the next task release, or None if there is none
+    """
+    with schedLock:
+        release = min((task.next_release for task in tasks.values()), default=NEVER)
+        if release == NEVER:
+            return None
+        return max(release - now_tick, 1)
+
+def Sched_Dispatch():
+    """
+    Runs the released tasks in priority order (the order they were added), each
+    to completion
+    """
+    with schedLock:
+        if not readyQueue:
+            return
+        readyQueue.sort()
+        batch = readyQueue[:]
+        readyQueue.clear()
+        for priority, task in batch:
+            task.ready = False
+            task.dropped += task.counter - 1    # activations that were never run
+            task.counter = 0
+
+    for priority, task in batch:
+        if task.cancelled:
+            continue
+
+        if task.blocking:
+            # Runs on the worker pool, the tick thread moves on
+            Sched_Submit(task)
+        else:
+            # The tick thread runs the task, ticks that expire meanwhile are
+            # caught up by the next Sched_Interrupt
+            try:
+                Sched_Run(task)
+            except Exception:
+                logger.exception("Task %s failed", task.name())
 
         # one shot task
         if task.period == 0:
-            tasks.remove(task)
+            Sched_CancelTask(task)
+
+# Tasks run by the robot, in priority order: (function in tasks.py, delay ms, period ms, Sched_AddTask options)
+TASK_SET = [
+    ("connect_to_board", 0, 1000, {}),
+    # One shot, starts the frame capture thread
+    ("init_camera", 0, 0, {'blocking': True}),
+    ("read_wii_data", 0, 100, {}),
+    ("drive_alphabot", 0, 100, {}),
+    ("honk", 0, 100, {}),
+    # The IR edge interrupts keep isColliding up to date, this only resyncs it
+    ("check_collision", 0, 1000, {}),
+]
 
 def setup():
+    """
+    Starts the scheduler with TASK_SET. Returns the tasks module
+    """
+    import tasks as robotTasks
+
     print("setting up")
     # TODO initialize pins and bot
-    #init_camera()
+
+    # ALPHABOT_TELEMETRY: unset for the flight recorder alone, a directory to also write files, or off
+    telemetryMode = os.environ.get("ALPHABOT_TELEMETRY")
+    if telemetryMode != "off":
+        telemetry.enable(telemetryMode or None)
 
     Sched_Init()
 
-    # TODO this is using deciseconds but needs to use ms later
-    Sched_AddTask(connect_to_board, 0, 100)
-    Sched_AddTask(read_wii_data, 0, 1)
-    Sched_AddTask(drive_alphabot, 0, 1)
-    Sched_AddTask(honk, 0, 1)
+    for name, delay, period, options in TASK_SET:
+        Sched_AddTask(getattr(robotTasks, name), ms_to_ticks(delay), ms_to_ticks(period), **options)
+    return robotTasks
 
-def Sched_Interrupt():
-    stop_interrupts()
-    Sched_Schedule()
+def Sched_Interrupt(ticks=1):
+    # Advance every tick that elapsed, so late ticks keep the task phases
+    Sched_Schedule(ticks, ticker.deadline_ns)
     Sched_Dispatch()
-    set_interrupts()
+    # Let the ticker sleep straight to the next release
+    return Sched_NextRelease()
 
-setup()
+if __name__ == "__main__":
+    robotTasks = setup()
+    # kill -USR1 <pid> dumps the telemetry flight recorder
+    if telemetry.recorder is not None and hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: telemetry.recorder.dump())
 
-while True:
-    time.sleep(5) # keep it running
+    while True:
+        time.sleep(STATS_INTERVAL) # keep it running
+        Sched_DumpStats()
+        # The measured board report rate, to match the read_wii_data period to it
+        logger.info("Board reports: %s", robotTasks.wiiBoard.report_stats())
+        if telemetry.recorder is not None:
+            logger.info("Telemetry: %s", telemetry.recorder.stats())
+        tracer = tracing.tracer
+        if tracer is not None:
+            logger.info("Sensor to motor latency: %s", tracer.stats())
+            if tracing.path:
+                tracer.export_file(tracing.path)
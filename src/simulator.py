@@ -0,0 +1,359 @@
+"""
+Offline scheduler simulator and schedulability analysis
+
+Runs a kernel task set on a virtual clock with declared (or measured) worst-case
+execution times, so task periods can be tuned without the robot.
+
+Throughput: ticks without releases are skipped, so sparse task sets simulate
+at ~10^8 ticks/s. Every tick with a release costs one pass of the Python
+dispatch loop, so the dense path is the limit: TASK_SET, which has releases on
+every 100 ms tick, runs at ~80k ticks/s (~65k preemptive) on a desktop CPU,
+about a day of robot time in a second. Millions of dense ticks per second would
+need the loop batched per hyperperiod, which this doesn't do.
+
+usage: python simulator.py [seconds] [preemptive] [task=wcet_ms ...]
+
+Without "preemptive" the simulation follows kernel.py. "preemptive" models the
+original timer interrupt kernel instead, to compare against it.
+"""
+import math
+import sys
+import time
+
+from Histogram import Histogram
+from Task import Overlap
+from ticker import NS_PER_MS
+import heapq
+
+TICK_MS = 100               # same defaults as kernel.py
+POOL_WORKERS = 2
+DEFAULT_WCET_MS = 1.0
+IDLE_PRIORITY = sys.maxsize
+
+class SimTask:
+    def __init__(self, name, delay, period, wcet_ns, priority, blocking=False, overlap=Overlap.SKIP):
+        self.name = name
+        self.period = period    # ticks
+        self.wcet_ns = wcet_ns
+        self.priority = priority
+        self.blocking = blocking
+        self.overlap = overlap
+        self.next_release = delay + 1
+        self.counter = 0
+        self.release_ns = 0
+        self.removed = False
+
+        # Worker pool state of blocking tasks
+        self.worker = None
+        self.start_ns = 0       # start of the latest run
+        self.end_ns = 0         # end of the latest run
+
+        self.runs = 0
+        self.misses = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.coalesced = 0
+        self.latency = Histogram()  # release -> start
+        self.response = Histogram() # release -> end
+
+    def record(self, release, start, end, tick_ns):
+        self.runs += 1
+        self.latency.record(start - release)
+        self.response.record(end - release)
+        if end > release + max(self.period, 1) * tick_ns:
+            self.misses += 1
+
+    def stats(self):
+        return {
+            'runs': self.runs,
+            'misses': self.misses,
+            'dropped': self.dropped,
+            'skipped': self.skipped,
+            'coalesced': self.coalesced,
+            'jitter_us': (self.latency.max - self.latency.min) / 1e3,
+            'latency_us': self.latency.summary(),
+            'response_us': self.response.summary(),
+        }
+
+class Job:
+    __slots__ = ('task', 'release', 'start', 'remaining')
+
+    def __init__(self, task, start):
+        self.task = task
+        self.release = task.release_ns
+        self.start = start
+        self.remaining = task.wcet_ns
+
+class Frame:
+    """
+    One Sched_Dispatch call: scans the tasks with a priority higher than bound
+    """
+    __slots__ = ('bound', 'cursor', 'job')
+
+    def __init__(self, bound):
+        self.bound = bound
+        self.cursor = 0
+        self.job = None
+
+class Simulator:
+    """
+    Simulates Sched_Schedule/Sched_Dispatch on a virtual clock.
+
+    By default (preemptive=False) it follows kernel.py: the tick thread runs each task
+    to completion and catches up the ticks it missed. preemptive=True is only a
+    comparison with the original timer interrupt kernel, which kernel.py no longer
+    models: ticks fire while a task runs and the nested dispatch preempts it with
+    higher priority tasks (the ones below current_task).
+    Ticks without releases are skipped, so idle time costs nothing to simulate.
+    """
+    def __init__(self, tick_ms=TICK_MS, preemptive=False, workers=POOL_WORKERS):
+        self.tick_ns = int(tick_ms * NS_PER_MS)
+        self.preemptive = preemptive
+        self.tasks = []
+        self.releases = []      # min-heap of (tick, priority)
+        self.ready = []
+        self.workers = [0] * workers    # time each worker becomes free
+        self.now = 0
+        self.tick = 0
+        self.current_task = IDLE_PRIORITY
+        self.frames = []
+
+    @classmethod
+    def from_task_set(cls, task_set, wcet_ms=None, tick_ms=TICK_MS, **kwargs):
+        """
+        Builds a simulator from a kernel.TASK_SET style list, with delays and periods in ms.
+        wcet_ms maps task names to their worst-case execution time
+        """
+        wcet_ms = wcet_ms or {}
+        sim = cls(tick_ms, **kwargs)
+        for name, delay, period, options in task_set:
+            sim.Sched_AddTask(name, sim.ms_to_ticks(delay), sim.ms_to_ticks(period),
+                              wcet_ms.get(name, DEFAULT_WCET_MS), **options)
+        return sim
+
+    def ms_to_ticks(self, ms):
+        """
+        Same as kernel.ms_to_ticks: a positive duration is at least one tick,
+        0 ticks means a one shot task
+        """
+        ticks = int(round(ms * NS_PER_MS / self.tick_ns))
+        return max(ticks, 1) if ms > 0 else ticks
+
+    def Sched_AddTask(self, name, delay, period, wcet_ms=DEFAULT_WCET_MS, blocking=False, overlap=Overlap.SKIP):
+        task = SimTask(name, self.tick + delay, period, int(wcet_ms * NS_PER_MS), len(self.tasks), blocking, overlap)
+        self.tasks.append(task)
+        heapq.heappush(self.releases, (task.next_release, task.priority))
+        return task
+
+    def Sched_Schedule(self, tick):
+        releases = self.releases
+        while releases and releases[0][0] <= tick:
+            release, priority = releases[0]
+            task = self.tasks[priority]
+            if task.removed:
+                heapq.heappop(releases)
+                continue
+            if task.period > 0:
+                count = (tick - release) // task.period + 1
+                latest = release + (count - 1) * task.period
+                task.next_release = latest + task.period
+                heapq.heapreplace(releases, (task.next_release, priority))
+            else:
+                heapq.heappop(releases)
+                count = 1
+                latest = release
+            task.counter += count
+            task.release_ns = latest * self.tick_ns
+
+    def Sched_Dispatch(self):
+        frame = Frame(self.current_task)
+        self.frames.append(frame)
+        self._advance(frame)
+
+    def _advance(self, frame):
+        """
+        Continues the dispatch loop of a frame until it starts a task or runs out of them
+        """
+        tasks = self.tasks
+        for i in range(frame.cursor, min(frame.bound, len(tasks))):
+            task = tasks[i]
+            if task.removed or task.counter == 0:
+                continue
+            task.dropped += task.counter - 1
+            task.counter = 0
+            frame.cursor = i + 1
+            if task.blocking:
+                self._submit(task)
+                if task.period == 0:
+                    task.removed = True
+                continue
+            frame.job = Job(task, self.now)
+            self.current_task = i
+            return
+        self.frames.pop()
+        self.current_task = frame.bound
+
+    def _complete(self, frame):
+        job = frame.job
+        task = job.task
+        frame.job = None
+        task.record(job.release, job.start, self.now, self.tick_ns)
+        if task.period == 0:
+            task.removed = True
+        self.current_task = frame.bound
+        self._advance(frame)
+
+    def _submit(self, task):
+        """
+        Runs a blocking task on the simulated worker pool, with its overlap policy
+        """
+        now = self.now
+        if task.end_ns > now:
+            if task.overlap == Overlap.SKIP:
+                task.skipped += 1
+                return
+            task.coalesced += 1
+            if task.start_ns > now:
+                return  # a follow-up run is already pending
+            # The worker runs the follow-up as soon as the current run ends
+            start = task.end_ns
+        else:
+            task.worker = min(range(len(self.workers)), key=self.workers.__getitem__)
+            start = max(now, self.workers[task.worker])
+        end = start + task.wcet_ns
+        task.start_ns = start
+        task.end_ns = end
+        self.workers[task.worker] = end
+        task.record(task.release_ns, start, end, self.tick_ns)
+
+    def run(self, seconds):
+        """
+        Simulates the given number of virtual seconds. Returns the report
+        """
+        tick_ns = self.tick_ns
+        last_tick = self.tick + int(seconds * 1e9) // tick_ns
+        frames = self.frames
+        wall = time.perf_counter()
+        while True:
+            job = frames[-1].job if frames else None
+            release = self.releases[0][0] if self.releases else None
+            if job is not None:
+                finish = self.now + job.remaining
+                if not self.preemptive or release is None or finish <= release * tick_ns:
+                    self.now = finish
+                    self._complete(frames[-1])
+                    continue
+                # A tick with a release interrupts the running task
+                if release > last_tick:
+                    break
+                job.remaining = finish - release * tick_ns
+                self.now = release * tick_ns
+                self.tick = release
+                self.Sched_Schedule(release)
+                self.Sched_Dispatch()
+                continue
+
+            if release is None:
+                break
+            # Idle (or late): the ticker wakes at the next release or right away
+            wake = max(release * tick_ns, self.now)
+            if wake // tick_ns > last_tick:
+                break
+            self.now = wake
+            self.tick = wake // tick_ns
+            self.Sched_Schedule(self.tick)
+            self.Sched_Dispatch()
+        wall = time.perf_counter() - wall
+        self.tick = last_tick
+        self.now = max(self.now, last_tick * tick_ns)
+        return self.report(wall)
+
+    def report(self, wall=0.0):
+        return {
+            'ticks': self.tick,
+            'virtual_s': self.now / 1e9,
+            'wall_s': wall,
+            'ticks_per_s': self.tick / wall if wall else 0.0,
+            'preemptive': self.preemptive,
+            'tasks': {task.name: task.stats() for task in self.tasks},
+            'analysis': analyze(self.tasks, self.tick_ns, self.preemptive),
+        }
+
+def response_time(task, higher, blocking, deadline):
+    """
+    Worst-case response time by fixed point iteration, None if it exceeds the deadline
+    """
+    r = task.wcet_ns + blocking
+    while True:
+        nxt = task.wcet_ns + blocking + sum(math.ceil(r / t) * c for t, c in higher)
+        if nxt > deadline:
+            return None
+        if nxt == r:
+            return r
+        r = nxt
+
+def analyze(tasks, tick_ns, preemptive=False):
+    """
+    Schedulability of the periodic tasks that run on the tick thread.
+    Blocking tasks run on the worker pool and don't interfere with them
+    """
+    periodic = [t for t in tasks if t.period > 0 and not t.blocking and not t.removed]
+    n = len(periodic)
+    utilization = sum(t.wcet_ns / (t.period * tick_ns) for t in periodic)
+
+    def rta(order):
+        result = {}
+        for i, task in enumerate(order):
+            higher = [(t.period * tick_ns, t.wcet_ns) for t in order[:i]]
+            # Without preemption a lower priority task that just started blocks this one
+            blocking = 0 if preemptive else max([t.wcet_ns for t in order[i + 1:]] or [0])
+            r = response_time(task, higher, blocking, task.period * tick_ns)
+            result[task.name] = None if r is None else r / 1e3
+        return result
+
+    kernel_wcrt = rta(sorted(periodic, key=lambda t: t.priority))
+    rm_wcrt = rta(sorted(periodic, key=lambda t: (t.period, t.priority)))
+    bound = n * (2 ** (1 / n) - 1) if n else 1.0
+    return {
+        'utilization': utilization,
+        'rm_bound': bound,
+        'rm_bound_ok': utilization <= bound,
+        'rm_feasible': all(r is not None for r in rm_wcrt.values()),
+        'rm_wcrt_us': rm_wcrt,
+        'kernel_feasible': all(r is not None for r in kernel_wcrt.values()),
+        'kernel_wcrt_us': kernel_wcrt,
+        # U <= 1 is exact for preemptive EDF, only necessary without preemption
+        'edf_feasible': utilization <= 1.0,
+    }
+
+def wcet_from_stats(stats, key='max'):
+    """
+    Converts kernel.Sched_TaskStats() into a wcet_ms map, using the max (or p99) execution time
+    """
+    return {name: s['exec_us'][key] / 1e3 for name, s in stats.items()}
+
+def print_report(report):
+    print("Simulated %d ticks (%.1f s) in %.3f s: %.0f ticks/s%s" %
+          (report['ticks'], report['virtual_s'], report['wall_s'], report['ticks_per_s'],
+           " (preemptive, original kernel)" if report['preemptive'] else ""))
+    for name, s in report['tasks'].items():
+        print("%s: runs %d misses %d dropped %d skipped %d coalesced %d jitter %.0f us" %
+              (name, s['runs'], s['misses'], s['dropped'], s['skipped'], s['coalesced'], s['jitter_us']))
+        r = s['response_us']
+        print("    response_us min %.0f p50 %.0f p99 %.0f max %.0f" % (r['min'], r['p50'], r['p99'], r['max']))
+    a = report['analysis']
+    print("U = %.3f, RM bound %.3f (%s), RM %s, kernel priorities %s, EDF %s" % (
+        a['utilization'], a['rm_bound'], 'ok' if a['rm_bound_ok'] else 'exceeded',
+        'feasible' if a['rm_feasible'] else 'infeasible',
+        'feasible' if a['kernel_feasible'] else 'infeasible',
+        'feasible' if a['edf_feasible'] else 'infeasible'))
+    print("    kernel WCRT (us): %s" % a['kernel_wcrt_us'])
+
+if __name__ == "__main__":
+    from kernel import TASK_SET
+
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3600
+    preemptive = len(sys.argv) > 2 and sys.argv[2] == "preemptive"
+    wcet = dict((arg.split("=")[0], float(arg.split("=")[1])) for arg in sys.argv[2:] if "=" in arg)
+    sim = Simulator.from_task_set(TASK_SET, wcet, preemptive=preemptive)
+    print_report(sim.run(seconds))
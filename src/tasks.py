@@ -1,11 +1,34 @@
 from alphabot.Alphabot import Alphabot
 from alphabot.Camera import Camera
-from wii_balance.WiiBoard import ResponseType, WiiBoard
+from alphabot.Frames import FramePipeline
+from alphabot.Obstacles import ObstacleDetector
+from wii_balance.Filters import AutoTare, ExponentialFilter, MassFilter, MedianFilter
+from wii_balance.WiiBoard import BOARD_CACHE, MassSample, ResponseType, WiiBoard
+import logging
+import os
+import telemetry
 import time
 
+# initialize the logger
+logger = logging.getLogger(__name__)
+handler = logging.StreamHandler() # or RotatingFileHandler
+handler.setFormatter(logging.Formatter('[%(asctime)s][%(name)s][%(levelname)s] %(message)s'))
+logger.addHandler(handler)
+logger.setLevel(logging.INFO) # or DEBUG
+
 alphabot = Alphabot()
 cam = Camera()
-wiiBoard = WiiBoard()   # Initialize the board. TODO: Check if should be here
+# Latest camera frames, captured by a thread of their own, and the floor obstacles
+# seen in them (they stop the robot like the IR sensors). init_camera creates them,
+# without numpy the robot runs without camera obstacle detection
+frames = None
+obstacles = None
+# Initialize the board. TODO: Check if should be here
+# Set WIIBOARD_RECORD to a path to log every board packet for wii_balance/Replay.py
+wiiBoard = WiiBoard(reader=True, record=os.environ.get("WIIBOARD_RECORD"), cache=BOARD_CACHE)
+# The median removes spikes, the EMA the noise that makes the thresholds chatter
+massFilter = MassFilter([MedianFilter(5), ExponentialFilter(0.2)], tare=AutoTare())
+filterConnection = 0    # WiiBoard.attached_at of the samples in massFilter
 
 forward = False
 
@@ -34,32 +57,46 @@ def all_actions():
     action = (action + 1) % 5
 
 def init_camera():
+    global frames, obstacles
     cam.reset()
     cam.preview()
+    if frames is None:
+        try:
+            frames = FramePipeline(cam)
+            obstacles = ObstacleDetector(frames, alphabot)
+        except RuntimeError as e:
+            logger.warning("No camera obstacle detection: %s", e)
+            frames = None
+            return
+    frames.start()
+    obstacles.start()
 
 def read_wii_data():
-    # print("Reading wii data......")
-    # Read the balance board data
-    response = wiiBoard.read_data()
-    if (response != None):
-        respType = response["type"]
-        data = response["data"]
-        print("Response type:", respType)
-        if respType == ResponseType.STATUS:
-            print(f"{respType} - {data}")
-        elif respType == ResponseType.CALIBRATION:
-            print(f"{respType} - {data}")
-        elif respType == ResponseType.MASS:
-            print(f"{respType} - {data}")
-            alphabot.mass_to_velocity(data)
-            print(alphabot.vertDirection, alphabot.horizDirection, 
-                  alphabot.vertPower, alphabot.horizPower)
-        elif respType == ResponseType.BUTTON:
-            print(f"{respType} - {data}")
-            alphabot.setHonk(data)
-            print("Here")
-    else:
-        print("No Response")
+    # Drain everything the board sent since the last tick: every event, and the
+    # mass samples through the filter, acting only on the freshest one.
+    # Nothing is printed here, the records go to telemetry
+    global filterConnection
+    rec = telemetry.recorder
+    batch = wiiBoard.read_all()
+    if wiiBoard.attached_at != filterConnection:
+        # A new connection, maybe another board: nothing of the old one carries over
+        massFilter.reset()
+        filterConnection = wiiBoard.attached_at
+    for response in batch.events:
+        if rec is not None:
+            rec.emit('event', response.type, response.data)
+        if response.type == ResponseType.BUTTON:
+            alphabot.setHonk(response.data)
+    if len(batch):
+        masses = batch.masses
+        for i in range(0, len(masses), 4):
+            values = massFilter.update_values(masses[i:i + 4])
+        data = MassSample(*values, timestamp=batch.timestamps[-1], seq=batch.seqs[-1])
+        if rec is not None:
+            rec.emit('mass', data.seq, len(batch), batch.age_ms(), *values, massFilter.cop)
+        alphabot.mass_to_velocity(data)
+    if not batch.depth and rec is not None:
+        rec.count('no_response')
 
 def drive_alphabot():
     # print("Driving alpha bot.....")
@@ -68,8 +105,9 @@ def drive_alphabot():
     alphabot.drive()
 
 def connect_to_board():
-    print("Connecting to board...\n\n")
-    wiiBoard.connectToBoard()
+    # Returns right away, the board reconnects in the background
+    if not wiiBoard.connected:
+        wiiBoard.connectToBoard()
 
 def honk():
     # print("HONK HONK")
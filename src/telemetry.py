@@ -0,0 +1,214 @@
+"""
+Structured telemetry of the control loop
+
+The tasks emit small records, (monotonic ns, kind, values), instead of printing.
+emit only appends the record to the flight recorder, the latest FLIGHT_RECORDS
+records in memory, and to a bounded queue. A writer thread batches the queue to
+JSON lines files in a directory, rotated at MAX_BYTES like RotatingFileHandler
+does, so the control tick never waits for I/O. When the queue is full the record
+is dropped and counted, the tick doesn't wait for the writer either.
+
+Importing the module turns nothing on, recorder stays None until enable().
+kernel.setup() enables it from ALPHABOT_TELEMETRY: unset for the flight recorder
+alone, a directory to also write the files there, or off. dump() writes the
+flight recorder out on demand (the kernel does it on SIGUSR1).
+"""
+from collections import deque
+from enum import Enum
+from Histogram import Histogram
+import json
+import logging
+import os
+import threading
+import time
+
+# initialize the logger
+logger = logging.getLogger(__name__)
+handler = logging.StreamHandler() # or RotatingFileHandler
+handler.setFormatter(logging.Formatter('[%(asctime)s][%(name)s][%(levelname)s] %(message)s'))
+logger.addHandler(handler)
+logger.setLevel(logging.INFO) # or DEBUG
+
+QUEUE_CAPACITY  = 10000     # records waiting for the writer, newer ones are dropped past it
+FLIGHT_RECORDS  = 5000      # records kept in memory for dump(), ~50 s of the robot at full rate
+FLUSH_INTERVAL  = 0.5       # seconds between writer batches
+MAX_BYTES       = 5 * 1024 * 1024   # size of a file before it is rotated
+BACKUPS         = 5         # rotated files kept, telemetry.jsonl.1 is the newest
+FILE_NAME       = "telemetry.jsonl"
+
+# Names of the values of each kind of record
+FIELDS = {
+    'event': ('type', 'data'),
+    'mass': ('seq', 'samples', 'age_ms', 'top_right', 'bottom_right', 'top_left', 'bottom_left', 'cop'),
+    'velocity': ('seq', 'vert_diff', 'horiz_diff', 'vert_direction', 'vert_power', 'horiz_direction', 'horiz_power'),
+    'counters': ('counts',),
+}
+
+def _default(value):
+    if isinstance(value, Enum):
+        return value.name
+    if isinstance(value, bytes):
+        return value.hex()
+    return str(value)
+
+def encode(record):
+    """
+    Returns a record as a JSON line
+    """
+    timestamp, kind, values = record
+    fields = {'t': timestamp, 'kind': kind}
+    fields.update(zip(FIELDS.get(kind, ()), values))
+    return json.dumps(fields, separators=(',', ':'), default=_default) + "\n"
+
+class Telemetry:
+    def __init__(self, directory=None, capacity=QUEUE_CAPACITY, flight=FLIGHT_RECORDS,
+                 max_bytes=MAX_BYTES, backups=BACKUPS, interval=FLUSH_INTERVAL):
+        self.directory = directory
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.interval = interval
+        # deque appends and pops are atomic, emit takes no lock
+        self.queue = deque()
+        self.flight = deque(maxlen=flight)
+        self.counts = {}
+        self.written_counts = {}
+        self.countsLock = threading.Lock()  # the writer copies counts while the tick adds to them
+        self.thread = None
+        self.running = False
+        self.wakeEvent = threading.Event()
+        self.file = None
+        self.path = os.path.join(directory, FILE_NAME) if directory else None
+
+        self.emitted = 0
+        self.dropped = 0
+        self.written = 0
+        self.files = 0          # rotations
+        self.batch = Histogram()    # ns per writer batch
+
+    def emit(self, kind, *values):
+        record = (time.monotonic_ns(), kind, values)
+        self.flight.append(record)
+        self.emitted += 1
+        if self.path is not None:
+            if len(self.queue) < self.capacity:
+                self.queue.append(record)
+            else:
+                self.dropped += 1
+
+    def count(self, name, n=1):
+        """
+        Adds to a counter, for what happens too often to be worth a record.
+        The counters are written with the batches, when they changed
+        """
+        with self.countsLock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def start(self):
+        if self.running or self.path is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="telemetry", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wakeEvent.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def _run(self):
+        while self.running:
+            self.wakeEvent.wait(self.interval)
+            self.wakeEvent.clear()
+            try:
+                self.flush()
+            except OSError as e:
+                logger.warning("Telemetry write failed: %s", e)
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def flush(self):
+        """
+        Writes the queued records in one batch. Runs on the writer thread
+        """
+        start = time.monotonic_ns()
+        lines = []
+        queue = self.queue
+        while queue:
+            lines.append(encode(queue.popleft()))
+        with self.countsLock:
+            counts = dict(self.counts) if self.counts != self.written_counts else None
+        if counts is not None:
+            self.written_counts = counts
+            lines.append(encode((start, 'counters', (self.written_counts,))))
+        if not lines:
+            return
+        data = "".join(lines)
+        if self.file is None:
+            self.file = open(self.path, "a")
+        if self.file.tell() and self.file.tell() + len(data) > self.max_bytes:
+            self.rotate()
+        self.file.write(data)
+        self.file.flush()
+        self.written += len(lines)
+        self.batch.record(time.monotonic_ns() - start)
+
+    def rotate(self):
+        self.file.close()
+        for n in range(self.backups - 1, 0, -1):
+            source = "%s.%d" % (self.path, n)
+            if os.path.exists(source):
+                os.replace(source, "%s.%d" % (self.path, n + 1))
+        os.replace(self.path, self.path + ".1")
+        self.file = open(self.path, "a")
+        self.files += 1
+
+    def dump(self, path=None):
+        """
+        Writes the flight recorder as JSON lines, to path or to a new file in the
+        telemetry directory (the working directory without one). Returns the path
+        """
+        if path is None:
+            name = "flight-%s.jsonl" % time.strftime("%Y%m%d-%H%M%S")
+            path = os.path.join(self.directory, name) if self.directory else name
+        records = list(self.flight)
+        with open(path, "w") as f:
+            f.writelines(encode(record) for record in records)
+        logger.info("Dumped %d flight records to %s", len(records), path)
+        return path
+
+    def stats(self):
+        with self.countsLock:
+            counts = dict(self.counts)
+        return {
+            'emitted': self.emitted,
+            'dropped': self.dropped,
+            'queued': len(self.queue),
+            'written': self.written,
+            'rotations': self.files,
+            'batch_us': self.batch.summary(),
+            'counts': counts,
+        }
+
+recorder = None     # the Telemetry while telemetry is on
+
+def enable(directory=None, **kwargs):
+    """
+    Turns telemetry on: the flight recorder, and the files when directory is set
+    """
+    global recorder
+    disable()
+    recorder = Telemetry(directory, **kwargs)
+    recorder.start()
+    return recorder
+
+def disable():
+    global recorder
+    if recorder is not None:
+        recorder.stop()
+    recorder = None
@@ -0,0 +1,78 @@
+"""
+Fake board data shared by the tests and benchmarks.py: calibration blocks, mass
+packets, packet logs and socketpair sessions
+"""
+import gc
+import socket
+import tracemalloc
+
+from wii_balance.WiiBoard import PacketRecorder
+
+def fake_calibration(rng):
+    """
+    Calibration blocks like the board sends them: 3 weights x 4 sensors x 2 bytes
+    """
+    blocks = []
+    for base in (1000, 2700, 4400):
+        blocks.append([(base + rng.randrange(200)).to_bytes(2, 'big') for _ in range(4)])
+    return blocks
+
+def fake_mass_packets(rng, n):
+    return [bytes([0xa1, 0x32, 0, 0]) + b''.join(rng.randrange(0, 6000).to_bytes(2, 'big') for _ in range(4))
+            + bytes(13) for _ in range(n)]
+
+def measure_allocs(packets, parse, keep=True):
+    """
+    Returns the bytes and blocks each parsed packet keeps alive, and the peak
+    of transient memory while parsing one. keep=False drops each result, what
+    is left then is a leak
+    """
+    kept = [None] * len(packets)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    peak = 0
+    for i, packet in enumerate(packets):
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = parse(packet)
+        if keep:
+            kept[i] = result
+        result = None
+        peak += tracemalloc.get_traced_memory()[1] - current
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    diff = after.compare_to(before, 'filename')
+    size = sum(stat.size_diff for stat in diff)
+    blocks = sum(stat.count_diff for stat in diff)
+    n = len(packets)
+    return size / n, blocks / n, peak / n
+
+def fake_log(path, rng, samples, rate=100, calibration_at=0, calibration=None):
+    """
+    Writes a packet log of a board session: status, calibration and mass reports at rate Hz.
+    The calibration replies come after calibration_at mass reports
+    """
+    calibration = calibration or fake_calibration(rng)
+    status = bytes([0xa1, 0x20, 0, 0, 0x12, 0, 0, 150])
+    first = bytes([0xa1, 0x21, 0, 0, 0xf0, 0, 0x24]) + b''.join(calibration[0] + calibration[1])
+    second = bytes([0xa1, 0x21, 0, 0, 0x70, 0, 0x34]) + b''.join(calibration[2]) + bytes(8)
+    recorder = PacketRecorder(path)
+    now = 0
+    masses = fake_mass_packets(rng, samples)
+    for packet in [status] + masses[:calibration_at] + [first, second] + masses[calibration_at:]:
+        recorder.write(packet, len(packet), now)
+        now += 1_000_000_000 // rate
+    recorder.close()
+    return now / 1e9
+
+def board_session(rng):
+    """
+    Calibration replies of one fake board, and its peer sockets
+    """
+    control, controlPeer = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    receive, receivePeer = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    calibration = fake_calibration(rng)
+    first = bytes([0xa1, 0x21, 0, 0, 0xf0, 0, 0x24]) + b''.join(calibration[0] + calibration[1])
+    second = bytes([0xa1, 0x21, 0, 0, 0x70, 0, 0x34]) + b''.join(calibration[2]) + bytes(8)
+    return (control, receive), (controlPeer, receivePeer), (first, second)
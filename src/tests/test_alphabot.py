@@ -0,0 +1,117 @@
+""" Alphabot on the fake hardware backend: collision stops and GPIO writes per tick
+
+Run from src: python -m unittest discover tests
+"""
+import unittest
+
+import hardware
+hardware.select("fake")
+from alphabot import Alphabot as alphabot
+from alphabot.Velocity import MovDirection
+from wii_balance.WiiBoard import MassSample
+
+# The backend Alphabot imported, a test module before this one may have picked it
+GPIO = alphabot.GPIO
+
+@unittest.skipUnless(isinstance(GPIO, hardware.FakeGPIO), "needs the fake hardware backend")
+class CollisionTest(unittest.TestCase):
+    def setUp(self):
+        self.bot = alphabot.Alphabot()
+
+    def tearDown(self):
+        self.bot.disableCollisionDetection()
+        for pin in (self.bot.irLeft, self.bot.irRight):
+            GPIO.set_input(pin, GPIO.HIGH)
+
+    def drive_forward(self):
+        self.bot.vertDirection, self.bot.vertPower = MovDirection.POSITIVE, 20
+        self.bot.horizDirection = MovDirection.IDLE
+        self.bot.drive()
+        self.assertEqual((self.bot.pwma.duty, self.bot.pwmb.duty), (20, 20))
+
+    def test_falling_edge_stops_both_motors(self):
+        self.drive_forward()
+        GPIO.set_input(self.bot.irLeft, GPIO.LOW)
+        self.assertTrue(self.bot.isColliding)
+        self.assertEqual((self.bot.pwma.duty, self.bot.pwmb.duty), (0, 0))
+        self.assertEqual(self.bot.collisionStops, 1)
+        # drive() doesn't start again into the obstacle
+        self.bot.drive()
+        self.assertEqual((self.bot.pwma.duty, self.bot.pwmb.duty), (0, 0))
+
+    def test_rising_edge_clears(self):
+        self.drive_forward()
+        GPIO.set_input(self.bot.irRight, GPIO.LOW)
+        GPIO.set_input(self.bot.irRight, GPIO.HIGH)
+        self.assertFalse(self.bot.isColliding)
+        self.drive_forward()
+
+    def test_vision_and_ir_keep_each_other(self):
+        self.bot.setVisionObstacle(True)
+        GPIO.set_input(self.bot.irLeft, GPIO.LOW)
+        GPIO.set_input(self.bot.irLeft, GPIO.HIGH)
+        # The IR sensors cleared, the camera still sees the obstacle
+        self.assertTrue(self.bot.isColliding)
+
+        GPIO.set_input(self.bot.irLeft, GPIO.LOW)
+        self.bot.setVisionObstacle(False)
+        # And the other way around
+        self.assertTrue(self.bot.isColliding)
+        GPIO.set_input(self.bot.irLeft, GPIO.HIGH)
+        self.assertFalse(self.bot.isColliding)
+
+    def test_vision_obstacle_stops(self):
+        self.drive_forward()
+        self.bot.setVisionObstacle(True)
+        self.assertEqual((self.bot.pwma.duty, self.bot.pwmb.duty), (0, 0))
+        self.assertEqual(self.bot.collisionStops, 1)
+
+@unittest.skipUnless(isinstance(GPIO, hardware.FakeGPIO), "needs the fake hardware backend")
+class GpioWritesTest(unittest.TestCase):
+    def bot(self, cache=True):
+        bot = alphabot.Alphabot(cache=cache, irInterrupts=False)
+        GPIO.reset()
+        return bot
+
+    def outputs(self):
+        return [(pin, value) for _, kind, pin, value in GPIO.records if kind == 'output']
+
+    def tick(self, bot, mass):
+        bot.mass_to_velocity(mass)
+        bot.drive()
+        bot.updateBuzzer()
+
+    def test_steady_pose_writes_once(self):
+        bot = self.bot()
+        lean = MassSample(25.0, 5.0, 25.0, 5.0)     # forward
+        self.tick(bot, lean)
+        self.assertGreater(GPIO.calls, 0)
+        GPIO.reset()
+        for _ in range(20):
+            self.tick(bot, lean)
+        self.assertEqual(GPIO.calls, 0)
+
+    def test_direction_change_writes_changed_pins(self):
+        bot = self.bot()
+        bot.drive_forward()
+        GPIO.reset()
+        bot.drive_right()
+        # Only motor B changes direction, in one call
+        self.assertEqual(self.outputs(), [((bot.bin1, bot.bin2), (GPIO.HIGH, GPIO.LOW))])
+        GPIO.reset()
+        bot.drive_forward()
+        bot.drive_forward()
+        # Back once: motor B and both duty cycles, then nothing
+        self.assertEqual(self.outputs(), [((bot.bin1, bot.bin2), (GPIO.LOW, GPIO.HIGH))])
+        self.assertEqual(GPIO.counts['duty'], 2)
+
+    def test_write_through(self):
+        bot = self.bot(cache=False)
+        for _ in range(3):
+            bot.drive_forward()
+        # 4 direction pins and 2 duty cycles every time
+        self.assertEqual(GPIO.counts['output'], 12)
+        self.assertEqual(GPIO.counts['duty'], 6)
+
+if __name__ == "__main__":
+    unittest.main()
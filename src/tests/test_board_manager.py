@@ -0,0 +1,90 @@
+""" BoardManager reading several boards over socketpairs from one thread
+
+Run from src: python -m unittest discover tests
+"""
+import random
+import time
+import unittest
+
+from tests.fixtures import board_session, fake_mass_packets
+from wii_balance.BoardManager import BoardManager
+from wii_balance.WiiBoard import ResponseType, WiiBoard
+
+BOARDS = 3
+
+class BoardManagerTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        self.manager = BoardManager(cache=None)
+        self.peers = {}
+        self.sockets = []
+        for i in range(BOARDS):
+            sockets, peers, calibration = board_session(rng)
+            board = WiiBoard(cache=None)
+            board.attach(*sockets)
+            board.calibrate()
+            name = self.manager.add(board, "board%d" % i)
+            for packet in calibration:
+                peers[1].send(packet)
+            self.peers[name] = peers
+            self.sockets += list(sockets) + list(peers)
+        self.packets = fake_mass_packets(rng, 20)
+        self.manager.start()
+
+    def tearDown(self):
+        self.manager.close()
+        for s in self.sockets:
+            s.close()
+
+    def collect(self, count, timeout=2.0):
+        '''
+        Merged mass samples until there are count of them, as [(name, response)]
+        '''
+        samples = []
+        end = time.monotonic() + timeout
+        while len(samples) < count and time.monotonic() < end:
+            samples += [(name, response) for name, response in self.manager.read_merged()
+                        if response.type == ResponseType.MASS]
+            time.sleep(0.01)
+        return samples
+
+    def send(self, names):
+        for packet in self.packets:
+            for name in names:
+                self.peers[name][1].send(packet)
+
+    def test_interleaved_packets(self):
+        self.send(self.peers)
+        samples = self.collect(BOARDS * len(self.packets))
+        self.assertEqual(len(samples), BOARDS * len(self.packets))
+        for name in self.peers:
+            self.assertEqual(sum(1 for n, _ in samples if n == name), len(self.packets))
+        timestamps = [response.timestamp for _, response in samples]
+        self.assertEqual(timestamps, sorted(timestamps))
+
+    def test_disconnect_keeps_the_others(self):
+        gone = self.manager.boards["board1"]
+        self.peers["board1"][1].close()
+        end = time.monotonic() + 2.0
+        while "board1" in self.manager.boards and time.monotonic() < end:
+            time.sleep(0.01)
+        self.assertNotIn("board1", self.manager.boards)
+        # The dropped board was closed, not left with its sockets and threads
+        self.assertTrue(gone.closed)
+        self.assertIsNone(gone.receiveSocket)
+
+        self.send(["board0", "board2"])
+        samples = self.collect(2 * len(self.packets))
+        self.assertEqual(len(samples), 2 * len(self.packets))
+        self.assertEqual({name for name, _ in samples}, {"board0", "board2"})
+
+    def test_stop_joins_the_thread(self):
+        thread = self.manager.thread
+        self.assertTrue(thread.is_alive())
+        self.manager.stop()
+        self.assertFalse(thread.is_alive())
+        self.assertIsNone(self.manager.thread)
+        self.assertFalse(self.manager.running)
+
+if __name__ == "__main__":
+    unittest.main()
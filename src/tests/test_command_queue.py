@@ -0,0 +1,147 @@
+""" WiiBoard CommandQueue: coalescing, suppression and a control socket that stalls
+
+Run from src: python -m unittest discover tests
+"""
+import socket
+import threading
+import time
+import unittest
+
+from wii_balance.WiiBoard import (CommandQueue, COMMAND_LIGHT, COMMAND_READ_REGISTER,
+                                  COMMAND_REPORTING, COMMAND_REQUEST_STATUS)
+
+ON = b'\x10'
+OFF = b'\x00'
+
+def wait_for(condition, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.005)
+    return True
+
+def message(command, payload):
+    return b'\x52' + command + payload
+
+class StallingSocket():
+    '''
+    Control socket that holds every send until release is set, and times out
+    the first timeouts of them
+    '''
+    def __init__(self, timeouts=0):
+        self.timeouts = timeouts
+        self.release = threading.Event()
+        self.release.set()
+        self.calls = 0
+        self.sent = []
+
+    def send(self, data):
+        self.calls += 1
+        self.release.wait()
+        if self.timeouts:
+            self.timeouts -= 1
+            raise socket.timeout("timed out")
+        self.sent.append(data)
+        return len(data)
+
+class CommandQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.socket = StallingSocket()
+        self.queue = CommandQueue(capacity=8)
+
+    def tearDown(self):
+        self.socket.release.set()
+        self.queue.stop()
+
+    def stall(self):
+        '''
+        Start the writer and leave it stuck sending a status request
+        '''
+        self.socket.release.clear()
+        self.queue.start(self.socket)
+        self.queue.put(COMMAND_REQUEST_STATUS, OFF)
+        self.assertTrue(wait_for(lambda: self.socket.calls == 1))
+
+    def drain(self):
+        self.socket.release.set()
+        self.assertTrue(self.queue.flush(2.0))
+
+    def test_state_commands_coalesce(self):
+        self.stall()
+        self.queue.put(COMMAND_LIGHT, ON)
+        self.queue.put(COMMAND_READ_REGISTER, b'\x04')
+        self.queue.put(COMMAND_LIGHT, OFF)
+        self.queue.put(COMMAND_READ_REGISTER, b'\x04')  # identical to a pending one
+        self.drain()
+        # The replaced light command went after the register read
+        self.assertEqual(self.socket.sent, [
+            message(COMMAND_REQUEST_STATUS, OFF),
+            message(COMMAND_READ_REGISTER, b'\x04'),
+            message(COMMAND_LIGHT, OFF),
+        ])
+        self.assertEqual(self.queue.stats()['coalesced'], 2)
+
+    def test_known_state_suppressed(self):
+        self.queue.start(self.socket)
+        self.queue.put(COMMAND_LIGHT, ON)
+        self.assertTrue(self.queue.flush(2.0))
+        self.queue.put(COMMAND_LIGHT, ON)
+        self.assertTrue(self.queue.flush(2.0))
+        self.assertEqual(self.queue.stats()['suppressed'], 1)
+        self.assertEqual(self.socket.sent, [message(COMMAND_LIGHT, ON)])
+
+        # Changed and changed back before it was written: nothing to send
+        self.socket.release.clear()
+        self.queue.put(COMMAND_REQUEST_STATUS, OFF)
+        self.assertTrue(wait_for(lambda: self.socket.calls == 2))
+        self.queue.put(COMMAND_LIGHT, OFF)
+        self.queue.put(COMMAND_LIGHT, ON)
+        self.drain()
+        self.assertEqual(self.socket.sent[-1], message(COMMAND_REQUEST_STATUS, OFF))
+
+        # Sent again once the state is unknown
+        self.queue.update(COMMAND_LIGHT, None)
+        self.queue.put(COMMAND_LIGHT, ON)
+        self.assertTrue(self.queue.flush(2.0))
+        self.assertEqual(self.socket.sent[-1], message(COMMAND_LIGHT, ON))
+
+    def test_stalled_socket(self):
+        self.stall()
+        start = time.perf_counter()
+        for n in range(100):
+            self.queue.put(COMMAND_READ_REGISTER, bytes([n]))
+        self.queue.put(COMMAND_REPORTING, b'\x00\x34')
+        elapsed = time.perf_counter() - start
+        # put never waits for the socket, the oldest commands are dropped
+        self.assertLess(elapsed, 0.5)
+        stats = self.queue.stats()
+        self.assertEqual(stats['pending'], 8)
+        self.assertEqual(stats['dropped'], 93)
+        self.assertFalse(self.queue.flush(0.05))
+        self.drain()
+        self.assertEqual(self.socket.sent[1:], [message(COMMAND_READ_REGISTER, bytes([n])) for n in range(93, 100)] +
+                         [message(COMMAND_REPORTING, b'\x00\x34')])
+
+    def test_retry_after_timeout(self):
+        self.socket.timeouts = 2
+        self.queue.start(self.socket)
+        self.queue.put(COMMAND_READ_REGISTER, b'\x04')
+        self.assertTrue(self.queue.flush(2.0))
+        self.assertEqual(self.socket.sent, [message(COMMAND_READ_REGISTER, b'\x04')])
+        stats = self.queue.stats()
+        self.assertEqual(stats['failures'], 2)
+        self.assertEqual(stats['sent'], 1)
+
+    def test_superseded_not_retried(self):
+        self.socket.release.clear()
+        self.socket.timeouts = 1
+        self.queue.start(self.socket)
+        self.queue.put(COMMAND_LIGHT, ON)
+        self.assertTrue(wait_for(lambda: self.socket.calls == 1))
+        self.queue.put(COMMAND_LIGHT, OFF)
+        self.drain()
+        self.assertEqual(self.socket.sent, [message(COMMAND_LIGHT, OFF)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+""" Mass sample filters, streaming and batch
+
+Run from src: python -m unittest discover tests
+"""
+import random
+import statistics
+import unittest
+
+from wii_balance.Filters import (AutoTare, ExponentialFilter, MassFilter, MedianFilter, MovingAverage,
+                                 exponential, median, moving_average)
+from wii_balance.WiiBoard import MassSample
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def corners(value):
+    return [value] * 4
+
+def random_masses(n, seed=0):
+    rng = random.Random(seed)
+    return [[rng.uniform(0, 40) for _ in range(4)] for _ in range(n)]
+
+def stream(f, masses):
+    return [f.update(values) for values in masses]
+
+class MovingAverageTest(unittest.TestCase):
+    def test_warm_up_and_window(self):
+        f = MovingAverage(3)
+        out = [row[0] for row in stream(f, [corners(v) for v in (3, 6, 9, 12, 0)])]
+        self.assertEqual(out, [3, 4.5, 6, 9, 7])
+
+    def test_matches_the_mean_over_many_laps(self):
+        masses = random_masses(1000)
+        f = MovingAverage(5)
+        for k, row in enumerate(stream(f, masses)):
+            window = masses[max(0, k - 4):k + 1]
+            for i in range(4):
+                self.assertAlmostEqual(row[i], statistics.fmean(r[i] for r in window), places=9)
+
+class MedianFilterTest(unittest.TestCase):
+    def test_removes_a_spike(self):
+        f = MedianFilter(5)
+        out = [row[0] for row in stream(f, [corners(v) for v in (10, 10, 10, 90, 10, 10)])]
+        self.assertEqual(out[3:], [10, 10, 10])
+
+    def test_matches_the_median(self):
+        masses = random_masses(500)
+        f = MedianFilter(5)
+        for k, row in enumerate(stream(f, masses)):
+            window = masses[max(0, k - 4):k + 1]
+            self.assertEqual(row, [statistics.median(r[i] for r in window) for i in range(4)])
+
+class ExponentialFilterTest(unittest.TestCase):
+    def test_update(self):
+        f = ExponentialFilter(0.25)
+        out = [row[0] for row in stream(f, [corners(v) for v in (8, 16, 16)])]
+        self.assertEqual(out, [8, 10, 11.5])
+
+    def test_reset(self):
+        f = ExponentialFilter(0.25)
+        stream(f, [corners(8), corners(16)])
+        f.reset()
+        self.assertEqual(f.update(corners(4)), corners(4))
+
+class AutoTareTest(unittest.TestCase):
+    def test_learns_the_empty_offset(self):
+        tare = AutoTare(samples=10)
+        for _ in range(10):
+            tare.update([1.0, 0.5, 1.5, 0.0])
+        self.assertTrue(tare.tared)
+        self.assertEqual(tare.offset, [1.0, 0.5, 1.5, 0.0])
+        self.assertEqual(tare.update([21.0, 20.5, 21.5, 20.0]), corners(20.0))
+        # Never below 0
+        self.assertEqual(tare.update([0.0, 0.0, 0.0, 0.0]), corners(0.0))
+
+    def test_stepping_on_drops_the_partial_sum(self):
+        tare = AutoTare(samples=10)
+        for _ in range(9):
+            tare.update(corners(1.0))
+        tare.update(corners(20.0))
+        tare.update(corners(1.0))
+        self.assertFalse(tare.tared)
+        self.assertEqual(tare.count, 1)
+
+    def test_mass_filter_reset_forgets_the_offset(self):
+        mass_filter = MassFilter([MovingAverage(3)], tare=AutoTare(samples=5))
+        for _ in range(5):
+            mass_filter.update(MassSample(*corners(1.0)))
+        self.assertTrue(mass_filter.tare.tared)
+        mass_filter.reset()
+        self.assertFalse(mass_filter.tare.tared)
+        self.assertEqual(mass_filter.tare.offset, corners(0.0))
+        self.assertEqual(mass_filter.update(MassSample(*corners(10.0))).total(), 40.0)
+
+@unittest.skipIf(np is None, "the batch filters need numpy")
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        # More rows than an EMA chunk, and not a multiple of it
+        self.masses = random_masses(700)
+
+    def test_moving_average(self):
+        expected = stream(MovingAverage(5), self.masses)
+        self.assertTrue(np.allclose(moving_average(self.masses, 5), expected))
+
+    def test_median(self):
+        expected = stream(MedianFilter(5), self.masses)
+        self.assertTrue(np.allclose(median(self.masses, 5), expected))
+        short = self.masses[:3]
+        self.assertTrue(np.allclose(median(short, 5), stream(MedianFilter(5), short)))
+
+    def test_exponential(self):
+        expected = stream(ExponentialFilter(0.2), self.masses)
+        self.assertTrue(np.allclose(exponential(self.masses, 0.2), expected))
+
+if __name__ == "__main__":
+    unittest.main()
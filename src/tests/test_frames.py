@@ -0,0 +1,90 @@
+""" FramePipeline with a fake frame source
+
+Run from src: python -m unittest discover tests
+"""
+import time
+import unittest
+
+from alphabot.Frames import POOL_SIZE, FramePipeline
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def wait_for(condition, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.002)
+    return True
+
+class CountingSource():
+    '''
+    Frames filled with their number (mod 256), one every period seconds
+    '''
+    def __init__(self, shape=(12, 16, 3), period=0.001):
+        self.shape = shape
+        self.period = period
+        self.frames = 0
+
+    def frame_shape(self):
+        return self.shape
+
+    def capture(self, buffer):
+        time.sleep(self.period)
+        buffer[...] = self.frames % 256
+        self.frames += 1
+
+@unittest.skipIf(np is None, "the frame pipeline needs numpy")
+class FramePipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.pipeline = FramePipeline(CountingSource())
+        self.pipeline.start()
+
+    def tearDown(self):
+        self.pipeline.stop()
+
+    def test_pool_reuse(self):
+        self.assertEqual(len(self.pipeline.buffers), POOL_SIZE)
+        slots = set()
+        seq = -1
+        for _ in range(30):
+            with self.pipeline.get(timeout=1.0, after=seq) as frame:
+                seq = frame.seq
+                slots.add(frame.slot)
+                self.assertTrue(np.shares_memory(frame.array, self.pipeline.buffers[frame.slot]))
+        # Frames are captured into the same buffers over and over
+        self.assertLessEqual(len(slots), POOL_SIZE)
+        self.assertGreater(self.pipeline.captured, POOL_SIZE)
+
+    def test_held_frame_stays_valid(self):
+        frame = self.pipeline.get(timeout=1.0)
+        value = frame.array.copy()
+        held = frame.seq
+        self.assertTrue(wait_for(lambda: self.pipeline.captured > held + 20))
+        self.assertTrue((frame.array == value).all())
+        # The capture went on in the other buffers meanwhile
+        with self.pipeline.get(timeout=1.0, after=held) as newer:
+            self.assertNotEqual(newer.slot, frame.slot)
+            self.assertGreater(newer.seq, held)
+        frame.release()
+
+    def test_latest_wins(self):
+        self.assertTrue(wait_for(lambda: self.pipeline.captured >= 20))
+        with self.pipeline.get(timeout=1.0) as frame:
+            # Nobody took the frames before it, they were dropped
+            self.assertGreaterEqual(frame.seq, 19)
+        self.pipeline.stop()
+        stats = self.pipeline.stats()
+        self.assertEqual(stats['delivered'], 1)
+        self.assertGreaterEqual(stats['dropped'], stats['captured'] - 2)
+        self.assertLessEqual(stats['dropped'], stats['captured'] - 1)
+
+    def test_views_are_read_only(self):
+        with self.pipeline.get(timeout=1.0) as frame:
+            with self.assertRaises(ValueError):
+                frame.array[0, 0, 0] = 1
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+""" hardware.select("auto"): the fake only where RPi.GPIO isn't installed
+
+Run from src: python -m unittest discover tests
+"""
+import sys
+import types
+import unittest
+from unittest import mock
+
+import hardware
+
+class SelectTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = (hardware.BACKEND, hardware.GPIO, hardware.ServoKit, hardware.PiCamera)
+        self.addCleanup(self.restore, self.saved)
+
+    def restore(self, saved):
+        hardware.BACKEND, hardware.GPIO, hardware.ServoKit, hardware.PiCamera = saved
+
+    def test_no_gpio_uses_the_fake(self):
+        # None in sys.modules makes the import fail
+        with mock.patch.dict(sys.modules, {'RPi': None, 'RPi.GPIO': None}):
+            hardware.select("auto")
+        self.assertEqual(hardware.BACKEND, "fake")
+        self.assertIsInstance(hardware.GPIO, hardware.FakeGPIO)
+
+    def test_missing_driver_on_a_pi_raises(self):
+        rpi = types.ModuleType('RPi')
+        rpi.GPIO = types.ModuleType('RPi.GPIO')
+        modules = {'RPi': rpi, 'RPi.GPIO': rpi.GPIO, 'adafruit_servokit': types.ModuleType('adafruit_servokit'),
+                   'picamera': None}
+        modules['adafruit_servokit'].ServoKit = object
+        with mock.patch.dict(sys.modules, modules):
+            with self.assertRaises(ImportError) as raised:
+                hardware.select("auto")
+        self.assertIn("picamera", str(raised.exception))
+        # The backend is left as it was
+        self.assertEqual((hardware.BACKEND, hardware.GPIO), self.saved[:2])
+
+if __name__ == "__main__":
+    unittest.main()
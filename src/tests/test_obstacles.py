@@ -0,0 +1,81 @@
+""" Obstacle detection on recorded frames, and the CPU budget of its thread
+
+tests/data/floor_clear.npy holds 4 frames (60x80) of a bare floor,
+floor_obstacle.npy 6 frames where a dark box comes into the robot's path from
+the third frame on.
+
+Run from src: python -m unittest discover tests
+"""
+import os
+import time
+import unittest
+
+from alphabot.Frames import Frame
+from alphabot.Obstacles import FloorDetector, ObstacleDetector, load_frames
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DATA = os.path.join(os.path.dirname(__file__), "data")
+
+class ReadyFrames():
+    '''
+    Stands in for a FramePipeline: a new frame on every get
+    '''
+    def __init__(self, array):
+        self.array = array
+        self.seq = 0
+
+    def get(self, timeout=None, after=-1):
+        self.seq += 1
+        return Frame(self.array, self.seq, time.monotonic_ns(), 0, None)
+
+class BusyDetector():
+    '''
+    A FloorDetector that takes busy_s of CPU per frame
+    '''
+    detected = False
+    occupied = 0.0
+
+    def __init__(self, busy_s):
+        self.busy_s = busy_s
+
+    def detect(self, frame):
+        end = time.perf_counter() + self.busy_s
+        while time.perf_counter() < end:
+            pass
+        return False
+
+@unittest.skipIf(np is None, "the obstacle detector needs numpy")
+class RecordedFramesTest(unittest.TestCase):
+    def verdicts(self, name):
+        detector = FloorDetector()
+        return [detector.detect(frame) for frame in load_frames(os.path.join(DATA, name))]
+
+    def test_clear_floor(self):
+        self.assertEqual(self.verdicts("floor_clear.npy"), [False] * 4)
+
+    def test_obstacle(self):
+        verdicts = self.verdicts("floor_obstacle.npy")
+        self.assertFalse(any(verdicts[:2]))
+        # Reported once it covers enough of the floor, for CONFIRM frames in a row
+        self.assertTrue(verdicts[-1])
+
+@unittest.skipIf(np is None, "the obstacle detector needs numpy")
+class BudgetTest(unittest.TestCase):
+    def test_duty_cycle_under_budget(self):
+        budget = 0.2
+        detector = ObstacleDetector(ReadyFrames(np.zeros((4, 4, 3), dtype=np.uint8)),
+                                    budget=budget, detector=BusyDetector(0.005))
+        detector.start()
+        time.sleep(0.6)
+        detector.stop()
+        stats = detector.stats()
+        self.assertGreater(stats['processed'], 10)
+        # The thread idles long enough after each frame, with frames always ready
+        self.assertLess(stats['cpu'], budget * 1.15)
+        self.assertGreater(stats['cpu'], budget * 0.5)
+
+if __name__ == "__main__":
+    unittest.main()
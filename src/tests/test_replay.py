@@ -0,0 +1,59 @@
+""" ReplaySocket polled without waiting, like read_all does on a realtime replay
+
+Run from src: python -m unittest discover tests
+"""
+import os
+import random
+import socket
+import tempfile
+import unittest
+
+from tests.fixtures import fake_log
+from wii_balance.Replay import PacketLog, ReplaySocket, replay_board
+
+class ReplayPollTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "board.log")
+        # 1 ms apart, the polls below come much faster than that
+        fake_log(self.path, random.Random(0), 50, rate=1000)
+
+    def test_many_empty_polls(self):
+        # Slowed down so far that the second packet is never due during the test
+        replay = ReplaySocket(PacketLog(self.path), realtime=True, speed=1e-6)
+        buffer = bytearray(32)
+        replay.recv_into(buffer, 0, socket.MSG_DONTWAIT)
+        first = replay.timestamp
+        # Far more empty polls than the recursion limit
+        for _ in range(5000):
+            with self.assertRaises(BlockingIOError):
+                replay.recv_into(buffer, 0, socket.MSG_DONTWAIT)
+        self.assertEqual(replay.packets, 1)
+        # The packet that wasn't due is the next one delivered
+        replay.speed = 1e9
+        self.assertGreater(replay.recv_into(buffer, 0, socket.MSG_DONTWAIT), 0)
+        self.assertEqual(replay.packets, 2)
+        self.assertGreater(replay.timestamp, first)
+
+    def test_timeouts_keep_the_packet(self):
+        replay = ReplaySocket(PacketLog(self.path), realtime=True, speed=1e-6)
+        replay.settimeout(0.0)
+        buffer = bytearray(32)
+        self.assertGreater(replay.recv_into(buffer), 0)
+        first = replay.timestamp
+        for _ in range(2000):
+            with self.assertRaises(socket.timeout):
+                replay.recv_into(buffer)
+        replay.speed = 1e9
+        self.assertGreater(replay.recv_into(buffer), 0)
+        self.assertEqual(replay.packets, 2)
+        self.assertGreater(replay.timestamp, first)
+
+    def test_read_all_on_realtime_replay(self):
+        board = replay_board(self.path, realtime=True)
+        samples = 0
+        while board.connected:
+            samples += len(board.read_all())
+        self.assertEqual(samples, 50)
+
+if __name__ == "__main__":
+    unittest.main()
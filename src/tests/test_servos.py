@@ -0,0 +1,70 @@
+""" ServoMotion and the camera servos, counting writes on the fake ServoKit
+
+Run from src: python -m unittest discover tests
+"""
+import time
+import unittest
+
+import hardware
+from alphabot.Servos import ServoMotion
+
+def wait_for(condition, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.005)
+    return True
+
+@unittest.skipUnless(hardware.BACKEND == "fake", "needs the fake hardware backend")
+class ServoMotionTest(unittest.TestCase):
+    def setUp(self):
+        self.kit = hardware.FakeServoKit()
+        self.gpio = self.kit.servo[0].gpio
+        # 100 Hz to keep the moves short
+        self.motion = ServoMotion(self.kit, start=(60, 30), rate=100)
+        self.motion.jump(0, 60)
+        self.motion.jump(1, 30)
+        self.motion.start()
+        self.gpio.reset()
+
+    def tearDown(self):
+        self.motion.stop()
+
+    def writes(self, channel=0):
+        return [value for _, kind, pin, value in self.gpio.records if kind == 'servo' and pin == channel]
+
+    def test_deadband_suppresses_writes(self):
+        for angle in (61, 59, 60.5, 61.9):
+            self.motion.set_target(0, angle)
+        time.sleep(0.1)
+        self.assertEqual(self.gpio.counts['servo'], 0)
+        self.assertEqual(self.motion.stats()['merged'], 4)
+
+    def test_step_limits(self):
+        self.motion.set_target(0, 120)
+        self.assertTrue(wait_for(lambda: not self.motion.moving()))
+        angles = [60] + self.writes()
+        self.assertEqual(angles[-1], 120)
+        self.assertEqual(self.writes(1), [])
+        moves = [b - a for a, b in zip(angles, angles[1:])]
+        # Whole steps only, and no faster than the speed limit allows per update
+        self.assertTrue(all(move >= self.motion.step for move in moves))
+        self.assertTrue(all(move <= self.motion.speed * self.motion.period + 1 for move in moves))
+        self.assertLess(len(moves), 60)
+
+    def test_camera_tilt_is_rate_limited(self):
+        from alphabot.Camera import Camera
+        cam = Camera()
+        cam.reset()
+        self.addCleanup(cam.stop)
+        gpio = cam.kit.servo[0].gpio
+        gpio.reset()
+        cam.tilt(150)
+        # tilt returns before the servo got there, ServoMotion moves it
+        self.assertNotEqual(cam.kit.servo[0].angle, 150)
+        self.assertTrue(wait_for(lambda: cam.kit.servo[0].angle == 150))
+        self.assertGreater(gpio.counts['servo'], 1)
+
+if __name__ == "__main__":
+    unittest.main()
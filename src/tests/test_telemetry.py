@@ -0,0 +1,57 @@
+""" Telemetry counters and records, written by the writer thread
+
+Run from src: python -m unittest discover tests
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import telemetry
+
+class TelemetryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+
+    def read(self):
+        with open(os.path.join(self.directory, telemetry.FILE_NAME)) as f:
+            return [json.loads(line) for line in f]
+
+    def test_import_turns_nothing_on(self):
+        # kernel.setup() enables it, other importers keep recorder None
+        self.assertIsNone(telemetry.recorder)
+
+    def test_counts_while_the_writer_flushes(self):
+        # A short interval so the writer copies the counts while they grow
+        rec = telemetry.Telemetry(self.directory, interval=0.0005)
+        rec.start()
+        names = ["counter%d" % i for i in range(200)]
+
+        def count():
+            for _ in range(50):
+                for name in names:
+                    rec.count(name)
+
+        threads = [threading.Thread(target=count) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        rec.stop()
+
+        self.assertEqual(rec.stats()['counts'], dict.fromkeys(names, 100))
+        counters = [r['counts'] for r in self.read() if r['kind'] == 'counters']
+        self.assertEqual(counters[-1], dict.fromkeys(names, 100))
+
+    def test_records_are_written(self):
+        rec = telemetry.Telemetry(self.directory)
+        rec.start()
+        rec.emit('event', 'connected', None)
+        rec.stop()
+        self.assertEqual([(r['kind'], r['type']) for r in self.read()], [('event', 'connected')])
+
+if __name__ == "__main__":
+    unittest.main()
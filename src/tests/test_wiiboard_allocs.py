@@ -0,0 +1,53 @@
+""" Memory allocated per mass packet on the recv_into path, with tracemalloc
+
+Run from src: python -m unittest discover tests
+"""
+import random
+import socket
+import unittest
+
+from tests.fixtures import fake_calibration, fake_mass_packets, measure_allocs
+from wii_balance.WiiBoard import WiiBoard
+
+PACKETS = 2000
+# Per mass packet: the MassSample and its 4 floats kept, and the transient peak
+# (the old slices and dicts path needed ~620 bytes)
+PACKET_KEPT_BLOCKS = 7
+PACKET_PEAK_BYTES = 400
+LEAK_BYTES = 4096   # left allocated after the whole run with the samples dropped (tracemalloc's own)
+
+class PacketAllocsTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        self.board = WiiBoard(cache=None)
+        self.sockets = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET) + \
+            socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        control, _, receive, self.peer = self.sockets
+        self.board.attach(control, receive)
+        self.board.calibration = fake_calibration(rng)
+        self.board.calibration_table = self.board.build_calibration_table()
+        self.board.calibrated = True
+        self.packets = fake_mass_packets(rng, PACKETS)
+        self.parse(self.packets[0])     # warm up
+
+    def tearDown(self):
+        self.board.close()
+        for s in self.sockets:
+            s.close()
+
+    def parse(self, packet):
+        self.peer.send(packet)
+        length = self.board.receive()
+        return self.board.handle_packet(self.board.packet, length)
+
+    def test_steady_state_allocations(self):
+        size, blocks, peak = measure_allocs(self.packets, self.parse)
+        self.assertLessEqual(blocks, PACKET_KEPT_BLOCKS)
+        self.assertLessEqual(peak, PACKET_PEAK_BYTES)
+
+    def test_no_leak(self):
+        leak, _, _ = measure_allocs(self.packets, self.parse, keep=False)
+        self.assertLess(leak * PACKETS, LEAK_BYTES)
+
+if __name__ == "__main__":
+    unittest.main()
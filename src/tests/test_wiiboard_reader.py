@@ -0,0 +1,97 @@
+""" WiiBoard reader thread on a socketpair standing in for the board
+
+Run from src: python -m unittest discover tests
+"""
+import socket
+import threading
+import time
+import unittest
+
+from wii_balance.WiiBoard import WiiBoard
+
+CALIBRATION = [[(base + i).to_bytes(2, 'big') for i in range(4)] for base in (1000, 2700, 4400)]
+STATUS = bytes([0xa1, 0x20, 0, 0, 0x12, 0, 0, 150])
+CALIBRATION_PACKETS = [
+    bytes([0xa1, 0x21, 0, 0, 0xf0, 0, 0x24]) + b''.join(CALIBRATION[0] + CALIBRATION[1]),
+    bytes([0xa1, 0x21, 0, 0, 0x70, 0, 0x34]) + b''.join(CALIBRATION[2]) + bytes(8),
+]
+
+def mass_packet(raw):
+    return bytes([0xa1, 0x32, 0, 0]) + b''.join(value.to_bytes(2, 'big') for value in raw) + bytes(13)
+
+def wait_for(condition, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.005)
+    return True
+
+class ResettingSocket():
+    '''
+    Receive socket of a board that went away: every recv_into raises ECONNRESET
+    '''
+    def __init__(self):
+        self.calls = 0
+
+    def recv_into(self, buffer, nbytes=0, flags=0):
+        self.calls += 1
+        raise ConnectionResetError(104, "Connection reset by peer")
+
+    def settimeout(self, timeout):
+        pass
+
+    def close(self):
+        pass
+
+class ReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.control, self.control_peer = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.receive, self.board_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.board = WiiBoard(reader=True, cache=None)
+
+    def tearDown(self):
+        self.board.close()
+        for s in (self.control, self.control_peer, self.receive, self.board_end):
+            s.close()
+
+    def start(self, receive=None):
+        self.board.attach(self.control, receive or self.receive)
+        self.board.calibrate()
+        self.board.start_reader()
+
+    def test_reads_packets_in_order(self):
+        self.start()
+        for packet in [STATUS] + CALIBRATION_PACKETS:
+            self.board_end.send(packet)
+        self.assertTrue(wait_for(lambda: self.board.calibrated))
+        for n in range(50):
+            self.board_end.send(mass_packet([2700 + n] * 4))
+        batches = []
+        self.assertTrue(wait_for(lambda: batches.append(self.board.read_all()) or sum(map(len, batches)) == 50))
+        seqs = [seq for batch in batches for seq in batch.seqs]
+        self.assertEqual(seqs, list(range(50)))
+        masses = [mass for batch in batches for mass in batch.masses]
+        self.assertAlmostEqual(masses[0], 17.0)
+        self.assertGreater(masses[-1], masses[0])
+
+    def test_peer_close_disconnects(self):
+        self.start()
+        reader = self.board.reader
+        self.board_end.close()
+        self.assertTrue(wait_for(lambda: not self.board.connected))
+        reader.join(1.0)
+        self.assertFalse(reader.is_alive())
+
+    def test_socket_error_disconnects(self):
+        resetting = ResettingSocket()
+        self.start(resetting)
+        reader = self.board.reader
+        reader.join(1.0)
+        self.assertFalse(reader.is_alive())
+        self.assertFalse(self.board.connected)
+        # One failed recv, not a busy loop
+        self.assertEqual(resetting.calls, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,187 @@
+""" WiiBoard background reconnection, with a socket factory standing in for Bluetooth
+
+Run from src: python -m unittest discover tests
+"""
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from wii_balance.WiiBoard import WiiBoard, SEND_SOCKET_PORT
+
+ADDRESS = "00:1E:35:00:00:01"
+
+def wait_for(condition, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.005)
+    return True
+
+class FakeL2CAP():
+    '''
+    One end of a socketpair that "connects" to a board address
+    '''
+    def __init__(self, factory):
+        self.factory = factory
+        self.socket, self.peer = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.closed = False
+
+    def connect(self, address):
+        self.factory.connecting(self, address)
+
+    def close(self):
+        self.closed = True
+        self.socket.close()
+        self.peer.close()
+
+    def __getattr__(self, name):
+        return getattr(self.socket, name)
+
+class FakeFactory():
+    '''
+    socket_factory of the board: refuses the first failures control connections,
+    and holds each one until release is set
+    '''
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.release = threading.Event()
+        self.release.set()
+        self.waiting = threading.Event()
+        self.sockets = []
+        self.attempts = []      # (monotonic s, address) of each control connection
+
+    def __call__(self):
+        s = FakeL2CAP(self)
+        self.sockets.append(s)
+        return s
+
+    def connecting(self, s, address):
+        if address[1] != SEND_SOCKET_PORT:
+            return
+        self.attempts.append((time.monotonic(), address))
+        self.waiting.set()
+        self.release.wait()
+        if len(self.attempts) <= self.failures:
+            raise ConnectionRefusedError(111, "Connection refused")
+
+    def close(self):
+        for s in self.sockets:
+            s.close()
+
+class ReconnectTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = os.path.join(tempfile.mkdtemp(), "board.json")
+        self.boards = []
+        self.discoveries = []
+        patches = [
+            mock.patch("wii_balance.WiiBoard.BACKOFF_MIN", 0.02),
+            mock.patch("wii_balance.WiiBoard.BACKOFF_MAX", 0.05),
+            mock.patch("wii_balance.WiiBoard.find_boards", self.find_boards),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        for board, factory in self.boards:
+            factory.release.set()
+            board.close()
+            factory.close()
+
+    def find_boards(self, duration=3, prefix=None):
+        self.discoveries.append(time.monotonic())
+        return [ADDRESS]
+
+    def board(self, factory, cached=True):
+        if cached:
+            with open(self.cache, "w") as file:
+                json.dump({'address': ADDRESS}, file)
+        board = WiiBoard(reader=True, cache=self.cache, socket_factory=factory)
+        self.boards.append((board, factory))
+        return board
+
+    def test_cached_address_connects_directly(self):
+        factory = FakeFactory()
+        board = self.board(factory)
+        board.connectToBoard()
+        self.assertTrue(wait_for(lambda: board.reconnects == 1))
+        self.assertTrue(board.connected)
+        self.assertEqual(self.discoveries, [])
+        self.assertEqual([address for _, address in factory.attempts], [(ADDRESS, SEND_SOCKET_PORT)])
+
+        # Reconnects to the same address after losing the board
+        board.disconnect()
+        board.connectToBoard()
+        self.assertTrue(wait_for(lambda: board.reconnects == 2))
+        stats = board.reconnect_stats()
+        self.assertEqual(stats['state'], 'CONNECTED')
+        self.assertEqual(stats['direct'], 2)
+        self.assertEqual(stats['discovery'], 0)
+        self.assertIsNotNone(stats['last_ms'])
+        self.assertEqual(self.discoveries, [])
+
+    def test_discovers_without_cached_address(self):
+        factory = FakeFactory()
+        board = self.board(factory, cached=False)
+        board.connectToBoard()
+        self.assertTrue(wait_for(lambda: board.reconnects == 1))
+        self.assertEqual(len(self.discoveries), 1)
+        self.assertEqual(board.reconnect_stats()['discovery'], 1)
+        # The address found is cached for the next time
+        with open(self.cache) as file:
+            self.assertEqual(json.load(file)['address'], ADDRESS)
+
+    def test_no_cache_by_default(self):
+        factory = FakeFactory()
+        board = WiiBoard(reader=True, socket_factory=factory)
+        self.boards.append((board, factory))
+        self.assertIsNone(board.cache_path)
+        board.connectToBoard()
+        self.assertTrue(wait_for(lambda: board.reconnects == 1))
+        # Discovered every time, nothing was read or written
+        self.assertEqual(len(self.discoveries), 1)
+        self.assertEqual(board.load_cache(), {})
+
+    def test_backoff_between_attempts(self):
+        # Two attempts fail, each a direct connection and one after a discovery
+        factory = FakeFactory(failures=4)
+        board = self.board(factory)
+        board.connectToBoard()
+        self.assertTrue(wait_for(lambda: board.reconnects == 1))
+        times = [t for t, _ in factory.attempts]
+        self.assertEqual(len(times), 5)
+        # BACKOFF_MIN after the first attempt, then twice that
+        self.assertGreaterEqual(times[2] - times[1], 0.02)
+        self.assertGreaterEqual(times[4] - times[3], 0.04)
+        stats = board.reconnect_stats()
+        self.assertEqual(stats['direct'], 1)
+        self.assertEqual(stats['discovery'], 0)
+        self.assertGreaterEqual(stats['last_ms'], 60)
+        self.assertEqual(len(self.discoveries), 2)
+
+    def test_close_during_connect(self):
+        factory = FakeFactory()
+        factory.release.clear()
+        board = self.board(factory)
+        board.connectToBoard()
+        self.assertTrue(factory.waiting.wait(2.0))
+        board.close()
+        factory.release.set()
+        board.reconnector.join(2.0)
+        self.assertFalse(board.reconnector.is_alive())
+        # The connection that finished after close() didn't revive the board
+        self.assertFalse(board.connected)
+        self.assertFalse(board.running)
+        self.assertEqual(board.reconnects, 0)
+        self.assertTrue(all(s.closed for s in factory.sockets))
+        board.connectToBoard()
+        self.assertFalse(board.reconnector.is_alive())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+from Histogram import Histogram
+import logging
+import threading
+import time
+
+# initialize the logger
+logger = logging.getLogger(__name__)
+handler = logging.StreamHandler() # or RotatingFileHandler
+handler.setFormatter(logging.Formatter('[%(asctime)s][%(name)s][%(levelname)s] %(message)s'))
+logger.addHandler(handler)
+logger.setLevel(logging.INFO) # or DEBUG
+
+NS_PER_MS = 1_000_000
+
+class Ticker:
+    """
+    Periodic tick source backed by a single long-lived thread.
+
+    The thread sleeps until absolute time.monotonic_ns() deadlines, so the time
+    spent inside the handler does not accumulate as drift. The handler is called
+    with the number of ticks that elapsed since its previous call, so the caller
+    can catch up after an overrun. It may return how many ticks to sleep until
+    it needs to run again (None to sleep until wake() is called).
+    """
+    def __init__(self, period_ms, handler):
+        self.period_ms = period_ms
+        self.period_ns = int(period_ms * NS_PER_MS)
+        if self.period_ns <= 0:
+            raise ValueError("Tick period must be positive")
+        self.handler = handler  # called as handler(ticks)
+        self.thread = None
+        self.running = False
+        self.wakeEvent = threading.Event()
+
+        self.start_ns = 0
+        self.deadline_ns = 0    # nominal time of the latest tick
+        self.ticks = 0          # ticks elapsed since start
+        self.wakeups = 0        # number of handler calls
+        self.overruns = 0       # ticks that were caught up late
+        # Lateness (wake-up time - deadline) statistics, in ns
+        self.lateness = Histogram()
+        self.lateness_sumsq = 0
+        self.lateness_last = 0
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.wakeEvent.clear()
+        self.start_ns = time.monotonic_ns()
+        self.thread = threading.Thread(target=self._run, name="ticker", daemon=True)
+        self.thread.start()
+
+    def wake(self):
+        """
+        Makes the ticker wake up at the next tick instead of the one the handler asked for
+        """
+        self.wakeEvent.set()
+
+    def stop(self):
+        self.running = False
+        self.wakeEvent.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def _run(self):
+        period = self.period_ns
+        last = self.start_ns
+        deadline = last + period
+        while self.running:
+            now = time.monotonic_ns()
+            if deadline is None or now < deadline:
+                timeout = None if deadline is None else (deadline - now) / 1e9
+                if self.wakeEvent.wait(timeout):
+                    self.wakeEvent.clear()
+                    # Re-arm at the first tick boundary after now
+                    now = time.monotonic_ns()
+                    deadline = last + ((now - last) // period + 1) * period
+                continue
+
+            lateness = now - deadline
+            due = deadline + (lateness // period) * period  # latest tick boundary
+            ticks = (due - last) // period
+            self._record(lateness, ticks, lateness // period)
+            last = due
+            self.deadline_ns = due
+
+            try:
+                sleep = self.handler(ticks)
+            except Exception:
+                # A failing handler must not stop the tick source, try again next tick
+                logger.exception("Tick handler failed")
+                sleep = 1
+            deadline = None if sleep is None else due + max(sleep, 1) * period
+
+    def _record(self, lateness, ticks, overruns):
+        self.lateness.record(lateness)
+        self.lateness_sumsq += lateness * lateness
+        self.lateness_last = lateness
+        self.wakeups += 1
+        self.ticks += ticks
+        self.overruns += overruns
+
+    def stats(self):
+        """
+        Returns the drift and jitter of the tick source, in microseconds.
+        drift is how far behind the ideal schedule the last tick woke up (it does not
+        accumulate), jitter is the standard deviation of the wake-up lateness.
+        """
+        n = self.wakeups
+        mean = self.lateness.mean()
+        var = self.lateness_sumsq / n - mean * mean if n else 0.0
+        return {
+            'period_ms': self.period_ms,
+            'ticks': self.ticks,
+            'wakeups': n,
+            'overruns': self.overruns,
+            'elapsed_s': (time.monotonic_ns() - self.start_ns) / 1e9 if self.start_ns else 0.0,
+            'drift_us': self.lateness_last / 1e3,
+            'lateness_min_us': self.lateness.min / 1e3,
+            'lateness_mean_us': mean / 1e3,
+            'lateness_p99_us': self.lateness.percentile(99) / 1e3,
+            'lateness_max_us': self.lateness.max / 1e3,
+            'jitter_us': max(var, 0.0) ** 0.5 / 1e3,
+        }
@@ -0,0 +1,129 @@
+"""
+Sensor to motor latency tracing
+
+Each mass sample carries its board sequence number (the trace id) and the
+monotonic ns its packet was received. When tracing is on, Alphabot starts a
+Trace when mass_to_velocity takes a sample, marks it when drive() acts on it and
+when the resulting GPIO write happens, and the intervals go into histograms.
+
+Tracing is off unless enable() is called or ALPHABOT_TRACE is set (to 1, or to
+a path export_file() writes the traces to). Off, the cost is a check of
+tracing.tracer against None.
+"""
+from collections import deque
+from Histogram import Histogram, bucket_upper
+import json
+import os
+import threading
+import time
+
+RECENT_TRACES = 1000    # finished traces kept for export
+
+# Intervals recorded for each trace, from and to a Trace field
+STAGES = (
+    ('receive_to_velocity', 'received', 'velocity'),  # reader queue and task tick wait
+    ('velocity_to_drive', 'velocity', 'drive'),       # until the drive task runs
+    ('receive_to_drive', 'received', 'drive'),
+    ('receive_to_motor', 'received', 'motor'),        # the whole path, when the motors changed
+)
+
+class Trace:
+    """
+    Timestamps (monotonic ns) of one mass sample on its way to the motors
+    """
+    __slots__ = ('id', 'received', 'velocity', 'drive', 'motor')
+
+    def __init__(self, id, received, velocity):
+        self.id = id
+        self.received = received
+        self.velocity = velocity
+        self.drive = 0
+        self.motor = 0      # stays 0 if drive() didn't change any pin or duty cycle
+
+    def as_list(self):
+        return [self.id, self.received, self.velocity, self.drive, self.motor]
+
+class Tracer:
+    def __init__(self, recent=RECENT_TRACES):
+        self.lock = threading.Lock()
+        self.histograms = {name: Histogram() for name, _, _ in STAGES}
+        self.recent = deque(maxlen=recent)
+        self.traces = 0
+        self.motor = 0          # traces that reached the motors
+        self.unchanged = 0      # acted on, but the motors already were in that state
+        self.superseded = 0     # replaced by a newer sample before drive() ran
+
+    def begin(self, sample):
+        """
+        Starts the trace of a MassSample, when mass_to_velocity takes it
+        """
+        return Trace(sample.seq, sample.timestamp, time.monotonic_ns())
+
+    def finish(self, trace):
+        """
+        Records a trace that is done: it reached the motors, or it was replaced
+        """
+        with self.lock:
+            self.traces += 1
+            if not trace.drive:
+                self.superseded += 1
+                return
+            if trace.motor:
+                self.motor += 1
+            else:
+                self.unchanged += 1
+            for name, start, end in STAGES:
+                stop = getattr(trace, end)
+                if stop:
+                    self.histograms[name].record(stop - getattr(trace, start))
+            self.recent.append(trace)
+
+    def stats(self):
+        """
+        Returns the trace counts and the latency of each stage, in ms
+        """
+        with self.lock:
+            stats = {
+                'traces': self.traces,
+                'motor': self.motor,
+                'unchanged': self.unchanged,
+                'superseded': self.superseded,
+            }
+            for name, histogram in self.histograms.items():
+                stats[name + '_ms'] = histogram.summary(1e6)
+        return stats
+
+    def export(self):
+        """
+        Returns the stats, the histogram buckets (upper bound ns -> count) and the
+        recent traces as [id, received, velocity, drive, motor], ready for json
+        """
+        stats = self.stats()
+        with self.lock:
+            buckets = {name: {bucket_upper(idx): n for idx, n in enumerate(histogram.counts) if n}
+                       for name, histogram in self.histograms.items()}
+            recent = [trace.as_list() for trace in self.recent]
+        return {'stats': stats, 'buckets_ns': buckets, 'recent': recent}
+
+    def export_file(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.export(), f)
+        os.replace(tmp, path)
+
+tracer = None   # the Tracer while tracing is on
+path = None     # where the kernel exports the traces, if set
+
+def enable(export_path=None):
+    global tracer, path
+    if tracer is None:
+        tracer = Tracer()
+    path = export_path
+
+def disable():
+    global tracer
+    tracer = None
+
+_env = os.environ.get("ALPHABOT_TRACE")
+if _env:
+    enable(None if _env == "1" else _env)
@@ -0,0 +1,180 @@
+""" Several WiiBoards read from one thread
+
+BoardManager connects N boards and multiplexes their receive sockets in a single
+selectors loop. Each board keeps its own calibration and sample ring buffer, and
+read_merged returns the samples of every board ordered by receive time.
+"""
+import heapq
+import logging
+import selectors
+import socket
+import threading
+import time
+
+from wii_balance.WiiBoard import RECV_TIMEOUT, SAMPLE_CAPACITY, WiiBoard, find_boards
+
+# initialize the logger
+logger = logging.getLogger(__name__)
+handler = logging.StreamHandler() # or RotatingFileHandler
+handler.setFormatter(logging.Formatter('[%(asctime)s][%(name)s][%(levelname)s] %(message)s'))
+logger.addHandler(handler)
+logger.setLevel(logging.INFO) # or DEBUG
+
+class BoardManager():
+    '''
+    Reads any number of boards from one event loop thread
+    '''
+    def __init__(self, capacity=SAMPLE_CAPACITY, **kwargs):
+        '''
+        Parameters:
+        -------------
+        capacity : int
+            Number of responses buffered per board
+        kwargs :
+            Passed to every WiiBoard (cache, socket_factory, ...)
+        '''
+        self.capacity = capacity
+        self.board_options = kwargs
+        self.boards = {}        # name -> WiiBoard
+        self.selector = selectors.DefaultSelector()
+        self.thread = None
+        self.running = False
+
+        self.loops = 0          # selector wake-ups
+        self.packets = 0
+        self.cpu_s = 0.0        # CPU time of the event loop thread
+
+    def discover(self, duration=3):
+        '''
+        Connect every board found by a Bluetooth scan
+
+        Returns:
+            names: addresses of the boards that connected
+        '''
+        return [address for address in find_boards(duration) if self.connect(address)]
+
+    def connect(self, address):
+        '''
+        Connect the board at address and add it to the loop
+        '''
+        if address in self.boards:
+            return True
+        board = WiiBoard(capacity=self.capacity, **self.board_options)
+        board.board_address = address
+        if not board.connect():
+            return False
+        board.load_calibration()
+        self.add(board, address)
+        board.calibrate()
+        return True
+
+    def add(self, board, name=None):
+        '''
+        Add an attached board (any pair of sockets works, see WiiBoard.attach)
+
+        Returns:
+            name: the key of the board in self.boards and in the merged samples
+        '''
+        if name is None:
+            name = board.board_address or "board%d" % len(self.boards)
+        # The loop only reads sockets that are ready, and drains them without waiting
+        board.receiveSocket.settimeout(0.0)
+        self.boards[name] = board
+        self.selector.register(board.receiveSocket, selectors.EVENT_READ, (name, board))
+        logger.info("Added board %s (%d boards)", name, len(self.boards))
+        return name
+
+    def remove(self, name):
+        board = self.boards.pop(name, None)
+        if board is None:
+            return
+        if board.receiveSocket is not None:
+            self.selector.unregister(board.receiveSocket)
+        board.close()
+        logger.info("Removed board %s", name)
+
+    def poll(self, timeout=0.0):
+        '''
+        Wait up to timeout for packets and read every packet that is waiting
+
+        Returns:
+            packets: number of packets read
+        '''
+        packets = 0
+        events = self.selector.select(timeout)
+        self.loops += 1
+        for key, _ in events:
+            name, board = key.data
+            while True:
+                length = board.receive(socket.MSG_DONTWAIT)
+                if length is None:
+                    break
+                packets += 1
+                response = board.handle_packet(board.packet, length)
+                if response is not None:
+                    board.samples.put(response)
+            if not board.connected:
+                logger.warning("Board %s disconnected", name)
+                self.selector.unregister(key.fileobj)
+                del self.boards[name]
+                # Release its recorder and threads, connect() adds the address again
+                board.close()
+        self.packets += packets
+        return packets
+
+    def start(self):
+        '''
+        Run the event loop in a background thread
+        '''
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="wiiboard-manager", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def close(self):
+        self.stop()
+        for name in list(self.boards):
+            self.remove(name)
+        self.selector.close()
+
+    def _run(self):
+        start = time.thread_time()
+        while self.running:
+            if self.boards:
+                self.poll(RECV_TIMEOUT)
+            else:
+                time.sleep(RECV_TIMEOUT)
+            self.cpu_s = time.thread_time() - start
+
+    def read_all(self):
+        '''
+        Returns the responses of each board received since the previous call,
+        as {name: [response, ...]}, oldest first
+        '''
+        return {name: board.samples.drain() for name, board in list(self.boards.items())}
+
+    def read_merged(self):
+        '''
+        Returns the responses of every board received since the previous call,
+        merged by receive time, as a list of (name, response)
+        '''
+        streams = [[(response.timestamp, name, response) for response in responses]
+                   for name, responses in self.read_all().items()]
+        return [(name, response) for _, name, response in heapq.merge(*streams, key=lambda entry: entry[0])]
+
+    def stats(self):
+        return {
+            'boards': len(self.boards),
+            'loops': self.loops,
+            'packets': self.packets,
+            'cpu_s': self.cpu_s,
+            'readers': {name: board.reader_stats() for name, board in self.boards.items()},
+            'reports': {name: board.report_stats() for name, board in self.boards.items()},
+        }
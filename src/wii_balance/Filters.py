@@ -0,0 +1,285 @@
+""" Signal conditioning of the WiiBoard mass samples
+
+Incremental filters that sit between WiiBoard and Alphabot.mass_to_velocity. Each
+filter works on the 4 corners at once, in TOP_RIGHT, BOTTOM_RIGHT, TOP_LEFT,
+BOTTOM_LEFT order (the order of WiiBoard.decode_masses), and costs O(1) per sample.
+The batch functions at the end do the same on a numpy array of a whole log.
+"""
+from bisect import bisect_left, insort
+import logging
+
+from wii_balance.WiiBoard import MassSample
+try:
+    import numpy as np
+except ImportError:     # only needed by the batch functions
+    np = None
+
+# initialize the logger
+logger = logging.getLogger(__name__)
+handler = logging.StreamHandler() # or RotatingFileHandler
+handler.setFormatter(logging.Formatter('[%(asctime)s][%(name)s][%(levelname)s] %(message)s'))
+logger.addHandler(handler)
+logger.setLevel(logging.INFO) # or DEBUG
+
+CHANNELS        = 4
+# Distance between the sensors, in mm
+BOARD_WIDTH     = 433   # left to right
+BOARD_LENGTH    = 238   # top to bottom
+# Below this total mass (kg) there is nobody on the board
+EMPTY_MASS      = 5.0
+TARE_SAMPLES    = 100   # empty samples averaged into the offset, 1 s at 100 Hz
+EMA_CHUNK       = 256   # rows per matrix product of the batch EMA
+
+class MovingAverage():
+    '''
+    Mean of the last window samples, kept as a running sum
+    '''
+    def __init__(self, window=5):
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.buffer = [[0.0] * CHANNELS for _ in range(self.window)]
+        self.sums = [0.0] * CHANNELS
+        self.index = 0
+        self.count = 0
+
+    def update(self, values):
+        old = self.buffer[self.index]
+        sums = self.sums
+        for i in range(CHANNELS):
+            sums[i] += values[i] - old[i]
+            old[i] = values[i]
+        self.index += 1
+        if self.index == self.window:
+            self.index = 0
+            # Re-add the window once per lap, so rounding errors don't pile up
+            self.sums = sums = [sum(row[i] for row in self.buffer) for i in range(CHANNELS)]
+        if self.count < self.window:
+            self.count += 1
+        n = self.count
+        return [s / n for s in sums]
+
+class ExponentialFilter():
+    '''
+    Exponential moving average: y += alpha * (x - y)
+    '''
+    def __init__(self, alpha=0.2):
+        self.alpha = alpha
+        self.reset()
+
+    def reset(self):
+        self.values = None
+
+    def update(self, values):
+        if self.values is None:
+            self.values = list(values)
+            return list(values)
+        alpha = self.alpha
+        state = self.values
+        for i in range(CHANNELS):
+            state[i] += alpha * (values[i] - state[i])
+        return list(state)
+
+class MedianFilter():
+    '''
+    Median of the last window samples, removes single sample spikes.
+    Each corner keeps its window sorted, so a sample costs a bisect and a shift
+    of at most window entries
+    '''
+    def __init__(self, window=5):
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.buffer = [[0.0] * CHANNELS for _ in range(self.window)]
+        self.sorted = [[] for _ in range(CHANNELS)]
+        self.index = 0
+
+    def update(self, values):
+        old = self.buffer[self.index]
+        full = len(self.sorted[0]) == self.window
+        result = []
+        for i in range(CHANNELS):
+            window = self.sorted[i]
+            if full:
+                del window[bisect_left(window, old[i])]
+            insort(window, values[i])
+            old[i] = values[i]
+            n = len(window)
+            half = n // 2
+            result.append(window[half] if n % 2 else (window[half - 1] + window[half]) / 2)
+        self.index = (self.index + 1) % self.window
+        return result
+
+class AutoTare():
+    '''
+    Learns the offset each corner reads with the board empty and subtracts it.
+    Samples whose total is below empty_mass are summed, and once there are
+    samples of them in a row their mean becomes the offset. A heavier sample
+    (somebody on the board) drops the partial sum
+    '''
+    def __init__(self, empty_mass=EMPTY_MASS, samples=TARE_SAMPLES):
+        self.empty_mass = empty_mass
+        self.samples = samples
+        self.reset()
+
+    def reset(self):
+        '''
+        Forgets the offset too: after a reconnect the board is tared again
+        '''
+        self.offset = [0.0] * CHANNELS
+        self.tared = False
+        self.restart()
+
+    def restart(self):
+        self.sums = [0.0] * CHANNELS
+        self.count = 0
+
+    def update(self, values):
+        if sum(values) < self.empty_mass:
+            sums = self.sums
+            for i in range(CHANNELS):
+                sums[i] += values[i]
+            self.count += 1
+            if self.count == self.samples:
+                self.offset = [s / self.samples for s in sums]
+                if not self.tared:
+                    logger.info("Board tared: %s", ["%.2f" % o for o in self.offset])
+                self.tared = True
+                self.restart()
+        elif self.count:
+            self.restart()  # somebody stepped on the board
+        offset = self.offset
+        return [max(values[i] - offset[i], 0.0) for i in range(CHANNELS)]
+
+class MassFilter():
+    '''
+    Filter stage of the mass samples: tare, then each filter in order.
+    update returns a new MassSample, and keeps its center of pressure in cop
+    '''
+    def __init__(self, filters=(), tare=None):
+        '''
+        Parameters:
+        -------------
+        filters : list
+            MovingAverage, ExponentialFilter, MedianFilter (or anything with update/reset)
+        tare : AutoTare
+            Removes the empty board offset, None to use the masses as they are
+        '''
+        self.filters = list(filters)
+        self.tare = tare
+        self.cop = None     # (x, y) mm of the latest sample, None if the board is empty
+        self.samples = 0
+
+    def reset(self):
+        '''
+        Back to the state of a new filter, the tare offset included
+        '''
+        if self.tare is not None:
+            self.tare.reset()
+        for f in self.filters:
+            f.reset()
+        self.cop = None
+
+    def update(self, sample):
+        values = self.update_values([sample.top_right, sample.bottom_right, sample.top_left, sample.bottom_left])
+        return MassSample(values[0], values[1], values[2], values[3], sample.timestamp, sample.seq)
+
+    def update_values(self, values):
+        '''
+        Same as update, on the 4 corner masses (a row of a ReadBatch)
+        '''
+        if self.tare is not None:
+            values = self.tare.update(values)
+        for f in self.filters:
+            values = f.update(values)
+        self.samples += 1
+        self.cop = center_of_pressure(values)
+        return values
+
+def center_of_pressure(values, empty_mass=EMPTY_MASS):
+    '''
+    Center of pressure of the corner masses, in mm from the center of the board
+
+    Returns:
+        cop: (x, y), x positive to the right and y to the top, or None below empty_mass
+    '''
+    top_right, bottom_right, top_left, bottom_left = values
+    total = top_right + bottom_right + top_left + bottom_left
+    if total < empty_mass:
+        return None
+    x = BOARD_WIDTH / 2 * ((top_right + bottom_right) - (top_left + bottom_left)) / total
+    y = BOARD_LENGTH / 2 * ((top_right + top_left) - (bottom_right + bottom_left)) / total
+    return x, y
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("Batch filtering needs numpy")
+
+def moving_average(masses, window=5):
+    '''
+    MovingAverage over a (N, 4) array of masses, with the same warm-up
+    '''
+    _require_numpy()
+    masses = np.asarray(masses, dtype=np.float64)
+    sums = np.cumsum(masses, axis=0)
+    sums[window:] = sums[window:] - sums[:-window]
+    counts = np.minimum(np.arange(1, len(masses) + 1), window)
+    return sums / counts[:, None]
+
+def exponential(masses, alpha=0.2):
+    '''
+    ExponentialFilter over a (N, 4) array of masses. Each chunk of rows is one
+    matrix product with the decay weights, starting from the last filtered row
+    '''
+    _require_numpy()
+    masses = np.asarray(masses, dtype=np.float64)
+    out = np.empty_like(masses)
+    if not len(masses):
+        return out
+    steps = np.arange(EMA_CHUNK)
+    decay = (1 - alpha) ** (steps + 1)
+    lag = steps[:, None] - steps[None, :]
+    weights = np.where(lag >= 0, alpha * (1 - alpha) ** np.maximum(lag, 0), 0.0)
+    state = masses[0]   # the first output is the first sample, like the streaming filter
+    for start in range(0, len(masses), EMA_CHUNK):
+        chunk = masses[start:start + EMA_CHUNK]
+        n = len(chunk)
+        # y[k] = (1-a)^(k+1) * y[-1] + sum_j a (1-a)^(k-j) x[j]
+        out[start:start + n] = decay[:n, None] * state + weights[:n, :n] @ chunk
+        state = out[start + n - 1]
+    return out
+
+def median(masses, window=5):
+    '''
+    MedianFilter over a (N, 4) array of masses, with the same warm-up
+    '''
+    _require_numpy()
+    masses = np.asarray(masses, dtype=np.float64)
+    out = np.empty_like(masses)
+    head = min(window - 1, len(masses))
+    for k in range(head):
+        out[k] = np.median(masses[:k + 1], axis=0)
+    if len(masses) >= window:
+        windows = np.lib.stride_tricks.sliding_window_view(masses, window, axis=0)
+        out[window - 1:] = np.median(windows, axis=-1)
+    return out
+
+def centers_of_pressure(masses, empty_mass=EMPTY_MASS):
+    '''
+    center_of_pressure of a (N, 4) array of masses
+
+    Returns:
+        cop: (N, 2) array of x, y in mm, NaN where the board is empty
+    '''
+    _require_numpy()
+    masses = np.asarray(masses, dtype=np.float64)
+    top_right, bottom_right, top_left, bottom_left = masses.T
+    total = masses.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = BOARD_WIDTH / 2 * ((top_right + bottom_right) - (top_left + bottom_left)) / total
+        y = BOARD_LENGTH / 2 * ((top_right + top_left) - (bottom_right + bottom_left)) / total
+    cop = np.stack([x, y], axis=1)
+    cop[total < empty_mass] = np.nan
+    return cop
@@ -0,0 +1,160 @@
+""" Packet log reader and replay backend for the WiiBoard
+
+Feeds a log written by WiiBoard(record=path) through the same read_data /
+readCalibrationData parsing path as a live board, in real time or as fast as possible.
+
+usage: python -m wii_balance.Replay <log> [realtime]
+"""
+import mmap
+import socket
+import sys
+import time
+
+from wii_balance.WiiBoard import LOG_MAGIC, LOG_RECORD, WiiBoard
+
+class PacketLog():
+    '''
+    Read-only view of a packet log, mapped in memory
+    '''
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(LOG_MAGIC)] != LOG_MAGIC:
+            self.map.close()
+            raise ValueError("%s is not a WiiBoard packet log" % path)
+        self.view = memoryview(self.map)
+
+    def __iter__(self):
+        '''
+        Yields (timestamp ns, packet memoryview) for every record
+        '''
+        view = self.view
+        offset = len(LOG_MAGIC)
+        end = len(view)
+        while offset + LOG_RECORD.size <= end:
+            timestamp, length = LOG_RECORD.unpack_from(view, offset)
+            offset += LOG_RECORD.size
+            if offset + length > end:   # truncated record at the end of the log
+                return
+            yield timestamp, view[offset:offset + length]
+            offset += length
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def close(self):
+        self.view.release()
+        self.map.close()
+
+class ReplaySocket():
+    '''
+    Stands in for the board receive socket, returning the logged packets.
+    With realtime the packets come out with their recorded spacing (divided by speed)
+    '''
+    def __init__(self, log, realtime=False, speed=1.0):
+        self.log = log
+        self.records = iter(log)
+        self.pending = None # record that wasn't due yet, delivered by the next call
+        self.realtime = realtime
+        self.speed = speed
+        self.first = None   # (recorded, replayed) time of the first packet
+        self.timeout = None
+        self.packets = 0
+        self.timestamp = 0  # recorded time of the latest packet
+
+    def recv_into(self, buffer, nbytes=0, flags=0):
+        record = self.pending
+        if record is None:
+            record = next(self.records, None)
+        else:
+            self.pending = None
+        if record is None:
+            return 0    # end of the log, like a closed connection
+        timestamp, packet = record
+        if self.realtime:
+            if self.first is None:
+                self.first = (timestamp, time.monotonic_ns())
+            due = self.first[1] + (timestamp - self.first[0]) / self.speed
+            delay = (due - time.monotonic_ns()) / 1e9
+            if delay > 0 and flags & socket.MSG_DONTWAIT:
+                self.pending = record
+                raise BlockingIOError("no packet due yet")
+            if self.timeout is not None and delay > self.timeout:
+                # Like a real socket, time out and deliver the packet on the next call
+                self.pending = record
+                time.sleep(self.timeout)
+                raise socket.timeout("timed out")
+            if delay > 0:
+                time.sleep(delay)
+        self.timestamp = timestamp
+        length = min(len(packet), nbytes or len(buffer))
+        buffer[:length] = packet[:length]
+        self.packets += 1
+        return length
+
+    def recv(self, bufsize):
+        buffer = bytearray(bufsize)
+        return bytes(buffer[:self.recv_into(buffer)])
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def setblocking(self, flag):
+        self.timeout = None if flag else 0.0
+
+    def close(self):
+        self.records = iter(())
+        self.pending = None
+
+class NullSocket():
+    '''
+    Stands in for the board control socket, keeping the commands sent to it
+    '''
+    def __init__(self):
+        self.sent = []
+
+    def send(self, data):
+        self.sent.append(bytes(data))
+        return len(data)
+
+    def settimeout(self, timeout):
+        pass
+
+    def setblocking(self, flag):
+        pass
+
+    def close(self):
+        pass
+
+def replay_board(path, realtime=False, speed=1.0, **kwargs):
+    '''
+    Returns a WiiBoard that reads the packets of a log, waiting for its calibration
+    like connectToBoard does after connecting. The board cache is left alone unless
+    a cache path is given
+    '''
+    board = WiiBoard(**kwargs)
+    replay = ReplaySocket(PacketLog(path), realtime, speed)
+    board.attach(NullSocket(), replay)
+    if not realtime:
+        # Sample timestamps and report stats follow the recording, not the replay
+        board.clock = lambda: replay.timestamp
+    board.calibrate()
+    return board
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python -m wii_balance.Replay <log> [realtime]")
+        sys.exit(1)
+    board = replay_board(sys.argv[1], realtime=len(sys.argv) > 2 and sys.argv[2] == "realtime")
+    replay = board.receiveSocket
+    start = time.perf_counter()
+    board.readCalibrationData()
+    responses = 0
+    while board.connected:
+        response = board.read_data()
+        if response is not None:
+            responses += 1
+            print(response)
+    elapsed = time.perf_counter() - start
+    print("Replayed %d packets (%d responses) in %.3f s" % (replay.packets, responses, elapsed))
+    print("Board reports: %s" % board.report_stats())
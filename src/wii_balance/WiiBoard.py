@@ -9,11 +9,24 @@ You only need to install `python-bluez` or `python-bluetooth` package.
 LICENSE LGPL <http://www.gnu.org/licenses/lgpl.html>
         (c) Nedim Jackman 2008 (c) Pierrick Koch 2016
 """
+from array import array
+from collections import OrderedDict
+import json
 import logging
-import bluetooth
+import os
 import socket
 import struct
+import threading
+import time
 from enum import Enum
+try:
+    import bluetooth
+except ImportError:     # only needed to discover the board
+    bluetooth = None
+try:
+    import numpy as np
+except ImportError:     # only needed by the batch decoder
+    np = None
 
 # Wiiboard Parameters
 CONTINUOUS_REPORTING    = b'\x04'
@@ -40,9 +53,24 @@ T_SLEEP                 = 2
 # Socket Parameters
 SEND_SOCKET_PORT        = 0x11
 RECV_SOCKET_PORT        = 0x13
+RECV_TIMEOUT            = 0.1
+CONNECT_TIMEOUT         = 5.0
+# Reconnection Parameters
+BOARD_CACHE             = os.path.expanduser("~/.wiiboard.json")
+BACKOFF_MIN             = 1.0
+BACKOFF_MAX             = 30.0
+PACKET_SIZE             = 25
+# Reader thread Parameters
+SAMPLE_CAPACITY         = 256
+COMMAND_CAPACITY        = 32    # pending control commands before the oldest are dropped
+# Packet log: a header, then (monotonic ns, length) + packet per record
+LOG_MAGIC               = b"WBBLOG1\n"
+LOG_RECORD              = struct.Struct('<QH')
 # Wiiboard payloads
 CALIBRATION_REQ_PAYLOAD = b"\x04\xA4\x00\x24\x00\x18"
 MASS_REQ_PAYLOAD        = b"\x04\xA4\x00\x40\x00"
+# The four sensors, big endian, in TOP_RIGHT, BOTTOM_RIGHT, TOP_LEFT, BOTTOM_LEFT order
+MASS_FORMAT             = struct.Struct('>4H')
 
 # initialize the logger
 logger = logging.getLogger(__name__)
@@ -57,15 +85,509 @@ class ResponseType(Enum):
     MASS = 2
     BUTTON = 3
 
-class WiiBoard():
+class ConnectState(Enum):
+    DISCONNECTED = 0
+    DIRECT = 1          # connecting straight to the cached address
+    DISCOVERING = 2     # inquiry scan for the board
+    BACKOFF = 3         # waiting before the next attempt
+    CONNECTED = 4
+
+class Response():
+    '''
+    A parsed board report: type is a ResponseType, data depends on it
+    '''
+    __slots__ = ('type', 'data', 'timestamp')
+
+    def __init__(self, type, data, timestamp=0):
+        self.type = type
+        self.data = data
+        self.timestamp = timestamp  # monotonic ns when it was received
+
+    def __repr__(self):
+        return "Response(%s, %r)" % (self.type, self.data)
+
+class MassSample():
+    '''
+    Mass read by each sensor, in kg. It is its own response, with type MASS
+    '''
+    __slots__ = ('top_right', 'bottom_right', 'top_left', 'bottom_left', 'timestamp', 'seq')
+    type = ResponseType.MASS
+
+    def __init__(self, top_right, bottom_right, top_left, bottom_left, timestamp=0, seq=0):
+        self.top_right = top_right
+        self.bottom_right = bottom_right
+        self.top_left = top_left
+        self.bottom_left = bottom_left
+        self.timestamp = timestamp  # monotonic ns when it was received
+        self.seq = seq              # number of the sample since the board connected
+
+    @property
+    def data(self):
+        return self
+
+    def total(self):
+        return self.top_right + self.bottom_right + self.top_left + self.bottom_left
+
+    def as_dict(self):
+        return {
+            'top_right': self.top_right,
+            'bottom_right': self.bottom_right,
+            'top_left': self.top_left,
+            'bottom_left': self.bottom_left,
+        }
+
+    def __repr__(self):
+        return "MassSample(tr=%.2f, br=%.2f, tl=%.2f, bl=%.2f)" % (
+            self.top_right, self.bottom_right, self.top_left, self.bottom_left)
+
+class ReportStats():
+    '''
+    Running statistics of the mass report arrivals. The reports carry no counter,
+    so gaps and duplicates are told apart by their spacing: a gap is an interval
+    longer than GAP_FACTOR times the usual one, a duplicate a report with the same
+    masses as the previous one that came in less than half the usual interval
+    '''
+    GAP_FACTOR = 1.5
+    SMOOTHING = 0.05    # weight of a new interval in the usual interval
+
     def __init__(self):
+        self.count = 0
+        self.first = 0
+        self.last = 0
+        self.previous = None    # masses of the previous report
+        self.interval = 0.0     # usual interval (EMA), ns
+        # Welford mean and variance of the intervals, ns
+        self.intervals = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = 0
+        self.max = 0
+        self.gaps = 0
+        self.missed = 0         # reports estimated lost in the gaps
+        self.duplicates = 0
+
+    def record(self, timestamp, masses):
+        self.count += 1
+        if self.count == 1:
+            self.first = self.last = timestamp
+            self.previous = masses
+            return
+        delta = timestamp - self.last
+        usual = self.interval
+        if usual and delta < usual / 2 and masses == self.previous:
+            self.duplicates += 1
+            return
+        self.last = timestamp
+        self.previous = masses
+        if usual and delta > usual * self.GAP_FACTOR:
+            self.gaps += 1
+            self.missed += int(round(delta / usual)) - 1
+        else:
+            self.interval = delta if not usual else usual + self.SMOOTHING * (delta - usual)
+
+        self.intervals += 1
+        diff = delta - self.mean
+        self.mean += diff / self.intervals
+        self.m2 += diff * (delta - self.mean)
+        if self.intervals == 1 or delta < self.min:
+            self.min = delta
+        if delta > self.max:
+            self.max = delta
+
+    def stats(self):
+        '''
+        Returns the achieved report rate and the spacing of the reports, in ms
+        '''
+        elapsed = self.last - self.first
+        n = self.intervals
+        return {
+            'reports': self.count,
+            'rate_hz': (self.count - self.duplicates - 1) * 1e9 / elapsed if elapsed else 0.0,
+            'interval_ms': self.interval / 1e6,
+            'interval_mean_ms': self.mean / 1e6,
+            'interval_min_ms': self.min / 1e6,
+            'interval_max_ms': self.max / 1e6,
+            'jitter_ms': (self.m2 / n) ** 0.5 / 1e6 if n else 0.0,
+            'gaps': self.gaps,
+            'missed': self.missed,
+            'duplicates': self.duplicates,
+        }
+
+class SampleRing():
+    '''
+    Bounded ring buffer between the reader thread and the consumer. When it is
+    full the oldest entry is overwritten
+    '''
+    def __init__(self, capacity):
+        self.slots = [None] * capacity
+        self.capacity = capacity
+        self.head = 0           # entries ever written
+        self.tail = 0           # next entry to read
+        self.overwritten = 0    # entries overwritten before being read
+        self.dropped = 0        # entries skipped by latest()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.head - self.tail
+
+    def put(self, item):
+        with self.lock:
+            if self.head - self.tail == self.capacity:
+                self.tail += 1
+                self.overwritten += 1
+            self.slots[self.head % self.capacity] = item
+            self.head += 1
+
+    def latest(self):
+        '''
+        Returns the newest unread entry and skips the older ones
+        '''
+        with self.lock:
+            if self.head == self.tail:
+                return None
+            self.dropped += self.head - self.tail - 1
+            self.tail = self.head
+            return self.slots[(self.head - 1) % self.capacity]
+
+    def drain(self):
+        '''
+        Returns every unread entry, oldest first
+        '''
+        with self.lock:
+            items = [self.slots[i % self.capacity] for i in range(self.tail, self.head)]
+            self.tail = self.head
+            return items
+
+class PacketRecorder():
+    '''
+    Appends raw packets with their monotonic receive time to a packet log
+    (see wii_balance/Replay.py to read and replay them)
+    '''
+    def __init__(self, path):
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(LOG_MAGIC)
+        self.records = 0
+
+    def write(self, data, length, timestamp=None):
+        if self.file is None:
+            return
+        if timestamp is None:
+            timestamp = time.monotonic_ns()
+        self.file.write(LOG_RECORD.pack(timestamp, length))
+        self.file.write(memoryview(data)[:length])
+        self.records += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+class ReadBatch():
+    '''
+    Everything read_all drained: the other responses (button edges, status,
+    calibration) in the order they arrived, and the mass samples packed in one
+    contiguous array of 4 doubles per sample, in TOP_RIGHT, BOTTOM_RIGHT, TOP_LEFT,
+    BOTTOM_LEFT order
+    '''
+    __slots__ = ('events', 'masses', 'timestamps', 'seqs', 'depth')
+
+    def __init__(self):
+        self.events = []
+        self.masses = array('d')
+        self.timestamps = array('q')    # monotonic ns each mass sample was received
+        self.seqs = array('q')          # sequence number of each mass sample
+        self.depth = 0                  # packets that were waiting
+
+    def add(self, response):
+        if response.type == ResponseType.MASS:
+            self.masses.extend((response.top_right, response.bottom_right, response.top_left, response.bottom_left))
+            self.timestamps.append(response.timestamp)
+            self.seqs.append(response.seq)
+        else:
+            self.events.append(response)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def latest(self):
+        '''
+        Returns the freshest mass sample, or None if there is none
+        '''
+        if not self.timestamps:
+            return None
+        return MassSample(*self.masses[-4:], timestamp=self.timestamps[-1], seq=self.seqs[-1])
+
+    def age_ms(self, now=None):
+        '''
+        Returns how long ago the freshest mass sample was received
+        '''
+        if not self.timestamps:
+            return None
+        if now is None:
+            now = time.monotonic_ns()
+        return (now - self.timestamps[-1]) / 1e6
+
+    def as_numpy(self):
+        '''
+        Returns the masses as an (N, 4) numpy array, without copying them
+        '''
+        if np is None:
+            raise RuntimeError("as_numpy needs numpy")
+        return np.frombuffer(self.masses, dtype=np.float64).reshape(-1, 4)
+
+class CommandQueue():
+    '''
+    Outbound control commands, written by a thread of their own so a stalled
+    control socket never holds up the receive path.
+
+    Commands that set a board state (the LED, the reporting mode) are coalesced:
+    a newer one replaces the pending one and goes to the back of the queue, so it
+    is still sent after the commands put before it, and one that sets the state
+    the board already has is suppressed. Other commands are sent in order, once
+    per identical pending copy
+    '''
+    STATE_COMMANDS = (COMMAND_LIGHT, COMMAND_REPORTING)
+
+    def __init__(self, capacity=COMMAND_CAPACITY):
+        self.capacity = capacity
+        self.pending = OrderedDict()    # key -> (command, payload), oldest first
+        self.known = {}                 # state command -> payload the board has
+        self.condition = threading.Condition()
+        self.socket = None
+        self.thread = None
+        self.sending = False    # the writer took a command and is writing it
+
+        self.queued = 0
+        self.sent = 0
+        self.suppressed = 0     # the board already had that state
+        self.coalesced = 0      # replaced or merged with a pending command
+        self.dropped = 0        # the queue was full
+        self.failures = 0       # sends that timed out or failed
+
+    def start(self, controlSocket):
+        with self.condition:
+            self.socket = controlSocket
+            self.pending.clear()
+            self.known.clear()
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._writer_loop, name="wiiboard-writer", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.socket = None
+            self.pending.clear()
+            self.condition.notify()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def put(self, command, payload):
+        with self.condition:
+            state = command in self.STATE_COMMANDS
+            key = command if state else (command, payload)
+            if key in self.pending:
+                self.coalesced += 1
+                if state and self.known.get(command) == payload:
+                    del self.pending[key]   # back to the state the board has
+                elif state:
+                    self.pending[key] = (command, payload)
+                    self.pending.move_to_end(key)
+                return
+            if state and self.known.get(command) == payload:
+                self.suppressed += 1
+                return
+            if len(self.pending) >= self.capacity:
+                self.pending.popitem(last=False)
+                self.dropped += 1
+            self.pending[key] = (command, payload)
+            self.queued += 1
+            self.condition.notify()
+
+    def update(self, command, payload):
+        '''
+        Record the state the board reported (None if it is unknown again)
+        '''
+        with self.condition:
+            if payload is None:
+                self.known.pop(command, None)
+            else:
+                self.known[command] = payload
+
+    def flush(self, timeout=None):
+        '''
+        Wait until every pending command was written. Returns False on timeout
+        '''
+        with self.condition:
+            return self.condition.wait_for(lambda: (not self.pending and not self.sending) or self.socket is None,
+                                           timeout)
+
+    def _writer_loop(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending or self.socket is None)
+                controlSocket = self.socket
+                if controlSocket is None:
+                    return
+                key, (command, payload) = self.pending.popitem(last=False)
+                self.sending = True
+            try:
+                controlSocket.send(b'\x52' + command + payload)
+            except socket.timeout:
+                self.failures += 1
+                with self.condition:
+                    self.sending = False
+                    if key not in self.pending:     # retry it, unless it was superseded
+                        self.pending[key] = (command, payload)
+                        self.pending.move_to_end(key, last=False)
+                    self.condition.notify_all()
+                continue
+            except OSError as e:
+                self.failures += 1
+                logger.warning("Control socket error: %s", e)
+                with self.condition:
+                    self.sending = False
+                    if self.socket is controlSocket:
+                        self.socket = None
+                    self.condition.notify_all()
+                return
+            with self.condition:
+                self.sending = False
+                self.sent += 1
+                if command in self.STATE_COMMANDS:
+                    self.known[command] = payload
+                self.condition.notify_all()
+
+    def stats(self):
+        return {
+            'pending': len(self.pending),
+            'queued': self.queued,
+            'sent': self.sent,
+            'suppressed': self.suppressed,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+            'failures': self.failures,
+        }
+
+class WiiBoard():
+    def __init__(self, reader=False, capacity=SAMPLE_CAPACITY, record=None, cache=None, socket_factory=None):
+        '''
+        Parameters:
+        -------------
+        reader : bool
+            Read the board from a background thread once connected
+        capacity : int
+            Number of responses the reader thread buffers
+        record : str
+            Path of a packet log every received packet is appended to
+        cache : str
+            Path of the file that keeps the last board address, BOARD_CACHE on the
+            robot. None, the default, reads and writes no file
+        socket_factory : callable
+            Returns a new L2CAP socket, replaced in tests
+        '''
         self.connected = False
-        self.board_address = None
+        self.cache_path = cache
+        self.board_address = self.load_cache().get('address')
         self.running = False
+        self.closed = False         # close() was called, the board stays disconnected
         self.receiveSocket = None
         self.controlSocket = None
+        self.reader_mode = reader
+        self.reader = None
+        self.packet = bytearray(PACKET_SIZE)   # receive buffer, reused for every packet
+        self.samples = SampleRing(capacity)
+        self.recorder = PacketRecorder(record) if record else None
+        self.socket_factory = socket_factory or l2cap_socket
+
+        # Background reconnection
+        self.state = ConnectState.DISCONNECTED
+        self.reconnector = None
+        self.reconnectEvent = threading.Event()     # interrupts the backoff wait
+        self.connectLock = threading.Lock()         # close() against a connection attempt attaching
+        self.disconnected_at = time.monotonic_ns()
+        self.reconnects = 0
+        self.direct_connects = 0
+        self.discover_connects = 0
+        self.reconnect_ms = []  # time to reconnect of the latest reconnections
+        self.calibration_cached = False     # calibration applied from the cache
+        self.calibration_changes = 0        # re-reads that didn't match the cache
+        self.first_sample_ms = []   # connect -> first usable mass sample
+        self.attached_at = 0
+        self.first_sample = False
+        self.commands = CommandQueue()
+        self.received_ns = 0        # monotonic time of the latest packet
+        self.timeouts = 0           # receives that timed out without a packet
+        self.clock = time.monotonic_ns  # the replay stamps packets with their recorded time
+        self.seq = 0                # mass samples since the board connected
+        self.report = ReportStats()
+        self.queue_depth = 0        # packets waiting at the latest read_all
+        self.max_queue_depth = 0
+        self.sample_age_ms = None   # age of the freshest sample at the latest read_all
         # self.connectToBoard()
 
+    def load_cache(self):
+        '''
+        Read the board cache file, returns {} if there is none
+        '''
+        if not self.cache_path:
+            return {}
+        try:
+            with open(self.cache_path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def save_cache(self, **values):
+        '''
+        Update entries of the board cache file
+        '''
+        if not self.cache_path:
+            return
+        cache = self.load_cache()
+        cache.update(values)
+        tmp = self.cache_path + ".tmp"
+        try:
+            with open(tmp, 'w') as file:
+                json.dump(cache, file)
+            os.replace(tmp, self.cache_path)
+        except OSError as e:
+            logger.warning("Could not write the board cache: %s", e)
+
+    def load_calibration(self):
+        '''
+        Apply the calibration cached for the current board address, so mass samples
+        can be decoded before the board answers the calibration request
+
+        Returns:
+            cached: True if there was a calibration for the board
+        '''
+        values = self.load_cache().get('calibration', {}).get(self.board_address)
+        if not values:
+            return False
+        # Back to the register form the board sends, 3 weights x 4 sensors x 2 bytes
+        self.calibration = [[values[pos][i].to_bytes(2, byteorder="big") for pos in range(4)] for i in range(3)]
+        self.calibration_table = self.build_calibration_table()
+        self.calibrated = True
+        self.calibration_cached = True
+        logger.info("Using the cached calibration of %s", self.board_address)
+        return True
+
+    def save_calibration(self):
+        '''
+        Store the calibration of the current board in the cache, as integers
+        per sensor position: [0kg, 17kg, 34kg]
+        '''
+        if self.board_address is None:
+            return
+        calibrations = self.load_cache().get('calibration', {})
+        calibrations[self.board_address] = self.calibration_values()
+        self.save_cache(calibration=calibrations)
+
+    def calibration_values(self):
+        return [[int.from_bytes(self.calibration[i][pos], byteorder="big") for i in range(3)] for pos in range(4)]
+
     def discover(self, duration=3, prefix=BLUETOOTH_NAME):
         '''
         Discover the WiiBoard (1)
@@ -77,11 +599,7 @@ class WiiBoard():
         prefix : str
             The prefix of the WiiBoard name
         '''
-        logger.info("Scan Bluetooth devices for %i seconds...", duration)
-        devices = bluetooth.discover_devices(duration=duration, lookup_names=True)	# Returns [] if it doesn't find any
-        logger.debug("Discover devices finished.")
-        logger.debug("Found devices: %s", str(devices))
-        found_boards = [address for address, name in devices if name.startswith(prefix)]
+        found_boards = find_boards(duration, prefix)
         if not found_boards or len(found_boards) == 0:
             logger.debug("[Discovery] No WiiBoard found")
             return False
@@ -93,40 +611,75 @@ class WiiBoard():
     def connect(self):
         '''
         Connect to the WiiBoard (2)
+
+        Returns:
+            connected: False if there is no address or the board didn't answer
         '''
         if self.board_address is None:
             logger.debug("[Connect] No WiiBoard address found")
-            return
+            return False
+
+        controlSocket = self.socket_factory()
+        receiveSocket = self.socket_factory()
+
+        logger.info("Connecting to %s", self.board_address)
+        try:
+            controlSocket.settimeout(CONNECT_TIMEOUT)
+            receiveSocket.settimeout(CONNECT_TIMEOUT)
+            controlSocket.connect((self.board_address, SEND_SOCKET_PORT))
+            receiveSocket.connect((self.board_address, RECV_SOCKET_PORT))
+        except OSError as e:
+            logger.info("Could not connect to %s: %s", self.board_address, e)
+            controlSocket.close()
+            receiveSocket.close()
+            return False
+        logger.info("Connected sockets")
+
+        with self.connectLock:
+            if self.closed:
+                # close() ran while the sockets were connecting
+                controlSocket.close()
+                receiveSocket.close()
+                return False
+            self.attach(controlSocket, receiveSocket)
+        self.save_cache(address=self.board_address)
+        return True
+
+    def attach(self, controlSocket, receiveSocket):
+        '''
+        Use already connected sockets to talk to the board (a socketpair works too)
+
+        Parameters:
+        -------------
+        controlSocket : socket
+            Socket the commands are sent to
+        receiveSocket : socket
+            Socket the board reports are read from
+        '''
+        self.controlSocket = controlSocket
+        self.receiveSocket = receiveSocket
 
-        self.controlSocket = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_L2CAP)
-        self.receiveSocket = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_L2CAP)
-        
         self.calibration = [[1e4]*4]*3
+        self.calibration_table = None
         self.calibration_requested = False
         self.calibrated = False
         self.light_state = False
         self.button_down = False
         self.battery = 0.0
         self.running = True
-        if self.board_address is None:
-            logger.debug("[Connect] No WiiBoard address found")
-            # Close the sockets to prevent errors
-            self.controlSocket = self.controlSocket.close()
-            self.receiveSocket = self.receiveSocket.close()
-            return
-
-        logger.info("Connecting to %s", self.board_address)
-        self.controlSocket.connect((self.board_address, SEND_SOCKET_PORT))
-        self.receiveSocket.connect((self.board_address, RECV_SOCKET_PORT))
-        logger.info("Connected sockets")
-        
         self.connected = True
-        
+        self.calibration_cached = False
+        self.attached_at = time.monotonic_ns()
+        self.first_sample = False
+        self.seq = 0
+        self.report = ReportStats()
+
         # Set sockets to non-blocking
         #self.controlSocket.setblocking(False)
         #self.receiveSocket.setblocking(False)
-        self.receiveSocket.settimeout(0.1)
-        self.controlSocket.settimeout(0.1)
+        self.receiveSocket.settimeout(RECV_TIMEOUT)
+        self.controlSocket.settimeout(RECV_TIMEOUT)
+        self.commands.start(self.controlSocket)
 
     def calibrate(self):
         '''
@@ -146,189 +699,345 @@ class WiiBoard():
 
     def connectToBoard(self):
         '''
-        Connect to the WiiBoard if not already connected
+        Connect to the WiiBoard if not already connected, without blocking: the
+        connection is made by a background thread, see start_reconnect
         '''
+        if not self.connected and not self.closed:
+            self.start_reconnect()
+
+    def try_connect(self):
+        '''
+        One connection attempt: straight to the last known address first, then
+        with a discovery if that fails. Blocks for up to a few seconds
+
+        Returns:
+            connected: True if the board is connected and calibrating
+        '''
+        connected = False
+        if self.board_address is not None:
+            self.state = ConnectState.DIRECT
+            connected = self.connect()
+            if connected:
+                self.direct_connects += 1
+        if not connected:
+            self.state = ConnectState.DISCOVERING
+            connected = self.discover() and self.connect()
+            if connected:
+                self.discover_connects += 1
+        if not connected:
+            self.state = ConnectState.DISCONNECTED
+            return False
+
+        self.state = ConnectState.CONNECTED
+        cached = self.load_calibration()
+        # Read the calibration even if it was cached, on_calibrated checks it
+        self.calibrate()
+        if self.reader_mode:
+            # The reader thread handles the calibration packets
+            self.start_reader()
+        elif not cached:
+            self.readCalibrationData()
+        return True
+
+    def start_reconnect(self):
+        '''
+        Start the background thread that connects to the board, retrying with an
+        exponential backoff until it succeeds or the board is closed
+        '''
+        if self.reconnector is not None and self.reconnector.is_alive():
+            return
+        self.reconnectEvent.clear()
+        self.reconnector = threading.Thread(target=self._reconnect_loop, name="wiiboard-reconnect", daemon=True)
+        self.reconnector.start()
+
+    def _reconnect_loop(self):
+        backoff = BACKOFF_MIN
+        while not self.connected and not self.closed:
+            try:
+                if self.try_connect():
+                    break
+            except Exception as e:
+                logger.warning("Connection attempt failed: %s", e)
+            self.state = ConnectState.BACKOFF
+            logger.debug("Retrying the connection in %.1f s", backoff)
+            if self.reconnectEvent.wait(backoff):
+                return  # closed
+            backoff = min(backoff * 2, BACKOFF_MAX)
         if not self.connected:
-            if self.discover():
-                self.connect()
+            return
 
-            if self.connected:
-                self.calibrate()
-                self.readCalibrationData()
+        elapsed = (time.monotonic_ns() - self.disconnected_at) / 1e6
+        self.reconnects += 1
+        self.reconnect_ms = self.reconnect_ms[-99:] + [elapsed]
+        logger.info("Connected to the WiiBoard in %.0f ms", elapsed)
+
+    def reconnect_stats(self):
+        '''
+        Returns the connection state and the time to (re)connect, in ms
+        '''
+        times = self.reconnect_ms
+        return {
+            'state': self.state.name,
+            'reconnects': self.reconnects,
+            'direct': self.direct_connects,
+            'discovery': self.discover_connects,
+            'last_ms': times[-1] if times else None,
+            'mean_ms': sum(times) / len(times) if times else None,
+            'max_ms': max(times) if times else None,
+            'calibration_cached': self.calibration_cached,
+            'calibration_changes': self.calibration_changes,
+            'first_sample_ms': self.first_sample_ms[-1] if self.first_sample_ms else None,
+        }
 
     def readCalibrationData(self):
         '''
         Read calibration data from the WiiBoard (4)
         '''
         logger.debug("Attempting to read calibration data...")
-        while self.running and self.receiveSocket and self.connected: 
-            try:
-                data = self.receiveSocket.recv(25)
-
-                # Check if data is empty
-                if not data:
-                    # No more data, close the socket
-                    self.receiveSocket = self.receiveSocket.close()
-                    self.controlSocket = self.controlSocket.close()
-                    self.connected = False
-                    return
-            except socket.error as e:
-                # Handle socket errors (non-blocking call would raise an exception)
-                if e.errno == socket.errno.EWOULDBLOCK:
-                    print("Socket error EWOULDBLOCK: %s" % e)
-                    # No data available, wait a bit
-                    # Or close the socket assuming its disconnected
-                    self.receiveSocket = self.receiveSocket.close()
-                    self.controlSocket = self.controlSocket.close()
-                    self.connected = False
-                else:
-                    # Some other error
-                    print("Socket error: %s" % e)
+        while self.running and self.receiveSocket and self.connected:
+            length = self.receive()
+            if length is None:
                 return None
 
-            # logger.debug("socket.recv(25): %r", data)
-            if len(data) < 2:
-                continue
-            
-            """ 
-            hexCodes = [int(data.hex()[i:i+2], 16) for i in range(0, len(data.hex()), 2)]
-            logger.debug("hexCodes", hexCodes)
-            """
-
-            # byteCodes = [int(data[i]) for i in range(0, len(data))]
-            # logger.debug(f"byteCodes {byteCodes} {len(data)}")
-
-            input_type = data[1] 
-            # logger.debug(f"input_type {input_type}")
-            if input_type == INPUT_STATUS:
-                if len(data) < 8:
-                    return None
-                
-                # Handler for Status Messages
-                batteryLevel = data[7]  # Get byte 7 from the packet
-                logger.debug(f"[INPUT_TYPE] batteryLevel {batteryLevel}")
-                self.battery = batteryLevel / BATTERY_MAX
-                # 0x12: on, 0x02: off/blink
-                # logger.debug("[INPUT_TYPE] data[4]", data[4])
-                self.light_state = data[4] & LED1_MASK == LED1_MASK
-                self.on_status()
-            elif input_type == INPUT_READ_DATA:
-                if len(data) < 8:
-                    return None
-                
-                # Handler for calibration data
-                logger.debug("Got calibration data")
-                if self.calibration_requested:
-                    # logger.debug(f"[INPUT_READ_DATA] data[4] {data[4]}")
-                    length = int(data[4] / 16 + 1)
-                    # logger.debug(f"[INPUT_READ_DATA] length: {length}")
-                    data = data[7:7 + length]
-                    cal = lambda d: [d[j:j+2] for j in [0, 2, 4, 6]]
-                    if length == 16: # First packet of calibration data
-                        self.calibration = [cal(data[0:8]), cal(data[8:16]), [1e4]*4]
-                        continue
-                    elif length < 16: # Second packet of calibration data
-                        self.calibration[2] = cal(data[0:8])
-                        self.calibration_requested = False
-                        return self.on_calibrated()
+            response = self.handle_packet(self.packet, length)
+            if response is not None and response.type == ResponseType.CALIBRATION:
+                return response
 
     def read_data(self):
         '''
         Read data from the WiiBoard (5)
+
+        With the reader thread running this doesn't block, and returns the latest
+        response the thread received since the previous call (or None)
         '''
+        if self.reader_mode:
+            return self.samples.latest()
+
         logger.debug("Attempting to read data...")
         while self.running and self.receiveSocket and self.connected:
-            try:
-                data = self.receiveSocket.recv(25)
+            length = self.receive()
+            if length is None:
+                return None
+
+            response = self.handle_packet(self.packet, length)
+            if response is not None:
+                return response
+
+    def read_samples(self):
+        '''
+        Returns every response the reader thread received since the previous call,
+        oldest first. Without the reader thread, behaves like read_data
+        '''
+        if self.reader_mode:
+            return self.samples.drain()
+        response = self.read_data()
+        return [response] if response is not None else []
+
+    def read_all(self, limit=None):
+        '''
+        Drain every packet that is waiting, without blocking
+
+        Parameters:
+            limit: int
+                stop after this many packets, all of them by default
+
+        Returns:
+            batch: ReadBatch with the button events in order and the mass samples
+        '''
+        batch = ReadBatch()
+        if self.reader_mode:
+            responses = self.samples.drain()
+            batch.depth = len(responses)
+            for response in responses:
+                batch.add(response)
+        elif self.receiveSocket and self.connected:
+            # A socket with a timeout waits for data even with MSG_DONTWAIT
+            self.receiveSocket.settimeout(0.0)
+            while self.running and self.connected:
+                if limit is not None and batch.depth >= limit:
+                    break
+                length = self.receive(socket.MSG_DONTWAIT)
+                if length is None:
+                    break
+                batch.depth += 1
+                response = self.handle_packet(self.packet, length)
+                if response is not None:
+                    batch.add(response)
+            if self.receiveSocket:
+                self.receiveSocket.settimeout(RECV_TIMEOUT)
+
+        self.queue_depth = batch.depth
+        self.max_queue_depth = max(self.max_queue_depth, batch.depth)
+        self.sample_age_ms = batch.age_ms()
+        return batch
+
+    def receive(self, flags=0):
+        '''
+        Receive one packet from the board into self.packet, which is reused for every
+        packet. Returns its length, or None on a timeout or error, after closing
+        the connection if the board went away. With socket.MSG_DONTWAIT it returns
+        None right away when there is no packet waiting
+        '''
+        try:
+            length = self.receiveSocket.recv_into(self.packet, 0, flags)
+
+            # Check if data is empty
+            if not length:
+                # No more data, close the socket
+                self.disconnect()
+                return None
+            self.received_ns = self.clock()
+            if self.recorder is not None:
+                self.recorder.write(self.packet, length, self.received_ns)
+        except socket.timeout:
+            # The reader thread just tries again, the count is in reader_stats
+            self.timeouts += 1
+            logger.debug("Receive timed out")
+            return None
+        except BlockingIOError:
+            # Nothing waiting (MSG_DONTWAIT)
+            return None
+        except OSError as e:
+            # The board went away (ECONNRESET, EBADF, ...). Close the connection so
+            # the reader stops and connectToBoard can reconnect
+            logger.warning("Socket error, disconnecting: %s", e)
+            self.disconnect()
+            return None
+        return length
+
+    def handle_packet(self, data, length=None):
+        '''
+        Parse a packet received from the board. The packet is only read in place,
+        so data can be a buffer that is reused for the next packet
+
+        Parameters:
+            data: bytes-like
+                the packet
+            length: int
+                number of valid bytes in data, all of them by default
+
+        Returns:
+            response: the response built from the packet, or None if it has none
+        '''
+        if length is None:
+            length = len(data)
+        # logger.debug("socket.recv(25): %r", data)
+        if length < 2:   # Skip empty data
+            return None
+
+        """ 
+        hexCodes = [int(data.hex()[i:i+2], 16) for i in range(0, len(data.hex()), 2)]
+        logger.debug("hexCodes", hexCodes)
+        """
+
+        # byteCodes = [int(data[i]) for i in range(0, len(data))]
+        # logger.debug(f"byteCodes {byteCodes} {len(data)}")
+
+        input_type = data[1] 
+        # logger.debug(f"input_type | packet size {str(input_type)} | {len(data)}")
+        if input_type == INPUT_STATUS:
+            if length < 8:
+                return None
                 
-                # Check if data is empty
-                if not data:
-                    # No more data, close the socket
-                    self.receiveSocket = self.receiveSocket.close()
-                    self.controlSocket = self.controlSocket.close()
-                    self.connected = False
-                    return
-            except socket.error as e:
-                # Handle socket errors (non-blocking call would raise an exception)
-                if e.errno == socket.errno.EWOULDBLOCK:
-                    print("Socket error EWOULDBLOCK: %s" % e)
-                    # No data available, wait a bit
-                    # Or close the socket assuming its disconnected
-                    self.receiveSocket = self.receiveSocket.close()
-                    self.controlSocket = self.controlSocket.close()
-                    self.connected = False
-                else:
-                    # Some other error
-                    print("Socket error: %s" % e)
+            # Handler for Status Messages
+            batteryLevel = data[7]  # Get byte 7 from the packet
+            logger.debug(f"[INPUT_TYPE] batteryLevel {batteryLevel}")
+            self.battery = batteryLevel / BATTERY_MAX
+            # 0x12: on, 0x02: off/blink
+            # logger.debug("[INPUT_TYPE] data[4]", data[4])
+            self.light_state = data[4] & LED1_MASK == LED1_MASK
+            return self.on_status()
+        elif input_type == INPUT_READ_DATA:
+            # Handler for calibration data
+            logger.debug("Got calibration data")
+            if length < 8:
                 return None
             
-            # logger.debug("socket.recv(25): %r", data)
-            if len(data) < 2:   # Skip empty data
+            if self.calibration_requested:
+                # logger.debug(f"[INPUT_READ_DATA] data[4] {data[4]}")
+                cal_length = int(data[4] / 16 + 1)
+                # logger.debug(f"[INPUT_READ_DATA] length: {cal_length}")
+                data = bytes(data[7:7 + cal_length])   # copied, the packet buffer is reused
+                cal = lambda d: [d[j:j+2] for j in [0, 2, 4, 6]]
+                if cal_length == 16: # First packet of calibration data
+                    self.calibration = [cal(data[0:8]), cal(data[8:16]), [1e4]*4]
+                elif cal_length < 16: # Second packet of calibration data
+                    self.calibration[2] = cal(data[0:8])
+                    self.calibration_requested = False
+                    return self.on_calibrated()
+        elif input_type == EXTENSION_8BYTES:
+            # Handler for Button and Mass data
+            # logger.debug("[EXTENSION] EXTENSION_8BYTES")
+            if (not self.calibrated):   # If not calibrated, ignore
+                logger.info("Not calibrated, ignoring data")
+                return None
+
+            if length < 4:	# If the button data is empty, ignore it
+                return None
+            # Only the second byte of the state is the button state
+            buttonRes = self.check_button(data[3])
+            if buttonRes is not None:   # If there is a button event
+                return buttonRes
+
+            if length < 12:	# Data packet is not valid
+                return None
+            massVal = self.get_mass(data, 4)
+            return self.on_mass(massVal)
+        return None
+
+    def start_reader(self):
+        '''
+        Start a thread that drains the receive socket into the sample ring buffer.
+        read_data and read_samples then never block
+        '''
+        self.reader_mode = True
+        if self.reader is not None and self.reader.is_alive():
+            return
+        self.reader = threading.Thread(target=self._reader_loop, name="wiiboard-reader", daemon=True)
+        self.reader.start()
+
+    def stop_reader(self):
+        reader = self.reader
+        self.reader = None
+        if reader is not None and reader is not threading.current_thread():
+            reader.join()
+
+    def _reader_loop(self):
+        me = threading.current_thread()
+        while self.reader is me and self.running and self.receiveSocket and self.connected:
+            length = self.receive()
+            if length is None:
                 continue
-            
-            """ 
-            hexCodes = [int(data.hex()[i:i+2], 16) for i in range(0, len(data.hex()), 2)]
-            logger.debug("hexCodes", hexCodes)
-            """
-
-            # byteCodes = [int(data[i]) for i in range(0, len(data))]
-            # logger.debug(f"byteCodes {byteCodes} {len(data)}")
-
-            input_type = data[1] 
-            # logger.debug(f"input_type | packet size {str(input_type)} | {len(data)}")
-            if input_type == INPUT_STATUS:
-                if len(data) < 8:
-                    return None
-                    
-                # Handler for Status Messages
-                batteryLevel = data[7]  # Get byte 7 from the packet
-                logger.debug(f"[INPUT_TYPE] batteryLevel {batteryLevel}")
-                self.battery = batteryLevel / BATTERY_MAX
-                # 0x12: on, 0x02: off/blink
-                # logger.debug("[INPUT_TYPE] data[4]", data[4])
-                self.light_state = data[4] & LED1_MASK == LED1_MASK
-                return self.on_status()
-            elif input_type == INPUT_READ_DATA:
-                # Handler for calibration data
-                logger.debug("Got calibration data")
-                if len(data) < 8:
-                    return None
-                
-                if self.calibration_requested:
-                    # logger.debug(f"[INPUT_READ_DATA] data[4] {data[4]}")
-                    length = int(data[4] / 16 + 1)
-                    # logger.debug(f"[INPUT_READ_DATA] length: {length}")
-                    data = data[7:7 + length]
-                    cal = lambda d: [d[j:j+2] for j in [0, 2, 4, 6]]
-                    if length == 16: # First packet of calibration data
-                        self.calibration = [cal(data[0:8]), cal(data[8:16]), [1e4]*4]
-                        continue
-                    elif length < 16: # Second packet of calibration data
-                        self.calibration[2] = cal(data[0:8])
-                        self.calibration_requested = False
-                        return self.on_calibrated()
-            elif input_type == EXTENSION_8BYTES:
-                # Handler for Button and Mass data
-                # logger.debug("[EXTENSION] EXTENSION_8BYTES")
-                if (not self.calibrated):   # If not calibrated, ignore
-                    logger.info("Not calibrated, ignoring data")
-                    continue
-
-                buttonRes = self.check_button(data[2:4])
-                if buttonRes is not None:   # If there is a button event
-                    return buttonRes
-
-                massVal = self.get_mass(data[4:12])
-                return self.on_mass(massVal)
-
-    def check_button(self, state):
-        if len(state) < 2:	# If the button data is empty, ignore it
-            return None
-            
-        state_parsed = [state[i] for i in range(len(state))]
-        # logger.debug(f"Button state parsed: {state_parsed}")
-        # Only the second byte of the state is the button state
-        btn_state = state_parsed[1]
+            response = self.handle_packet(self.packet, length)
+            if response is not None:
+                self.samples.put(response)
+        if self.reader is me:
+            self.reader = None
+
+    def reader_stats(self):
+        '''
+        Returns the sample ring buffer counters
+        '''
+        return {
+            'pending': len(self.samples),
+            'received': self.samples.head,
+            'overwritten': self.samples.overwritten,
+            'dropped': self.samples.dropped,
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'sample_age_ms': self.sample_age_ms,
+            'timeouts': self.timeouts,
+            'commands': self.commands.stats(),
+        }
+
+    def report_stats(self):
+        '''
+        Returns the rate and spacing the board actually sends mass reports at
+        (see ReportStats), to match the task periods to it
+        '''
+        return self.report.stats()
+
+    def check_button(self, btn_state):
         if btn_state == BUTTON_DOWN_MASK:
             if not self.button_down:
                 self.button_down = True
@@ -339,19 +1048,18 @@ class WiiBoard():
         return None
         
 
-    def get_mass(self, data):
-        logger.debug(f"[Get_Mass] data: {data} {len(data)}")
-        # mass_data = [data[i] for i in range(len(data))]
-        # logger.debug(f"[Get_Mass] mass_data: {mass_data}")
-        if len(data) < 8:	# Data packet is not valid, so return empty packet
+    def get_mass(self, data, offset=0):
+        if len(data) - offset < 8:	# Data packet is not valid, so return empty packet
             return None
-        
-        return  {
-            'top_right':    self.calc_mass(data[0:2], TOP_RIGHT),
-            'bottom_right': self.calc_mass(data[2:4], BOTTOM_RIGHT),
-            'top_left':     self.calc_mass(data[4:6], TOP_LEFT),
-            'bottom_left':  self.calc_mass(data[6:8], BOTTOM_LEFT),
-        }
+
+        top_right, bottom_right, top_left, bottom_left = MASS_FORMAT.unpack_from(data, offset)
+        table = self.calibration_table
+        return MassSample(
+            decode_mass(top_right, table[TOP_RIGHT]),
+            decode_mass(bottom_right, table[BOTTOM_RIGHT]),
+            decode_mass(top_left, table[TOP_LEFT]),
+            decode_mass(bottom_left, table[BOTTOM_LEFT]),
+        )
 
     # Auxiliary functions
     def calc_mass(self, raw, pos):
@@ -367,40 +1075,51 @@ class WiiBoard():
         Returns:
             mass: mass read by the sensor
         '''
-        # logger.debug(f"[Calc_Mass]raw: {raw} rawType {type(raw)}")
-
-        # convert raw data (bytes) to int
-        parsed_mass_aux = raw[0:2]
-        # logger.debug(f"parsed_mass_aux {parsed_mass_aux}")
+        return decode_mass(int.from_bytes(raw[0:2], byteorder='big'), self.calibration_table[pos])
 
-        parsed_mass = int.from_bytes(parsed_mass_aux, byteorder='big')
-        # logger.debug(f"[Calc_Mass] parsed_mass: {parsed_mass}")
+    def build_calibration_table(self):
+        '''
+        Convert the calibration blocks to integers, once per calibration
 
-        # Check the hexadecimal value of raw data (2 int format)
-        # parsed_mass_split = [parsed_mass_aux[i] for i in range(len(parsed_mass_aux))]
-        # logger.debug(f"[Calc_Mass] parsed_mass_split: {parsed_mass_split}")
-        
-        # Convert Calibration data to int and extract the data from a specific pos
-        calibration = [ int.from_bytes( [self.calibration[i][pos][j] for j in range(len(self.calibration[i][pos])) ], byteorder="big") for i in range(len(self.calibration)) ]
-        # logger.debug(f"[Calc_Mass] Calibration: {calibration}")
-        
-        # Calculates the Kilogram weight reading from raw data at position pos
+        Returns:
+            table: list[4] of (0kg, 17kg, 0-17kg span, 17-34kg span) per sensor position
+        '''
         # calibration[0] is calibration values for 0kg
         # calibration[1] is calibration values for 17kg
-        # calibration[2] is calibratioposition of the sensorn values for 34kg
-        if parsed_mass < calibration[0]:
-            return 0.0
-        elif parsed_mass < calibration[1]:
-            return 17 * ((parsed_mass - calibration[0]) /
-                         float((calibration[1] -
-                                calibration[0])))
-        else: # if parsed_mass >= calibration[1]:
-            return 17 + 17 * ((parsed_mass - calibration[1]) /
-                              float((calibration[2] -
-                                     calibration[1])))
+        # calibration[2] is calibration values for 34kg
+        table = []
+        for pos in range(4):
+            c0, c1, c2 = [int.from_bytes(self.calibration[i][pos], byteorder="big") for i in range(3)]
+            table.append((c0, c1, float(c1 - c0), float(c2 - c1)))
+        return table
 
+    def decode_masses(self, packets):
+        '''
+        Calculate the mass of many EXTENSION_8BYTES packets at once (needs numpy)
+
+        Parameters:
+            packets: array-like of uint8, shape (N, >= 12)
+                raw packets, as received from the board
+
+        Returns:
+            masses: float array, shape (N, 4), in TOP_RIGHT, BOTTOM_RIGHT, TOP_LEFT, BOTTOM_LEFT order
+        '''
+        if np is None:
+            raise RuntimeError("Batch decoding needs numpy")
+        raw = np.asarray(packets, dtype=np.uint8)[:, 4:12].reshape(-1, 4, 2)
+        values = raw[:, :, 0].astype(np.int64) * 256 + raw[:, :, 1]
+        c0, c1, span0, span1 = np.array(self.calibration_table).T
+        c0 = c0.astype(np.int64)
+        c1 = c1.astype(np.int64)
+        # Same expressions as decode_mass, so the results are identical
+        low = 17 * ((values - c0) / span0)
+        high = 17 + 17 * ((values - c1) / span1)
+        return np.where(values < c0, 0.0, np.where(values < c1, low, high))
 
     def on_status(self):
+        # The status report tells the LED state, and resets the reporting mode
+        self.commands.update(COMMAND_LIGHT, b'\x10' if self.light_state else b'\x00')
+        self.commands.update(COMMAND_REPORTING, None)
         self.reporting() # Must set the reporting type after every status report
         logger.info("Status: battery: %.2f%% light: %s", self.battery*100.0, 'on' if self.light_state else 'off')
         self.light(1)
@@ -413,6 +1132,13 @@ class WiiBoard():
 
     def on_calibrated(self):
         logger.info("Board calibrated: %s", str(self.calibration))
+        table = self.build_calibration_table()
+        if self.calibration_cached and table != self.calibration_table:
+            logger.warning("Calibration of %s changed, replacing the cached one", self.board_address)
+            self.calibration_changes += 1
+        if not self.calibration_cached or table != self.calibration_table:
+            self.save_calibration()
+        self.calibration_table = table
         self.light(1)
         self.calibrated = True
         return self.build_response(ResponseType.CALIBRATION, self.calibration)
@@ -420,16 +1146,38 @@ class WiiBoard():
         if mass is None:
             return None
         
-        logger.debug("New mass data: %s", str(mass))
-        return self.build_response(ResponseType.MASS, mass)
+        mass.timestamp = self.received_ns
+        mass.seq = self.seq
+        self.seq += 1
+        self.report.record(self.received_ns, (mass.top_right, mass.bottom_right, mass.top_left, mass.bottom_left))
+        if not self.first_sample:
+            self.first_sample = True
+            elapsed = (time.monotonic_ns() - self.attached_at) / 1e6
+            self.first_sample_ms = self.first_sample_ms[-99:] + [elapsed]
+        logger.debug("New mass data: %s", mass)
+        return mass
     def on_pressed(self):
         logger.info("Button pressed")
         return self.build_response(ResponseType.BUTTON, True)
     def on_released(self):
         logger.info("Button released")
         return self.build_response(ResponseType.BUTTON, False)
+    def disconnect(self):
+        self.commands.stop()
+        if self.receiveSocket: self.receiveSocket = self.receiveSocket.close()
+        if self.controlSocket: self.controlSocket = self.controlSocket.close()
+        if self.connected:
+            self.disconnected_at = time.monotonic_ns()
+        self.connected = False
+        self.state = ConnectState.DISCONNECTED
     def close(self):
-        self.running = False
+        with self.connectLock:
+            self.closed = True
+            self.running = False
+        self.reconnectEvent.set()
+        self.stop_reader()
+        self.commands.stop()
+        if self.recorder: self.recorder.close()
         if self.receiveSocket: self.receiveSocket.close()
         if self.controlSocket: self.controlSocket.close()
     def __del__(self):
@@ -442,8 +1190,11 @@ class WiiBoard():
         return not exc_type # re-raise exception if any
 
     def send(self, *data):
+        '''
+        Queue a command for the writer thread, it never blocks
+        '''
         # print("Arg:", data)
-        self.controlSocket.send(b'\x52'+b''.join(data))
+        self.commands.put(data[0], b''.join(data[1:]))
     def reporting(self, mode=CONTINUOUS_REPORTING, extension=EXTENSION_8BYTES):
         byteExtension = struct.pack("B", extension)
         # print("byteExtension:", byteExtension)
@@ -454,10 +1205,35 @@ class WiiBoard():
         self.send(COMMAND_REQUEST_STATUS, b'\x00')
 
     def build_response(self, type, data):
-        return {
-            'type': type,
-            'data': data
-        }
+        return Response(type, data, self.received_ns)
     
 
+def find_boards(duration=3, prefix=BLUETOOTH_NAME):
+    '''
+    Scan for Bluetooth devices and return the addresses of every WiiBoard found
+    '''
+    if bluetooth is None:
+        raise RuntimeError("Discovering the WiiBoard needs the python-bluez package")
+    logger.info("Scan Bluetooth devices for %i seconds...", duration)
+    devices = bluetooth.discover_devices(duration=duration, lookup_names=True)	# Returns [] if it doesn't find any
+    logger.debug("Discover devices finished.")
+    logger.debug("Found devices: %s", str(devices))
+    return [address for address, name in devices if name.startswith(prefix)]
+
+def l2cap_socket():
+    return socket.socket(socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_L2CAP)
+
+def decode_mass(value, calibration):
+    '''
+    Calculates the Kilogram weight of a raw sensor value, with the piecewise
+    0/17/34kg interpolation of the calibration table entry of the sensor
+    '''
+    c0, c1, span0, span1 = calibration
+    if value < c0:
+        return 0.0
+    elif value < c1:
+        return 17 * ((value - c0) / span0)
+    else:
+        return 17 + 17 * ((value - c1) / span1)
+
 # Wii Balance Board Docs -> https://wiibrew.org/wiki/Wii_Balance_Board
\ No newline at end of file
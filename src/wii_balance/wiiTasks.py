@@ -17,8 +17,8 @@ while 1:
     # Read the board
     response = wiiBoard.read_data()
     if (response != None):
-        respType = response["type"]
-        data = response["data"]
+        respType = response.type
+        data = response.data
         print("Response type:", respType)
         if respType == ResponseType.STATUS:
             logger.info(f"{respType} - {data}")
@@ -30,3 +30,4 @@ while 1:
         logger.info("No Response")
 
 # Possible TODO: Check if we can change the frequency that the mass data is sent
+# wiiBoard.report_stats() measures the rate it is sent at now